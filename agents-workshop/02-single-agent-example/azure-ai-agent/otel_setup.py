@@ -1,5 +1,7 @@
 # Copyright (c) Microsoft. All rights reserved.
 
+import functools
+import inspect
 import logging
 import os
 
@@ -111,6 +113,9 @@ def set_up_tracing():
     # Sets the global default tracer provider
     set_tracer_provider(tracer_provider)
 
+    global _tracing_enabled
+    _tracing_enabled = bool(exporters)
+
 
 def set_up_metrics():
     exporters = []
@@ -147,9 +152,80 @@ def setup_otel():
     set_up_metrics()
 
 
-def get_span(name: str):
-    """Get a span with the given name."""
-    tracer = trace.get_tracer(__name__)
-    current_span = tracer.start_as_current_span(name)
-    # print(f"Trace ID: {format_trace_id(current_span.get_span_context().trace_id)}")
-    return current_span
+# Tracer shared by all helpers; resolved once instead of on every get_span call.
+# Before a tracer provider is set this is a proxy that picks the provider up later.
+_tracer: trace.Tracer | None = None
+# Set by set_up_tracing; spans are not created when nothing would export them
+_tracing_enabled = False
+
+
+class _NonRecordingSpanContext:
+    """Reusable context manager standing in for a span that would not be recorded."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> trace.Span:
+        return trace.INVALID_SPAN
+
+    def __exit__(self, *exc_info) -> bool:
+        return False
+
+
+_NON_RECORDING_SPAN = _NonRecordingSpanContext()
+
+
+def get_tracer() -> trace.Tracer:
+    """Get the cached module tracer."""
+    global _tracer
+    if _tracer is None:
+        _tracer = trace.get_tracer(__name__)
+    return _tracer
+
+
+def _would_record() -> bool:
+    # Mirrors the parent-based sampler: a child of an unsampled span is always dropped
+    if not _tracing_enabled:
+        return False
+    parent = trace.get_current_span().get_span_context()
+    return not parent.is_valid or parent.trace_flags.sampled
+
+
+def get_span(name: str, attributes=None):
+    """
+    Get a context manager that starts a span with the given name as the current span.
+    When the span would not be recorded, a shared no-op context yielding a
+    non-recording span is returned instead, so no span or attribute dict is built.
+    Pass attributes that are expensive to compute via `span.set_attribute` after
+    checking `span.is_recording()`.
+    """
+    if not _would_record():
+        return _NON_RECORDING_SPAN
+    return get_tracer().start_as_current_span(name, attributes=attributes)
+
+
+def traced(name: str | None = None, attributes=None):
+    """
+    Decorator running a sync or async function inside `get_span`.
+    The attributes mapping is built once, at decoration time.
+    """
+
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with get_span(span_name, attributes):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_span(span_name, attributes):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,188 @@
+"""
+Concurrent fan-out of a query to several specialist agents.
+
+Sub-agents wired in as tools of a main agent are called by the service one after
+another, so a question spanning several specialists waits for the sum of their
+runs. `FanOutOrchestrator` sends the query to every specialist at once, each on
+its own thread, streams their partial answers as they arrive and merges the
+finished ones with a reducer. A branch that misses its deadline is dropped
+instead of holding up the answer.
+"""
+
+import asyncio
+import inspect
+import logging
+import os
+import time
+from typing import AsyncIterator, Awaitable, Callable, NamedTuple, Union
+
+from semantic_kernel.agents import AzureAIAgent, AzureAIAgentThread
+
+from otel_setup import get_span
+
+logger = logging.getLogger(f"workshop.agent.{__name__}")
+
+# Default time a specialist gets to answer before it is dropped
+FAN_OUT_DEADLINE_SECONDS = float(os.getenv("FAN_OUT_DEADLINE_SECONDS", "30"))
+
+
+class BranchDelta(NamedTuple):
+    """A streamed piece of a specialist's answer."""
+
+    agent: str
+    text: str
+
+
+class BranchResult(NamedTuple):
+    """The outcome of one specialist's branch."""
+
+    agent: str
+    status: str  # "ok", "timeout" or "error"
+    content: str  # the full answer, or what arrived before the branch was dropped
+    elapsed: float
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "ok"
+
+
+Reducer = Callable[[list[BranchResult]], Union[str, Awaitable[str]]]
+
+
+def join_sections(results: list[BranchResult]) -> str:
+    """Reducer listing each completed answer under its agent's name."""
+    sections = [f"## {r.agent}\n\n{r.content.strip()}" for r in results if r.ok]
+    return "\n\n".join(sections) or "None of the agents answered in time."
+
+
+def first_answer(results: list[BranchResult]) -> str:
+    """Reducer keeping the answer that completed first."""
+    completed = sorted((r for r in results if r.ok), key=lambda r: r.elapsed)
+    return completed[0].content if completed else "None of the agents answered in time."
+
+
+def synthesize_with(agent: AzureAIAgent) -> Reducer:
+    """Reducer asking `agent` to merge the completed answers into one."""
+
+    async def synthesize(results: list[BranchResult]) -> str:
+        completed = [r for r in results if r.ok]
+        if len(completed) < 2:
+            return join_sections(results)
+
+        answers = "\n\n".join(f"{r.agent}:\n{r.content.strip()}" for r in completed)
+        thread = AzureAIAgentThread(client=agent.client)
+        try:
+            response = await agent.get_response(
+                messages="Combine these answers from specialist agents into a "
+                f"single answer, resolving any overlap:\n\n{answers}",
+                thread=thread,
+            )
+            return str(response)
+        finally:
+            await thread.delete()
+
+    return synthesize
+
+
+class FanOutOrchestrator:
+    """Runs a query on several agents concurrently and merges their answers."""
+
+    def __init__(
+        self,
+        agents: list[AzureAIAgent],
+        reducer: Reducer = join_sections,
+        deadline_seconds: float = FAN_OUT_DEADLINE_SECONDS,
+        deadlines: dict[str, float] | None = None,
+    ):
+        self.agents = agents
+        self.reducer = reducer
+        self.deadline_seconds = deadline_seconds
+        # Per-agent deadlines, by agent name, overriding `deadline_seconds`
+        self.deadlines = deadlines or {}
+
+    async def stream(
+        self, query: str
+    ) -> AsyncIterator[Union[BranchDelta, BranchResult]]:
+        """
+        Yield each specialist's answer as `BranchDelta`s while it streams in, and a
+        `BranchResult` when its branch completes, times out or fails.
+        """
+        events: asyncio.Queue = asyncio.Queue()
+        tasks = [
+            asyncio.create_task(self._run_branch(agent, query, events))
+            for agent in self.agents
+        ]
+        try:
+            pending = len(tasks)
+            while pending:
+                event = await events.get()
+                if isinstance(event, BranchResult):
+                    pending -= 1
+                yield event
+        finally:
+            # The consumer stopped early: do not leave branches running
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def run(
+        self,
+        query: str,
+        on_delta: Callable[[BranchDelta], None] | None = None,
+    ) -> str:
+        """Fan the query out, wait for every branch and return the merged answer."""
+        results: list[BranchResult] = []
+        async for event in self.stream(query):
+            if isinstance(event, BranchResult):
+                results.append(event)
+            elif on_delta:
+                on_delta(event)
+        return await self.merge(results)
+
+    async def merge(self, results: list[BranchResult]) -> str:
+        """Merge branch results with the reducer."""
+        with get_span("fan_out_merge") as span:
+            span.set_attribute("completed", sum(r.ok for r in results))
+            merged = self.reducer(results)
+            if inspect.isawaitable(merged):
+                merged = await merged
+            return merged
+
+    async def _run_branch(
+        self, agent: AzureAIAgent, query: str, events: asyncio.Queue
+    ) -> None:
+        deadline = self.deadlines.get(agent.name, self.deadline_seconds)
+        thread = AzureAIAgentThread(client=agent.client)
+        parts: list[str] = []
+        status = "ok"
+        started = time.perf_counter()
+        with get_span("fan_out_branch") as span:
+            span.set_attribute("agent_name", agent.name)
+            try:
+                async with asyncio.timeout(deadline):
+                    async for response in agent.invoke_stream(
+                        messages=query, thread=thread
+                    ):
+                        thread = response.thread
+                        text = str(response)
+                        if text:
+                            parts.append(text)
+                            events.put_nowait(BranchDelta(agent.name, text))
+            except TimeoutError:
+                status = "timeout"
+                logger.warning(
+                    f"Agent {agent.name} missed its {deadline}s deadline, dropping it"
+                )
+            except Exception as e:
+                status = "error"
+                logger.error(f"Agent {agent.name} failed: {e}")
+            finally:
+                elapsed = time.perf_counter() - started
+                span.set_attribute("status", status)
+                events.put_nowait(
+                    BranchResult(agent.name, status, "".join(parts), elapsed)
+                )
+                try:
+                    await thread.delete()
+                except Exception as e:
+                    logger.debug(f"Could not delete thread of {agent.name}: {e}")
@@ -16,6 +16,14 @@ from semantic_kernel.agents import (
 )
 from azure.ai.projects.aio import AIProjectClient
 from agent_factory import create_agent, create_project_client
+from context_window import ContextWindow
+from response_cache import (
+    agent_fingerprint,
+    is_per_user_function,
+    replay,
+    response_cache,
+)
+from agent_metrics import ActiveSession, RunMetrics, record_duration, upload_duration
 from otel_setup import get_span
 from semantic_kernel.filters import AutoFunctionInvocationContext, FilterTypes
 
@@ -34,10 +42,13 @@ from semantic_kernel.contents import (
 from azure.ai.agents.models import (
     # FileSearchTool,
     FilePurpose,
+    ListSortOrder,
+    MessageRole,
 )
 
 from kernel_factory import KernelFactory
 from semantic_kernel.functions import FunctionResult
+from thread_reaper import thread_reaper
 
 app_logger = logging.getLogger("workshop.agent")
 
@@ -49,12 +60,27 @@ class EnterpriseChat:
         agent: AzureAIAgent,
         thread: AzureAIAgentThread,
         kernel: Kernel,
+        state_key: str | None = None,
+        user_name: str | None = None,
     ):
         self.thread = thread
         self.agent = agent
         self.client = client
         self.kernel = kernel
         self.stack_token = ""
+        # Sent with every run rather than in the agent definition shared by all users
+        self.user_name = user_name
+        # Shared state entry holding the thread id, if any
+        self.state_key = state_key
+        thread_reaper.track(thread.id, state_key)
+        # Recent messages sent per run and the summary of the older ones
+        self.context = ContextWindow(thread.id)
+        # Identifies this agent's answers in the response cache
+        self.fingerprint = agent_fingerprint(agent)
+        # Counted in workshop.agent.active_sessions until closed
+        self.session = ActiveSession()
+        # Chat history shown in this browser session
+        self.conversation = Conversation()
         self.kernel.add_filter(
             FilterTypes.AUTO_FUNCTION_INVOCATION, self.auth_function_filter
         )
@@ -98,7 +124,36 @@ class EnterpriseChat:
         This is useful for clearing the conversation history.
         """
         new_thread = await self.client.agents.threads.create()
+        # Other tabs of the user may still use the old thread; the reaper of any
+        # replica deletes it once they are done with it
+        await thread_reaper.supersede(self.thread.id)
         self.thread = AzureAIAgentThread(client=self.client, thread_id=new_thread.id)
+        thread_reaper.track(new_thread.id, self.state_key)
+        self.context = ContextWindow(new_thread.id)
+
+    async def load_history(
+        self, cursor: str | None = None, limit: int = 20
+    ) -> tuple[list[dict], str | None]:
+        """
+        Load one page of the thread's messages, newest first from the service, and
+        return them oldest first with the cursor of the page before them.
+        The cursor is None when there are no earlier messages.
+        """
+        pages = self.client.agents.messages.list(
+            thread_id=self.thread.id, limit=limit, order=ListSortOrder.DESCENDING
+        ).by_page(continuation_token=cursor)
+        page = await anext(pages, None)
+        messages = [message async for message in page] if page else []
+
+        history = []
+        for message in reversed(messages):
+            text = "\n\n".join(content.text.value for content in message.text_messages)
+            if text:
+                role = "user" if message.role == "user" else "assistant"
+                history.append({"role": role, "content": text})
+
+        next_cursor = pages.continuation_token if len(messages) == limit else None
+        return history, next_cursor
 
     async def azure_enterprise_chat(
         self, user_message: dict, history: List[ChatMessage]
@@ -112,16 +167,20 @@ class EnterpriseChat:
         This function returns a list of ChatMessage objects directly (no dict conversion).
         Your Gradio Chatbot should be type="messages" to handle them properly.
         """
-        # Convert existing history from dict to ChatMessage
-        conversation = []
-        for msg_dict in history:
-            conversation.append(convert_dict_to_chatmessage(msg_dict))
+        thread_reaper.touch(self.thread.id)
+
+        # Reuse the session's messages; only those Gradio added since are converted
+        conversation = self.conversation.sync(history)
 
         # # Immediately yield two outputs to clear the textbox
         # yield conversation
 
         # Mappings for partial function calls
         in_progress_tools: Dict[str, ChatMessage] = {}
+        # Tools used by the run, which decide how long its answer may be cached
+        tools_used: set[str] = set()
+        # (plugin, function) of the kernel functions called by the run
+        kernel_calls: set[tuple[str, str]] = set()
 
         # Titles for tool bubbles
         function_titles = {
@@ -146,6 +205,9 @@ class EnterpriseChat:
             t_type = tcall.content_type
             function_name = tcall.function_name or tcall.name
             call_id = tcall.call_id or tcall.id
+            tools_used.update(filter(None, (function_name, tcall.plugin_name)))
+            if tcall.plugin_name and function_name:
+                kernel_calls.add((tcall.plugin_name, function_name))
 
             # --- BING GROUNDING ---
             if function_name == "bing_grounding":
@@ -164,6 +226,7 @@ class EnterpriseChat:
                     # If we already have a pending call, just update the content
                     pending_msg.metadata["log"] = json.dumps(response_metadata)
                     pending_msg.metadata["status"] = "done"
+                    run_metrics.tool_result(pending_msg.metadata.get("id", "tool-noid"))
                     # remove it from in_progress_tools
                     in_progress_tools.pop(
                         pending_msg.metadata.get("id", "tool-noid"), None
@@ -194,6 +257,7 @@ class EnterpriseChat:
                     },
                 )
                 conversation.append(msg_obj)
+                run_metrics.tool_call(msg_obj.metadata["id"], function_name)
                 if call_id:
                     in_progress_tools[call_id] = msg_obj
                 return
@@ -210,12 +274,14 @@ class EnterpriseChat:
                     },
                 )
                 conversation.append(msg_obj)
+                run_metrics.tool_call(msg_obj.metadata["id"], function_name)
                 if call_id:
                     in_progress_tools[call_id] = msg_obj
                 return
 
             elif t_type == "function_result":
                 in_progress_tools[call_id].metadata["status"] = "done"
+                run_metrics.tool_result(f"tool-{call_id}")
                 in_progress_tools.pop(call_id)
                 return
             # --- NON-FUNCTION CALLS ---
@@ -235,6 +301,7 @@ class EnterpriseChat:
                 },
             )
             conversation.append(msg_obj)
+            run_metrics.tool_call(f"tool-{call_id}", tcall.function_name)
             in_progress_tools[call_id] = msg_obj
 
         async def handle_streaming_intermediate_steps(step: ChatMessageContent):
@@ -260,9 +327,10 @@ class EnterpriseChat:
         if user_message["files"]:
             file_path: str
             for file_path in user_message["files"]:
-                uploaded = await self.client.agents.files.upload_and_poll(
-                    file_path=file_path, purpose=FilePurpose.AGENTS
-                )
+                with record_duration(upload_duration):
+                    uploaded = await self.client.agents.files.upload_and_poll(
+                        file_path=file_path, purpose=FilePurpose.AGENTS
+                    )
                 # todo = specify tools for the attachment
                 # attachment = MessageAttachment(file_id=uploaded.id, tools=CodeInterpreterTool().definitions + FileSearchTool().definitions)
 
@@ -310,146 +378,217 @@ class EnterpriseChat:
                 )
                 break  # only handle the first file for now
 
-        # -- EVENT STREAMING --
-        first_chunk = True
-        async for response in self.agent.invoke_stream(
-            messages=message,
-            thread=self.thread,
-            on_intermediate_message=handle_streaming_intermediate_steps,
-        ):
-            if first_chunk:
-                print(f"# {response.name}: ", end="", flush=True)
-                first_chunk = False
-            print(f"{response}", end="", flush=True)
-            self.thread = response.thread
-
-            # with project_client.agents.create_stream(
-            #     thread_id=thread.id,
-            #     assistant_id=agent_id,
-            #     event_handler=MyEventHandler()  # the event handler handles console output
-            # ) as stream:
-            msg_id = uuid.uuid4().hex
-            for item in response.items:
-                event_type, event_data, *_ = item
-
-                if (
-                    not isinstance(item, StreamingTextContent)
-                    and not isinstance(item, StreamingFileReferenceContent)
-                    and not isinstance(item, StreamingAnnotationContent)
+        # Only the first question of a conversation stands on its own
+        question = user_message["text"] or ""
+        cacheable = (
+            response_cache.enabled
+            and question.strip()
+            and not user_message["files"]
+            and sum(msg.role == "user" for msg in conversation) == 1
+        )
+        if cacheable:
+            answer = await response_cache.get(question, self.fingerprint)
+            if answer is not None:
+                async for step in self.replay_cached_answer(
+                    question, answer, conversation
                 ):
-                    app_logger.warning(f"Unknown item in response: {item}")
+                    yield step
+                return
+        replies_start = len(conversation)
 
-                if isinstance(item, FunctionResultContent):
-                    # this result is never returned - it's handled in on_intermediate_message
-                    app_logger.info(
-                        f"Function Result:> {item.result} for function: {item.name}"
-                    )
-                elif isinstance(item, FunctionCallContent):
-                    # this result is never returned - it's handled in on_intermediate_message
-                    app_logger.info(
-                        f"Function Call:> {item.name} with arguments: {item.arguments}"
-                    )
-                elif isinstance(item, StreamingAnnotationContent):
-                    # Handle streaming annotations
-                    if conversation and conversation[-1].role == "assistant":
-                        last_msg = conversation[-1]
-
-                    if not last_msg:
-                        break
-
-                    if last_msg.content.endswith("】"):
-                        start_index = last_msg.content.rfind("【")
-                        # replace with markdown link
-                        last_msg.content = (
-                            last_msg.content[:start_index]
-                            + f"【[{item.title}]({item.url})】"
+        # -- EVENT STREAMING --
+        # Time to first token, run duration and tool calls of this run
+        run_metrics = RunMetrics(self.agent.name)
+        # Window truncation and the summary of earlier messages, if enabled
+        run_options = await self.context.run_options()
+        if self.user_name:
+            run_options["additional_instructions"] = "\n\n".join(
+                filter(
+                    None,
+                    [
+                        f"The user you're assisting is {self.user_name}.",
+                        run_options.get("additional_instructions"),
+                    ],
+                )
+            )
+        with run_metrics:
+            first_chunk = True
+            async for response in self.agent.invoke_stream(
+                messages=message,
+                thread=self.thread,
+                on_intermediate_message=handle_streaming_intermediate_steps,
+                **run_options,
+            ):
+                if first_chunk:
+                    print(f"# {response.name}: ", end="", flush=True)
+                    first_chunk = False
+                print(f"{response}", end="", flush=True)
+                self.thread = response.thread
+
+                # with project_client.agents.create_stream(
+                #     thread_id=thread.id,
+                #     assistant_id=agent_id,
+                #     event_handler=MyEventHandler()  # the event handler handles console output
+                # ) as stream:
+                msg_id = uuid.uuid4().hex
+                for item in response.items:
+                    event_type, event_data, *_ = item
+
+                    if (
+                        not isinstance(item, StreamingTextContent)
+                        and not isinstance(item, StreamingFileReferenceContent)
+                        and not isinstance(item, StreamingAnnotationContent)
+                    ):
+                        app_logger.warning(f"Unknown item in response: {item}")
+
+                    if isinstance(item, FunctionResultContent):
+                        # this result is never returned - it's handled in on_intermediate_message
+                        app_logger.info(
+                            f"Function Result:> {item.result} for function: {item.name}"
                         )
+                    elif isinstance(item, FunctionCallContent):
+                        # this result is never returned - it's handled in on_intermediate_message
+                        app_logger.info(
+                            f"Function Call:> {item.name} with arguments: {item.arguments}"
+                        )
+                    elif isinstance(item, StreamingAnnotationContent):
+                        # Handle streaming annotations
+                        if conversation and conversation[-1].role == "assistant":
+                            last_msg = conversation[-1]
 
-                elif isinstance(item, StreamingChatMessageContent):
-                    # This is never returned
-                    if item.items:
-                        for msg_item in item.items:
-                            if isinstance(msg_item, ChatMessageContent):
-                                print(f"Chat Message:> {msg_item.content}")
-                            else:
-                                print(f"Unknown item in chat message: {msg_item}")
-                elif isinstance(item, StreamingFileReferenceContent):
-                    # This is never returned
-                    # Download the file reference
-                    file_info = await self.client.agents.files.get(file_id=item.file_id)
-                    app_logger.info(
-                        f"Downloading file: {file_info.name} ({file_info.size} bytes)"
-                    )
-                    file_bytes = bytearray()
-                    data = await self.client.agents.files.get_content(
-                        file_id=item.file_id
-                    )
-                    async for byte in data:
-                        file_bytes.extend(byte)
-
-                    # Append the file reference to the conversation
-                    # Convert bytes to numpy array for gr.Image
-                    image = Image.open(io.BytesIO(file_bytes))
-                    image_np = np.array(image)
-                    conversation.append(
-                        ChatMessage(role="assistant", content=gr.Image(image_np))
-                    )
-
-                elif isinstance(item, StreamingTextContent):
-                    # Handle streaming text content
-                    agent_msg = item.text or ""
-                    message_id = msg_id
-
-                    # Try to find a matching assistant bubble
-                    matching_msg = None
-                    for msg in reversed(conversation):
-                        if (
-                            msg.metadata
-                            and msg.metadata.get("id") == message_id
-                            and msg.role == "assistant"
-                        ):
-                            matching_msg = msg
+                        if not last_msg:
                             break
 
-                    if matching_msg:
-                        # Append newly streamed text
-                        matching_msg.content += agent_msg
-                    else:
-                        # Append to last assistant or create new
-                        if (
-                            not conversation
-                            or conversation[-1].role != "assistant"
-                            or (
-                                conversation[-1].metadata
-                                and str(
-                                    conversation[-1].metadata.get("id", "")
-                                ).startswith("tool-")
+                        if last_msg.content.endswith("】"):
+                            start_index = last_msg.content.rfind("【")
+                            # replace with markdown link
+                            last_msg.content = (
+                                last_msg.content[:start_index]
+                                + f"【[{item.title}]({item.url})】"
                             )
-                            or not isinstance(conversation[-1].content, str)
-                        ):
-                            conversation.append(
-                                ChatMessage(role="assistant", content=agent_msg)
-                            )
-                        else:
-                            matching_msg = conversation[-1]
-                            matching_msg.content += agent_msg
 
-                    yield conversation
-                elif isinstance(item, TextContent):
-                    # Handle regular text content
-                    if item.text:
+                    elif isinstance(item, StreamingChatMessageContent):
+                        # This is never returned
+                        if item.items:
+                            for msg_item in item.items:
+                                if isinstance(msg_item, ChatMessageContent):
+                                    print(f"Chat Message:> {msg_item.content}")
+                                else:
+                                    print(f"Unknown item in chat message: {msg_item}")
+                    elif isinstance(item, StreamingFileReferenceContent):
+                        # This is never returned
+                        # Download the file reference
+                        file_info = await self.client.agents.files.get(
+                            file_id=item.file_id
+                        )
+                        app_logger.info(
+                            f"Downloading file: {file_info.name} ({file_info.size} bytes)"
+                        )
+                        file_bytes = bytearray()
+                        data = await self.client.agents.files.get_content(
+                            file_id=item.file_id
+                        )
+                        async for byte in data:
+                            file_bytes.extend(byte)
+
+                        # Append the file reference to the conversation
+                        # Convert bytes to numpy array for gr.Image
+                        image = Image.open(io.BytesIO(file_bytes))
+                        image_np = np.array(image)
                         conversation.append(
-                            ChatMessage(role="assistant", content=item.text)
+                            ChatMessage(role="assistant", content=gr.Image(image_np))
                         )
-                        yield conversation
-                else:
-                    print(f"{item}")
 
-                # Remove any None items that might have been appended
-                conversation = [m for m in conversation if m is not None]
+                    elif isinstance(item, StreamingTextContent):
+                        # Handle streaming text content
+                        run_metrics.chunk()
+                        agent_msg = item.text or ""
+                        message_id = msg_id
+
+                        # Try to find a matching assistant bubble
+                        matching_msg = None
+                        for msg in reversed(conversation):
+                            if (
+                                msg.metadata
+                                and msg.metadata.get("id") == message_id
+                                and msg.role == "assistant"
+                            ):
+                                matching_msg = msg
+                                break
+
+                        if matching_msg:
+                            # Append newly streamed text
+                            matching_msg.content += agent_msg
+                        else:
+                            # Append to last assistant or create new
+                            if (
+                                not conversation
+                                or conversation[-1].role != "assistant"
+                                or (
+                                    conversation[-1].metadata
+                                    and str(
+                                        conversation[-1].metadata.get("id", "")
+                                    ).startswith("tool-")
+                                )
+                                or not isinstance(conversation[-1].content, str)
+                            ):
+                                conversation.append(
+                                    ChatMessage(role="assistant", content=agent_msg)
+                                )
+                            else:
+                                matching_msg = conversation[-1]
+                                matching_msg.content += agent_msg
 
+                        yield conversation
+                    elif isinstance(item, TextContent):
+                        # Handle regular text content
+                        if item.text:
+                            conversation.append(
+                                ChatMessage(role="assistant", content=item.text)
+                            )
+                            yield conversation
+                    else:
+                        print(f"{item}")
+
+        # Token usage of the run and the summary update, off the response path
+        self.context.after_run(self.client, self.agent.name)
+        if cacheable:
+            replies = conversation[replies_start:]
+            # Tool bubbles are not part of the answer; images are not cached
+            if all(isinstance(msg.content, str) for msg in replies):
+                answer = "\n\n".join(
+                    msg.content
+                    for msg in replies
+                    if not (msg.metadata or {}).get("title")
+                )
+                # Answers built on one user's data must not reach other users
+                per_user = bool(self.user_name and self.user_name in answer) or any(
+                    is_per_user_function(self.kernel, *call) for call in kernel_calls
+                )
+                await response_cache.set(
+                    question, self.fingerprint, answer, tools_used, per_user=per_user
+                )
         yield conversation
 
+    async def replay_cached_answer(
+        self, question: str, answer: str, conversation: List[ChatMessage]
+    ):
+        """
+        Stream a cached answer into the conversation, then add the question and
+        the answer to the thread so later runs see them.
+        """
+        reply = ChatMessage(role="assistant", content="")
+        conversation.append(reply)
+        async for chunk in replay(answer):
+            reply.content += chunk
+            yield conversation
+        await self.client.agents.messages.create(
+            thread_id=self.thread.id, role=MessageRole.USER, content=question
+        )
+        await self.client.agents.messages.create(
+            thread_id=self.thread.id, role=MessageRole.AGENT, content=answer
+        )
+
 
 # Implement the Main Chat Functions
 def extract_bing_query(request_url: str) -> str:
@@ -474,16 +613,79 @@ def convert_dict_to_chatmessage(msg: dict) -> ChatMessage:
     )
 
 
+def _same_message(message: ChatMessage, msg: dict | ChatMessage) -> bool:
+    if isinstance(msg, ChatMessage):
+        return message is msg or (
+            message.role == msg.role and message.content == msg.content
+        )
+    return message.role == msg["role"] and message.content == msg["content"]
+
+
+class Conversation:
+    """
+    The canonical chat history of a session, as the ChatMessage objects Gradio
+    renders. Gradio sends the whole history back on every turn; `sync` keeps the
+    messages already held and converts only the ones appended since, so a turn
+    costs O(new messages) instead of O(history).
+    """
+
+    __slots__ = ("messages",)
+
+    def __init__(self):
+        self.messages: list[ChatMessage] = []
+
+    def sync(self, history: list[dict | ChatMessage]) -> list[ChatMessage]:
+        """Bring the messages in line with Gradio's history and return them."""
+        held = len(self.messages)
+        if held > len(history) or (
+            held
+            and not (
+                _same_message(self.messages[0], history[0])
+                and _same_message(self.messages[-1], history[held - 1])
+            )
+        ):
+            # Cleared, replaced or extended with earlier messages: convert it all
+            self.messages = [
+                (
+                    msg
+                    if isinstance(msg, ChatMessage)
+                    else convert_dict_to_chatmessage(msg)
+                )
+                for msg in history
+            ]
+        else:
+            self.messages.extend(
+                (
+                    msg
+                    if isinstance(msg, ChatMessage)
+                    else convert_dict_to_chatmessage(msg)
+                )
+                for msg in history[held:]
+            )
+        return self.messages
+
+
 async def create_enterprise_chat(
-    agent_name: str, agent_instructions: str
+    agent_name: str,
+    agent_instructions: str,
+    user_id: str | None = None,
+    thread_id: str | None = None,
+    state_key: str | None = None,
 ) -> EnterpriseChat:
     """
     Factory function to create an EnterpriseChat instance.
+    The user_id scopes memoized per-user tool results and is named to the agent
+    in the instructions of each run. Pass the thread_id of an
+    existing thread to continue its conversation instead of starting a new one,
+    and the state_key of the shared state entry that holds the thread id.
     """
-    kernel = KernelFactory.create_kernel()
+    kernel = KernelFactory.create_kernel(cache_scope=user_id)
     client, creds = create_project_client()
     agent = await create_agent(agent_name, agent_instructions, client, kernel)
-    agent_thread = await client.agents.threads.create()
-    thread = AzureAIAgentThread(client=client, thread_id=agent_thread.id)
+    if not thread_id:
+        thread_id = (await client.agents.threads.create()).id
+    thread = AzureAIAgentThread(client=client, thread_id=thread_id)
 
-    return EnterpriseChat(client, agent, thread, kernel)
+    return EnterpriseChat(
+        client, agent, thread, kernel, state_key=state_key, user_name=user_id
+    )
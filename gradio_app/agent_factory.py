@@ -5,10 +5,11 @@ Application Insights connection string can be added via environment variable: AP
 
 import asyncio
 from datetime import date
+import hashlib
 import json
 import logging
 import os
-from azure.identity.aio import DefaultAzureCredential
+from azure.identity.aio import DefaultAzureCredential, get_bearer_token_provider
 from azure.ai.projects.aio import AIProjectClient
 from semantic_kernel import Kernel
 from semantic_kernel.agents import (
@@ -22,6 +23,7 @@ from semantic_kernel.connectors.ai.prompt_execution_settings import (
 from semantic_kernel.connectors.ai import FunctionChoiceBehavior
 from semantic_kernel.functions import KernelArguments
 from azure.ai.agents.models import (
+    Agent,
     BingGroundingTool,
     CodeInterpreterTool,
     # FileSearchTool,
@@ -35,9 +37,11 @@ from azure.ai.agents.models import (
 from dotenv import load_dotenv
 
 from otel_setup import setup_otel
+from state_store import get_state_store
 
 from simple_tool import SimpleTool
 from stack_overflow_tool import StackOverflowTool
+from tool_concurrency import offload_sync_functions
 
 # Load environment variables from .env file at the start of your script
 load_dotenv()
@@ -53,9 +57,33 @@ console_handler.setFormatter(formatter)
 app_logger = logging.getLogger("workshop.agent")
 app_logger.addHandler(console_handler)
 
+# How long workers reuse a shared agent definition before checking the service again
+AGENT_DEFINITION_TTL = int(os.getenv("AGENT_DEFINITION_TTL_SECONDS", "600"))
+
 
 def create_project_client() -> tuple[AIProjectClient, DefaultAzureCredential]:
-    """Create an AIProjectClient instance."""
+    """
+    Create an AIProjectClient instance.
+    When AGENT_SERVICE_EMULATOR_URL is set, the client talks to the local emulator
+    (see agent_service_emulator.py) instead of Azure AI Foundry.
+    """
+
+    emulator_url = os.environ.get("AGENT_SERVICE_EMULATOR_URL")
+    if emulator_url:
+        # Imported only for emulator runs: it pulls in uvicorn
+        from agent_service_emulator import (
+            EmulatorCredential,
+            emulator_client_kwargs,
+            emulator_endpoint,
+        )
+
+        creds = EmulatorCredential()
+        client = AzureAIAgent.create_client(
+            credential=creds,
+            endpoint=emulator_endpoint(emulator_url),
+            **emulator_client_kwargs(),
+        )
+        return client, creds
 
     endpoint = os.environ.get("AZURE_AI_FOUNDRY_CONNECTION_STRING")
     deployment_name = os.environ.get("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME")
@@ -76,6 +104,27 @@ def create_project_client() -> tuple[AIProjectClient, DefaultAzureCredential]:
     return client, creds
 
 
+def azure_openai_credentials() -> dict:
+    """
+    Endpoint and credentials of the Azure OpenAI resource (AZURE_OPENAI_ENDPOINT), as
+    keyword arguments of the Semantic Kernel Azure OpenAI services. Uses
+    AZURE_OPENAI_API_KEY when set, otherwise Entra ID through DefaultAzureCredential.
+    """
+    api_key = os.environ.get("AZURE_OPENAI_API_KEY")
+    return {
+        "endpoint": os.environ.get("AZURE_OPENAI_ENDPOINT"),
+        "api_version": os.environ.get("AZURE_OPENAI_API_VERSION", None),
+        "api_key": api_key,
+        "ad_token_provider": (
+            None
+            if api_key
+            else get_bearer_token_provider(
+                DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default"
+            )
+        ),
+    }
+
+
 async def setup_tools(
     client: AIProjectClient, file_attachment_path: str = None
 ) -> tuple[list[ToolDefinition], ToolResources]:
@@ -126,24 +175,20 @@ async def setup_tools(
     return tool_definitions, tool_resources
 
 
-async def create_agent(
-    agent_name: str, agent_instructions: str, client: AIProjectClient, kernel: Kernel
-) -> AzureAIAgent:
-    endpoint = os.environ.get("AZURE_AI_FOUNDRY_CONNECTION_STRING")
-    deployment_name = os.environ.get("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME")
-    api_version = os.environ.get("AZURE_OPENAI_API_VERSION", None)
-
-    ai_agent_settings = AzureAIAgentSettings(
-        endpoint=endpoint,
-        model_deployment_name=deployment_name,
-        api_version=api_version,
-    )
-
+async def create_or_update_agent_definition(
+    agent_name: str,
+    agent_instructions: str,
+    model: str,
+    client: AIProjectClient,
+    tool_definitions: list[ToolDefinition],
+    tool_resources: ToolResources,
+) -> Agent:
     existing_agent = None
 
     # Find agent by name
-    async for existing_agent in client.agents.list_agents():
-        if existing_agent.name == agent_name:
+    async for agent in client.agents.list_agents():
+        if agent.name == agent_name:
+            existing_agent = agent
             app_logger.info(
                 f"Found existing agent: {existing_agent.name} - {existing_agent.id}"
             )
@@ -152,32 +197,81 @@ async def create_agent(
     # async for connection in client.connections.list():
     #     app_logger.info(f"Connection: {connection.name} - {connection.id}")
 
-    tool_definitions, tool_resources = await setup_tools(client)
-
     # Create an agent on the Azure AI agent service
     if existing_agent:
         app_logger.info(
             f"Using existing agent: {existing_agent.name} - {existing_agent.id}"
         )
-        agent_definition = await client.agents.update_agent(
+        return await client.agents.update_agent(
             agent_id=existing_agent.id,
-            model=ai_agent_settings.model_deployment_name,
-            name=agent_name,
-            instructions=agent_instructions,
-            tools=tool_definitions,
-            tool_resources=tool_resources,
-        )
-    else:
-        app_logger.info(f"Creating new agent: {agent_name}")
-        # Create a new agent if it does not exist
-        agent_definition = await client.agents.create_agent(
-            model=ai_agent_settings.model_deployment_name,
+            model=model,
             name=agent_name,
             instructions=agent_instructions,
             tools=tool_definitions,
             tool_resources=tool_resources,
         )
 
+    app_logger.info(f"Creating new agent: {agent_name}")
+    # Create a new agent if it does not exist
+    return await client.agents.create_agent(
+        model=model,
+        name=agent_name,
+        instructions=agent_instructions,
+        tools=tool_definitions,
+        tool_resources=tool_resources,
+    )
+
+
+async def create_agent(
+    agent_name: str, agent_instructions: str, client: AIProjectClient, kernel: Kernel
+) -> AzureAIAgent:
+    endpoint = os.environ.get("AZURE_AI_FOUNDRY_CONNECTION_STRING")
+    deployment_name = os.environ.get("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME")
+    api_version = os.environ.get("AZURE_OPENAI_API_VERSION", None)
+
+    ai_agent_settings = AzureAIAgentSettings(
+        endpoint=endpoint,
+        model_deployment_name=deployment_name,
+        api_version=api_version,
+    )
+
+    # Workers share the agent definition, so an unchanged agent is neither looked up
+    # nor updated again, and concurrent sessions do not each create the same agent.
+    # The tools are part of the fingerprint, so a changed tool updates it right away
+    tool_definitions, tool_resources = await setup_tools(client)
+    store = get_state_store()
+    fingerprint = hashlib.sha256(
+        json.dumps(
+            {
+                "model": ai_agent_settings.model_deployment_name,
+                "instructions": agent_instructions,
+                "tools": [tool.as_dict() for tool in tool_definitions],
+                "tool_resources": tool_resources.as_dict(),
+            },
+            sort_keys=True,
+            default=str,
+        ).encode()
+    ).hexdigest()
+    async with store.lock(f"agent:{agent_name}"):
+        shared = await store.get(f"agent:{agent_name}")
+        if shared and shared["fingerprint"] == fingerprint:
+            app_logger.info(f"Using shared agent definition: {agent_name}")
+            agent_definition = Agent(shared["definition"])
+        else:
+            agent_definition = await create_or_update_agent_definition(
+                agent_name,
+                agent_instructions,
+                ai_agent_settings.model_deployment_name,
+                client,
+                tool_definitions,
+                tool_resources,
+            )
+            await store.set(
+                f"agent:{agent_name}",
+                {"fingerprint": fingerprint, "definition": agent_definition.as_dict()},
+                ttl=AGENT_DEFINITION_TTL,
+            )
+
     kernel_settings = PromptExecutionSettings(
         function_choice_behavior=FunctionChoiceBehavior.Auto()
     )
@@ -189,6 +283,8 @@ async def create_agent(
         definition=agent_definition,
         plugins=[SimpleTool(), StackOverflowTool()],
     )
+    # Run synchronous tools in a thread pool so calls of one turn run concurrently
+    offload_sync_functions(agent.kernel)
     return agent
 
 
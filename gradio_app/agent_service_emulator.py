@@ -0,0 +1,680 @@
+"""
+Localhost emulator of the Azure AI Agents API surface used by this app, for load
+and latency testing without an Azure AI Foundry project.
+
+Agents, threads, messages and files are kept in memory. Runs stream scripted
+server-sent events: optional rounds of function calls (answered by the client's
+kernel through `submit_tool_outputs`), then a reply streamed at a configurable
+token rate. Latencies are drawn from log-normal distributions and runs or
+requests can be made to fail at configurable rates.
+
+Run it standalone and point the app at it:
+    python -m agent_service_emulator --port 8090
+    AGENT_SERVICE_EMULATOR_URL=http://127.0.0.1:8090 uvicorn main:app --port 8501
+
+or start it in-process with `start_emulator()`.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from typing import AsyncIterator, Optional
+
+import uvicorn
+from azure.core.credentials import AccessToken
+from azure.core.pipeline.policies import SansIOHTTPPolicy
+from fastapi import FastAPI, HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+logger = logging.getLogger(f"workshop.agent.{__name__}")
+
+# Project path appended to the emulator URL, like a Foundry project endpoint
+PROJECT_PATH = "/api/projects/emulator"
+
+FILLER_WORDS = (
+    "the agent service emulator streams this scripted answer one token at a time "
+    "so that time to first token and streaming throughput can be measured"
+).split()
+
+
+class LatencyDistribution:
+    """Log-normal latency with the given median and 99th percentile, in milliseconds."""
+
+    def __init__(self, median_ms: float, p99_ms: Optional[float] = None):
+        self.median_ms = median_ms
+        p99_ms = max(p99_ms or median_ms, median_ms)
+        # z(0.99) = 2.326
+        self.sigma = math.log(p99_ms / median_ms) / 2.326 if median_ms > 0 else 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        """Sample a latency in seconds."""
+        if self.median_ms <= 0:
+            return 0.0
+        return rng.lognormvariate(math.log(self.median_ms), self.sigma) / 1000
+
+
+class EmulatorSettings:
+    """Script and fault injection settings of the emulator."""
+
+    def __init__(
+        self,
+        tokens_per_second: float = 50.0,
+        response_tokens: int = 60,
+        first_token_latency: LatencyDistribution = LatencyDistribution(400, 1500),
+        api_latency: LatencyDistribution = LatencyDistribution(30, 150),
+        tool_rounds: Optional[list[list[dict]]] = None,
+        run_error_rate: float = 0.0,
+        http_error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.first_token_latency = first_token_latency
+        self.api_latency = api_latency
+        # Each round is a list of {"name": "Plugin-function", "arguments": {...}}
+        # requested together, i.e. one requires_action event
+        self.tool_rounds = tool_rounds or []
+        self.run_error_rate = run_error_rate
+        self.http_error_rate = http_error_rate
+        self.seed = seed
+
+    @classmethod
+    def from_env(cls) -> "EmulatorSettings":
+        seed = os.getenv("EMULATOR_SEED")
+        return cls(
+            tokens_per_second=float(os.getenv("EMULATOR_TOKENS_PER_SECOND", "50")),
+            response_tokens=int(os.getenv("EMULATOR_RESPONSE_TOKENS", "60")),
+            first_token_latency=LatencyDistribution(
+                float(os.getenv("EMULATOR_FIRST_TOKEN_MS", "400")),
+                float(os.getenv("EMULATOR_FIRST_TOKEN_P99_MS", "1500")),
+            ),
+            api_latency=LatencyDistribution(
+                float(os.getenv("EMULATOR_API_LATENCY_MS", "30")),
+                float(os.getenv("EMULATOR_API_LATENCY_P99_MS", "150")),
+            ),
+            tool_rounds=json.loads(os.getenv("EMULATOR_TOOL_ROUNDS", "[]")),
+            run_error_rate=float(os.getenv("EMULATOR_RUN_ERROR_RATE", "0")),
+            http_error_rate=float(os.getenv("EMULATOR_HTTP_ERROR_RATE", "0")),
+            seed=int(seed) if seed else None,
+        )
+
+
+def _new_id(prefix: str) -> str:
+    return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+
+def _sse(event: str, data) -> bytes:
+    payload = data if isinstance(data, str) else json.dumps(data)
+    return f"event: {event}\ndata: {payload}\n\n".encode("utf-8")
+
+
+def _list_page(items: list[dict], has_more: bool = False) -> dict:
+    return {
+        "object": "list",
+        "data": items,
+        "first_id": items[0]["id"] if items else None,
+        "last_id": items[-1]["id"] if items else None,
+        "has_more": has_more,
+    }
+
+
+def _message_text(content) -> str:
+    if isinstance(content, str):
+        return content
+    # Content blocks, e.g. [{"type": "text", "text": "..."}, {"type": "image_url", ...}]
+    parts = []
+    for block in content or []:
+        if block.get("type") == "text":
+            text = block.get("text")
+            parts.append(text.get("value", "") if isinstance(text, dict) else text)
+    return " ".join(p for p in parts if p)
+
+
+class AgentServiceEmulator:
+    """In-memory state and scripted runs behind the emulator routes."""
+
+    def __init__(self, settings: EmulatorSettings):
+        self.settings = settings
+        self.rng = random.Random(settings.seed)
+        self.agents: dict[str, dict] = {}
+        self.threads: dict[str, dict] = {}
+        self.messages: dict[str, list[dict]] = {}
+        self.runs: dict[str, dict] = {}
+        self.files: dict[str, dict] = {}
+
+    async def api_delay(self) -> None:
+        """Simulate service latency and inject request failures."""
+        await asyncio.sleep(self.settings.api_latency.sample(self.rng))
+        if self.rng.random() < self.settings.http_error_rate:
+            raise HTTPException(status_code=503, detail="Emulated service error")
+
+    def create_agent(self, body: dict, agent_id: Optional[str] = None) -> dict:
+        agent = self.agents.get(agent_id) or {
+            "id": agent_id or _new_id("asst"),
+            "object": "assistant",
+            "created_at": int(time.time()),
+            "description": None,
+            "metadata": {},
+            "temperature": None,
+            "top_p": None,
+            "response_format": None,
+        }
+        agent.update(
+            {
+                k: body.get(k, agent.get(k))
+                for k in ("name", "model", "instructions", "tools", "tool_resources")
+            }
+        )
+        agent["tools"] = agent.get("tools") or []
+        agent["tool_resources"] = agent.get("tool_resources") or {}
+        self.agents[agent["id"]] = agent
+        return agent
+
+    def create_thread(self, body: dict) -> dict:
+        thread = {
+            "id": _new_id("thread"),
+            "object": "thread",
+            "created_at": int(time.time()),
+            "tool_resources": body.get("tool_resources") or {},
+            "metadata": body.get("metadata") or {},
+        }
+        self.threads[thread["id"]] = thread
+        self.messages[thread["id"]] = []
+        for message in body.get("messages") or []:
+            self.add_message(thread["id"], message["role"], message.get("content"))
+        return thread
+
+    def get_thread(self, thread_id: str) -> dict:
+        thread = self.threads.get(thread_id)
+        if thread is None:
+            raise HTTPException(status_code=404, detail=f"No thread {thread_id}")
+        return thread
+
+    def add_message(
+        self,
+        thread_id: str,
+        role: str,
+        content,
+        run: Optional[dict] = None,
+        status: str = "completed",
+    ) -> dict:
+        now = int(time.time())
+        message = {
+            "id": _new_id("msg"),
+            "object": "thread.message",
+            "created_at": now,
+            "thread_id": thread_id,
+            "status": status,
+            "incomplete_details": None,
+            "completed_at": now if status == "completed" else None,
+            "incomplete_at": None,
+            "role": role,
+            "content": [
+                {
+                    "type": "text",
+                    "text": {"value": _message_text(content), "annotations": []},
+                }
+            ],
+            "assistant_id": run["assistant_id"] if run else None,
+            "run_id": run["id"] if run else None,
+            "attachments": [],
+            "metadata": {},
+        }
+        self.messages.setdefault(thread_id, []).append(message)
+        return message
+
+    def get_message(self, thread_id: str, message_id: str) -> dict:
+        for message in self.messages.get(thread_id, []):
+            if message["id"] == message_id:
+                return message
+        raise HTTPException(status_code=404, detail=f"No message {message_id}")
+
+    def create_run(self, thread_id: str, body: dict) -> dict:
+        self.get_thread(thread_id)
+        for message in body.get("additional_messages") or []:
+            self.add_message(thread_id, message["role"], message.get("content"))
+        run = {
+            "id": _new_id("run"),
+            "object": "thread.run",
+            "thread_id": thread_id,
+            "assistant_id": body.get("assistant_id"),
+            "status": "queued",
+            "required_action": None,
+            "last_error": None,
+            "model": body.get("model") or "emulator",
+            "instructions": body.get("instructions") or "",
+            "tools": body.get("tools") or [],
+            "created_at": int(time.time()),
+            "expires_at": None,
+            "started_at": None,
+            "completed_at": None,
+            "cancelled_at": None,
+            "failed_at": None,
+            "incomplete_details": None,
+            "usage": None,
+            "temperature": body.get("temperature"),
+            "top_p": body.get("top_p"),
+            "max_prompt_tokens": body.get("max_prompt_tokens"),
+            "max_completion_tokens": body.get("max_completion_tokens"),
+            "truncation_strategy": body.get("truncation_strategy"),
+            "tool_choice": None,
+            "response_format": None,
+            "metadata": body.get("metadata") or {},
+            "tool_resources": None,
+            "parallel_tool_calls": True,
+            # Emulator bookkeeping, not part of the API model
+            "_round": 0,
+            "_prompt_tokens": self.prompt_tokens(thread_id, body),
+            "_fail": self.rng.random() < self.settings.run_error_rate,
+        }
+        self.runs[run["id"]] = run
+        return run
+
+    def prompt_tokens(self, thread_id: str, body: dict) -> int:
+        """Estimate the prompt of a run at ~4 characters per token."""
+        messages = self.messages.get(thread_id, [])
+        truncation = body.get("truncation_strategy") or {}
+        if truncation.get("type") == "last_messages":
+            messages = messages[-truncation["last_messages"] :]
+        chars = len(body.get("instructions") or "") + len(
+            body.get("additional_instructions") or ""
+        )
+        chars += sum(len(_message_text(message["content"])) for message in messages)
+        return chars // 4
+
+    def get_run(self, thread_id: str, run_id: str) -> dict:
+        run = self.runs.get(run_id)
+        if run is None or run["thread_id"] != thread_id:
+            raise HTTPException(status_code=404, detail=f"No run {run_id}")
+        return run
+
+    @staticmethod
+    def public(run: dict) -> dict:
+        return {k: v for k, v in run.items() if not k.startswith("_")}
+
+    def _step(self, run: dict, step_type: str, details: dict, status: str) -> dict:
+        return {
+            "id": run.setdefault("_step_id", _new_id("step")),
+            "object": "thread.run.step",
+            "type": step_type,
+            "assistant_id": run["assistant_id"],
+            "thread_id": run["thread_id"],
+            "run_id": run["id"],
+            "status": status,
+            "step_details": details,
+            "last_error": None,
+            "created_at": int(time.time()),
+            "expired_at": None,
+            "completed_at": int(time.time()) if status == "completed" else None,
+            "cancelled_at": None,
+            "failed_at": None,
+            "metadata": {},
+        }
+
+    async def stream_run(self, run: dict) -> AsyncIterator[bytes]:
+        """Stream the next part of a run: a tool call round, a failure or the reply."""
+        settings = self.settings
+        if run["_round"] == 0:
+            yield _sse("thread.run.created", self.public(run))
+        run["status"] = "in_progress"
+        run["started_at"] = run["started_at"] or int(time.time())
+        yield _sse("thread.run.in_progress", self.public(run))
+
+        await asyncio.sleep(settings.first_token_latency.sample(self.rng))
+
+        if run["_fail"] and run["_round"] >= len(settings.tool_rounds):
+            run["status"] = "failed"
+            run["failed_at"] = int(time.time())
+            run["last_error"] = {
+                "code": "server_error",
+                "message": "Emulated run failure",
+            }
+            yield _sse("thread.run.failed", self.public(run))
+            yield _sse("done", "[DONE]")
+            return
+
+        if run["_round"] < len(settings.tool_rounds):
+            tool_calls = [
+                {
+                    "id": _new_id("call"),
+                    "type": "function",
+                    "function": {
+                        "name": call["name"],
+                        "arguments": json.dumps(call.get("arguments", {})),
+                    },
+                }
+                for call in settings.tool_rounds[run["_round"]]
+            ]
+            run["_round"] += 1
+            run["status"] = "requires_action"
+            run["required_action"] = {
+                "type": "submit_tool_outputs",
+                "submit_tool_outputs": {"tool_calls": tool_calls},
+            }
+            yield _sse("thread.run.requires_action", self.public(run))
+            yield _sse("done", "[DONE]")
+            return
+
+        run["_round"] += 1
+        run["required_action"] = None
+        message = self.add_message(
+            run["thread_id"], "assistant", "", run, "in_progress"
+        )
+        details = {
+            "type": "message_creation",
+            "message_creation": {"message_id": message["id"]},
+        }
+        yield _sse(
+            "thread.run.step.created",
+            self._step(run, "message_creation", details, "in_progress"),
+        )
+        yield _sse("thread.message.created", message)
+
+        text = message["content"][0]["text"]
+        delay = 1 / settings.tokens_per_second if settings.tokens_per_second > 0 else 0
+        for i in range(settings.response_tokens):
+            token = FILLER_WORDS[i % len(FILLER_WORDS)] + " "
+            text["value"] += token
+            yield _sse(
+                "thread.message.delta",
+                {
+                    "id": message["id"],
+                    "object": "thread.message.delta",
+                    "delta": {
+                        "role": "assistant",
+                        "content": [
+                            {"index": 0, "type": "text", "text": {"value": token}}
+                        ],
+                    },
+                },
+            )
+            await asyncio.sleep(delay)
+
+        message["status"] = "completed"
+        message["completed_at"] = int(time.time())
+        yield _sse("thread.message.completed", message)
+        yield _sse(
+            "thread.run.step.completed",
+            self._step(run, "message_creation", details, "completed"),
+        )
+        run["status"] = "completed"
+        run["completed_at"] = int(time.time())
+        run["usage"] = {
+            "prompt_tokens": run["_prompt_tokens"],
+            "completion_tokens": settings.response_tokens,
+            "total_tokens": run["_prompt_tokens"] + settings.response_tokens,
+        }
+        yield _sse("thread.run.completed", self.public(run))
+        yield _sse("done", "[DONE]")
+
+
+def create_emulator_app(settings: Optional[EmulatorSettings] = None) -> FastAPI:
+    """Create the FastAPI app serving the emulated agents API under `PROJECT_PATH`."""
+    emulator = AgentServiceEmulator(settings or EmulatorSettings.from_env())
+    app = FastAPI(title="Azure AI Agents service emulator")
+    app.state.emulator = emulator
+    p = PROJECT_PATH
+
+    @app.middleware("http")
+    async def latency_and_faults(request: Request, call_next):
+        try:
+            await emulator.api_delay()
+        except HTTPException as e:
+            return JSONResponse(
+                status_code=e.status_code,
+                content={"error": {"code": "ServiceUnavailable", "message": e.detail}},
+            )
+        return await call_next(request)
+
+    def stream(run: dict) -> StreamingResponse:
+        return StreamingResponse(
+            emulator.stream_run(run), media_type="text/event-stream"
+        )
+
+    # Project connections (no Bing grounding connection is emulated)
+    @app.get(p + "/connections")
+    async def list_connections():
+        return {"value": []}
+
+    # Agents
+    @app.get(p + "/assistants")
+    async def list_agents(limit: int = 20, after: Optional[str] = None):
+        agents = list(emulator.agents.values())
+        ids = [agent["id"] for agent in agents]
+        if after in ids:
+            # The client pages on the last id, so a page must not repeat it
+            agents = agents[ids.index(after) + 1 :]
+        return _list_page(agents[:limit], has_more=len(agents) > limit)
+
+    @app.post(p + "/assistants")
+    async def create_agent(request: Request):
+        return emulator.create_agent(await request.json())
+
+    @app.get(p + "/assistants/{agent_id}")
+    async def get_agent(agent_id: str):
+        if agent_id not in emulator.agents:
+            raise HTTPException(status_code=404, detail=f"No agent {agent_id}")
+        return emulator.agents[agent_id]
+
+    @app.post(p + "/assistants/{agent_id}")
+    async def update_agent(agent_id: str, request: Request):
+        return emulator.create_agent(await request.json(), agent_id=agent_id)
+
+    @app.delete(p + "/assistants/{agent_id}")
+    async def delete_agent(agent_id: str):
+        emulator.agents.pop(agent_id, None)
+        return {"id": agent_id, "object": "assistant.deleted", "deleted": True}
+
+    # Threads
+    @app.post(p + "/threads")
+    async def create_thread(request: Request):
+        return emulator.create_thread(await request.json())
+
+    @app.get(p + "/threads/{thread_id}")
+    async def get_thread(thread_id: str):
+        return emulator.get_thread(thread_id)
+
+    @app.post(p + "/threads/{thread_id}")
+    async def update_thread(thread_id: str, request: Request):
+        thread = emulator.get_thread(thread_id)
+        body = await request.json()
+        for key in ("tool_resources", "metadata"):
+            if body.get(key) is not None:
+                thread[key] = body[key]
+        return thread
+
+    @app.delete(p + "/threads/{thread_id}")
+    async def delete_thread(thread_id: str):
+        emulator.threads.pop(thread_id, None)
+        emulator.messages.pop(thread_id, None)
+        return {"id": thread_id, "object": "thread.deleted", "deleted": True}
+
+    # Messages
+    @app.post(p + "/threads/{thread_id}/messages")
+    async def create_message(thread_id: str, request: Request):
+        emulator.get_thread(thread_id)
+        body = await request.json()
+        return emulator.add_message(thread_id, body["role"], body.get("content"))
+
+    @app.get(p + "/threads/{thread_id}/messages")
+    async def list_messages(
+        thread_id: str,
+        order: str = "desc",
+        limit: int = 20,
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+    ):
+        emulator.get_thread(thread_id)
+        messages = emulator.messages.get(thread_id, [])
+        messages = list(reversed(messages)) if order == "desc" else list(messages)
+        ids = [message["id"] for message in messages]
+        if before in ids:
+            messages = messages[: ids.index(before)]
+        if after in ids:
+            messages = messages[ids.index(after) + 1 :]
+        return _list_page(messages[:limit], has_more=len(messages) > limit)
+
+    @app.get(p + "/threads/{thread_id}/messages/{message_id}")
+    async def get_message(thread_id: str, message_id: str):
+        return emulator.get_message(thread_id, message_id)
+
+    # Runs
+    @app.post(p + "/threads/{thread_id}/runs")
+    async def create_run(thread_id: str, request: Request):
+        body = await request.json()
+        run = emulator.create_run(thread_id, body)
+        if body.get("stream"):
+            return stream(run)
+        # Non-streaming runs complete immediately, without tool calls
+        run["_round"] = len(emulator.settings.tool_rounds)
+        async for _ in emulator.stream_run(run):
+            pass
+        return emulator.public(run)
+
+    @app.get(p + "/threads/{thread_id}/runs")
+    async def list_runs(thread_id: str, order: str = "desc", limit: int = 20):
+        emulator.get_thread(thread_id)
+        runs = [
+            emulator.public(run)
+            for run in emulator.runs.values()
+            if run["thread_id"] == thread_id
+        ]
+        runs = list(reversed(runs)) if order == "desc" else runs
+        return _list_page(runs[:limit], has_more=len(runs) > limit)
+
+    @app.get(p + "/threads/{thread_id}/runs/{run_id}")
+    async def get_run(thread_id: str, run_id: str):
+        return emulator.public(emulator.get_run(thread_id, run_id))
+
+    @app.post(p + "/threads/{thread_id}/runs/{run_id}/submit_tool_outputs")
+    async def submit_tool_outputs(thread_id: str, run_id: str, request: Request):
+        run = emulator.get_run(thread_id, run_id)
+        if run["status"] != "requires_action":
+            raise HTTPException(status_code=400, detail="Run does not require action")
+        body = await request.json()
+        run["_tool_outputs"] = body.get("tool_outputs", [])
+        if body.get("stream"):
+            return stream(run)
+        async for _ in emulator.stream_run(run):
+            pass
+        return emulator.public(run)
+
+    @app.post(p + "/threads/{thread_id}/runs/{run_id}/cancel")
+    async def cancel_run(thread_id: str, run_id: str):
+        run = emulator.get_run(thread_id, run_id)
+        run["status"] = "cancelled"
+        run["cancelled_at"] = int(time.time())
+        return emulator.public(run)
+
+    @app.get(p + "/threads/{thread_id}/runs/{run_id}/steps")
+    async def list_run_steps(thread_id: str, run_id: str):
+        emulator.get_run(thread_id, run_id)
+        return _list_page([])
+
+    # Files
+    @app.post(p + "/files")
+    async def upload_file(file: UploadFile, request: Request):
+        form = await request.form()
+        content = await file.read()
+        info = {
+            "id": _new_id("assistant-file"),
+            "object": "file",
+            "bytes": len(content),
+            "filename": file.filename,
+            "created_at": int(time.time()),
+            "purpose": form.get("purpose", "assistants"),
+            "status": "processed",
+            "status_details": None,
+        }
+        emulator.files[info["id"]] = {"info": info, "content": content}
+        return info
+
+    @app.get(p + "/files/{file_id}")
+    async def get_file(file_id: str):
+        if file_id not in emulator.files:
+            raise HTTPException(status_code=404, detail=f"No file {file_id}")
+        return emulator.files[file_id]["info"]
+
+    @app.get(p + "/files/{file_id}/content")
+    async def get_file_content(file_id: str):
+        if file_id not in emulator.files:
+            raise HTTPException(status_code=404, detail=f"No file {file_id}")
+        return Response(
+            emulator.files[file_id]["content"],
+            media_type="application/octet-stream",
+        )
+
+    @app.delete(p + "/files/{file_id}")
+    async def delete_file(file_id: str):
+        emulator.files.pop(file_id, None)
+        return {"id": file_id, "object": "file", "deleted": True}
+
+    return app
+
+
+class EmulatorCredential:
+    """Async token credential handing out a static token for the emulator."""
+
+    async def get_token(self, *scopes, **kwargs) -> AccessToken:
+        return AccessToken("emulator", int(time.time()) + 3600)
+
+    async def close(self) -> None:
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        pass
+
+
+def emulator_client_kwargs() -> dict:
+    """
+    Keyword arguments for `AIProjectClient` talking to the emulator over plain HTTP.
+    The bearer token policy refuses non-https URLs, so no token is sent at all.
+    """
+    return {"authentication_policy": SansIOHTTPPolicy()}
+
+
+def emulator_endpoint(url: str) -> str:
+    """Project endpoint for an emulator listening at `url`."""
+    return url.rstrip("/") + PROJECT_PATH
+
+
+def start_emulator(
+    settings: Optional[EmulatorSettings] = None,
+    host: str = "127.0.0.1",
+    port: int = 8090,
+) -> tuple[str, uvicorn.Server]:
+    """Start the emulator on a background thread; returns its URL and server."""
+    config = uvicorn.Config(
+        create_emulator_app(settings), host=host, port=port, log_level="warning"
+    )
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, name="agent-emulator", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"Agent service emulator failed to start on {port}")
+        time.sleep(0.05)
+    logger.info(f"Agent service emulator listening on http://{host}:{port}")
+    return f"http://{host}:{port}", server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    args = parser.parse_args()
+    uvicorn.run(create_emulator_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
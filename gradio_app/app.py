@@ -1,53 +1,118 @@
+import os
 from typing import List
 import gradio as gr
+from azure.core.exceptions import ResourceNotFoundError
 from agent_chat import EnterpriseChat, create_enterprise_chat
+from auth_msal import get_current_user
+from state_store import get_state_store
+from thread_reaper import thread_reaper
 
-
-# Global dictionary to store user-specific instances
+# Global dictionary to store user-specific instances of this worker
 instances: dict[str, EnterpriseChat] = {}
 
+# Each user keeps one agent thread in the shared state store, so a page reload or a
+# session moved to another worker continues the conversation instead of leaking it
+USER_THREAD_TTL = int(os.getenv("USER_THREAD_TTL_SECONDS", "2592000"))
+# Messages loaded at once when the history of a thread is shown
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "20"))
 
-def get_user(request: gr.Request) -> str:
-    if request.username:
-        return f"Hello, **{request.username}**!"
-    return "Hello, **Guest**!"
 
+def get_user_key(request: gr.Request) -> str:
+    """Key of the user's thread: the MSAL user id, or the browser session for guests."""
+    user = get_current_user(request.request) if request.request else None
+    if user and user.get("id"):
+        return f"user:{user['id']}"
+    return f"session:{request.session_hash}"
+
+
+async def save_user_thread(chat: EnterpriseChat) -> None:
+    await get_state_store().set(
+        chat.state_key, {"thread_id": chat.thread.id}, ttl=USER_THREAD_TTL
+    )
 
-async def set_enterprise_chat(request: gr.Request) -> None:
 
+async def get_enterprise_chat(request: gr.Request) -> EnterpriseChat:
+    """Get the chat instance of the session, rehydrating the user's thread."""
     stackoverflow_token: str = None
     if request and request.request and request.request.session:
         stackoverflow_token = request.request.session.get("stackoverflow_token", None)
 
-    if request.session_hash in instances:
-        # If an instance already exists for this session, return it
-        chat = instances[request.session_hash]
-        chat.set_stack_token(stackoverflow_token)
-        return None
-
-    chat = await create_enterprise_chat(
-        "Bob",
-        f"""
-            You are a helpful assistant for enterprise queries.
-            The user you're assisting is {request.username}.
-            
-            ## Tool usage
-
-            ### Bing Search Tool
-            Use the Bing Search tool to find information on the web. You can search for company policies, weather forecasts, stock prices, and more.
-            Example: prompt:"Who won champions league" should produce a Bing search query 'https://api.bing.microsoft.com/v7.0/search?q=champions league 2025 winner'
-
-            ### WeatherAPI
-            Use the WeatherAPI tool to get real-time weather forecasts. You can ask about the weather in specific locations.
-            Do not make up alternative sources or suggest alternative data sources.
-            When making tool/function calls, ensure you understand the description of the arguments/properties. 
-            They may give useful information as to why types of values are allowed or required. 
-            For example, the \'query\' argument takes a latitude, longitude value, so you must convert a string location to this type.
-            """,
-    )
+    chat = instances.get(request.session_hash)
+    if chat is None:
+        state_key = f"thread:{get_user_key(request)}"
+        user_thread = await get_state_store().get(state_key)
+        chat = await create_enterprise_chat(
+            "Bob",
+            """
+                You are a helpful assistant for enterprise queries.
+                
+                ## Tool usage
+
+                ### Bing Search Tool
+                Use the Bing Search tool to find information on the web. You can search for company policies, weather forecasts, stock prices, and more.
+                Example: prompt:"Who won champions league" should produce a Bing search query 'https://api.bing.microsoft.com/v7.0/search?q=champions league 2025 winner'
+
+                ### WeatherAPI
+                Use the WeatherAPI tool to get real-time weather forecasts. You can ask about the weather in specific locations.
+                Do not make up alternative sources or suggest alternative data sources.
+                When making tool/function calls, ensure you understand the description of the arguments/properties. 
+                They may give useful information as to why types of values are allowed or required. 
+                For example, the \'query\' argument takes a latitude, longitude value, so you must convert a string location to this type.
+                """,
+            user_id=request.username,
+            thread_id=user_thread["thread_id"] if user_thread else None,
+            state_key=state_key,
+        )
+        instances[request.session_hash] = chat
+        # Saved on every new session, which also extends the thread's TTL
+        await save_user_thread(chat)
+
     chat.set_stack_token(stackoverflow_token)
-    instances[request.session_hash] = chat
-    return None
+    return chat
+
+
+def get_user(request: gr.Request) -> str:
+    if request.username:
+        return f"Hello, **{request.username}**!"
+    return "Hello, **Guest**!"
+
+
+async def set_enterprise_chat(request: gr.Request):
+    """Set up the chat of a new browser session and show the latest messages."""
+    chat = await get_enterprise_chat(request)
+    try:
+        history, cursor = await chat.load_history(limit=HISTORY_PAGE_SIZE)
+    except ResourceNotFoundError:
+        # The user's thread was deleted on the service; start a new one
+        await chat.reset_thread()
+        await save_user_thread(chat)
+        history, cursor = [], None
+    return history, cursor, gr.Button(visible=cursor is not None)
+
+
+async def load_earlier_history(
+    request: gr.Request, history: List[dict], cursor: str | None
+):
+    """Prepend the page of messages before the ones shown."""
+    if not cursor:
+        return history, None, gr.Button(visible=False)
+    chat = await get_enterprise_chat(request)
+    earlier, cursor = await chat.load_history(cursor, limit=HISTORY_PAGE_SIZE)
+    return earlier + history, cursor, gr.Button(visible=cursor is not None)
+
+
+async def release_enterprise_chat(request: gr.Request) -> None:
+    """Drop the chat instance of a browser session that was closed."""
+    chat = instances.pop(request.session_hash, None)
+    if not chat:
+        return
+    chat.session.close()
+    if chat.state_key == f"thread:session:{request.session_hash}":
+        # A guest's thread cannot be continued from another browser session
+        thread_reaper.release(chat.thread.id)
+        await get_state_store().delete(chat.state_key)
+    else:
+        thread_reaper.untrack(chat.thread.id)
 
 
 # Example: custom theme for a more modern look
@@ -81,9 +146,10 @@ brand_theme = gr.themes.Default(
 
 async def clear_thread(request: gr.Request):
     # Placeholder for thread reset logic if using AzureAIAgent threads
-    chat = instances.get(request.session_hash)
+    chat = await get_enterprise_chat(request)
     await chat.reset_thread()
-    return []
+    await save_user_thread(chat)
+    return [], None, gr.Button(visible=False)
 
 
 def on_example_clicked(evt: gr.SelectData):
@@ -103,13 +169,13 @@ async def chat_with_agent(request: gr.Request, user_message: dict, history: List
     }
     yield history + [assistant_msg], gr.MultimodalTextbox(interactive=False, value=None)
 
-    chat = instances.get(request.session_hash)
+    chat = await get_enterprise_chat(request)
 
     agent_response = chat.azure_enterprise_chat(user_message, history)
 
     async for new_history in agent_response:
         assistant_msg["metadata"]["status"] = "done"
-        yield [] + new_history, gr.MultimodalTextbox(interactive=False, value=None)
+        yield new_history, gr.MultimodalTextbox(interactive=False, value=None)
 
 
 with gr.Blocks(
@@ -128,6 +194,9 @@ with gr.Blocks(
             value="", elem_id="user-display", elem_classes="user-display"
         )
     demo.load(get_user, None, user_display)
+    # Cursor of the earlier messages of the thread that are not shown yet
+    history_cursor = gr.State(None)
+    load_earlier = gr.Button("Load earlier messages", size="sm", visible=False)
     chatbot = gr.Chatbot(
         label="Agent",
         type="messages",
@@ -185,7 +254,13 @@ with gr.Blocks(
         ],
     )
 
-    chat_input.attach_load_event(set_enterprise_chat, every=None)
+    demo.load(set_enterprise_chat, outputs=[chatbot, history_cursor, load_earlier])
+    load_earlier.click(
+        load_earlier_history,
+        inputs=[chatbot, history_cursor],
+        outputs=[chatbot, history_cursor, load_earlier],
+    )
+    demo.unload(release_enterprise_chat)
 
     # On submit: call azure_enterprise_chat, then clear the textbox
     (
@@ -203,6 +278,9 @@ with gr.Blocks(
     # Populate textbox when an example is clicked
     chatbot.example_select(fn=on_example_clicked, inputs=None, outputs=chat_input)
 
-    chatbot.clear(fn=clear_thread, outputs=chatbot)
+    chatbot.clear(fn=clear_thread, outputs=[chatbot, history_cursor, load_earlier])
+
+# Events each listener may process at once; Gradio's default of 1 serializes all sessions
+demo.queue(default_concurrency_limit=int(os.getenv("GRADIO_CONCURRENCY_LIMIT", "1")))
 
 # demo.launch()
@@ -5,11 +5,9 @@ Provides proper token management, refresh handling, and user context.
 
 import os
 import logging
-from typing import Optional, Dict, Any
+from typing import Callable, Optional, Dict, Any
 from datetime import datetime
-import msal
 from fastapi import Request, HTTPException, status
-import jwt
 
 logger = logging.getLogger(__name__)
 
@@ -42,7 +40,10 @@ class MSALAuth:
             # "https://management.azure.com/.default"  # For Azure Resource Manager
         ]
 
-        # Create MSAL confidential client
+        # Create MSAL confidential client. msal is imported here, on first login,
+        # so that it stays off the startup path
+        import msal
+
         self.app = msal.ConfidentialClientApplication(
             client_id=self.client_id,
             client_credential=self.client_secret,
@@ -97,6 +98,8 @@ class MSALAuth:
     def get_user_from_token(self, access_token: str) -> Optional[Dict[str, Any]]:
         """Extract user information from access token."""
         try:
+            import jwt
+
             # Decode token without verification for user info (already validated by MSAL)
             decoded = jwt.decode(access_token, options={"verify_signature": False})
 
@@ -165,6 +168,20 @@ class MSALAuth:
 # Global MSAL instance - will be initialized when needed
 msal_auth = None
 
+# Replaces the Azure AD login; only set by the load test entrypoint
+_current_user_override: Optional[Callable[[Request], Optional[Dict[str, Any]]]] = None
+
+
+def override_current_user(
+    resolver: Callable[[Request], Optional[Dict[str, Any]]],
+) -> None:
+    """
+    Resolve the user of every request with `resolver` instead of the session's
+    login. For benchmarks/load_test_app.py only; never call it in the app itself.
+    """
+    global _current_user_override
+    _current_user_override = resolver
+
 
 def get_msal_auth() -> MSALAuth:
     """Get or create the global MSAL authentication instance."""
@@ -176,6 +193,9 @@ def get_msal_auth() -> MSALAuth:
 
 def get_current_user(request: Request) -> Optional[Dict[str, Any]]:
     """Get current authenticated user from session."""
+    if _current_user_override is not None:
+        return _current_user_override(request)
+
     try:
         # Ensure we have a valid token
         token_data = get_msal_auth().ensure_valid_token(request.session)
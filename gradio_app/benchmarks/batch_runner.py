@@ -0,0 +1,360 @@
+"""
+Batch replay of prompts against the workshop CLI agents.
+
+The workshop agents (agents-workshop/02-04) read prompts from `input()` one at a
+time. This runner loads a workshop folder's `agent.py`, creates its agent with
+the folder's own factory (`create_agent` or `create_update_agent_definition`),
+and replays a JSONL file of conversations through a pool of concurrent workers.
+Each conversation runs on its own agent thread. One line per conversation:
+
+    {"id": "weather", "prompt": "What's the forecast for Redmond, WA?"}
+    {"id": "math", "messages": ["Add 1234 and 4321.", "Now multiply it by 2."]}
+
+Run from the gradio_app folder:
+    python -m benchmarks.batch_runner \
+        ../agents-workshop/03-building-custom-tools/03.2.azure-ai-agent-builtin-tools \
+        benchmarks/prompts.jsonl --concurrency 8 --emulator --output results.jsonl
+
+With --emulator, the agent service emulator is started as a subprocess (use
+--emulator-url for a running one), so no Foundry project is needed; it is
+configured with the EMULATOR_* environment variables. The Semantic Kernel
+ChatCompletionAgent of 02-single-agent-example/semantic-kernel-agent calls Azure
+OpenAI directly and cannot run against the emulator, and the exercise skeleton of
+02-single-agent-example/azure-ai-agent does not import until it is completed.
+
+Every prompt is written to --output as soon as it completes, with its output,
+latency, time to first token, tool calls and token usage. The summary has
+p50/p95/p99 of both timings and the token totals.
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import inspect
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import date
+from typing import Any, NamedTuple, Optional
+
+import httpx
+from azure.ai.agents.models import ListSortOrder
+from semantic_kernel.agents import AzureAIAgent, AzureAIAgentThread
+from semantic_kernel.contents import ChatMessageContent, FunctionCallContent
+
+from agent_service_emulator import (
+    EmulatorCredential,
+    emulator_client_kwargs,
+    emulator_endpoint,
+)
+from benchmarks.load_test import git_commit, percentiles
+
+
+class Conversation(NamedTuple):
+    id: str
+    prompts: list[str]
+
+
+def read_conversations(path: str) -> list[Conversation]:
+    """Conversations of a JSONL file, with a `prompt` or a `messages` list each."""
+    conversations = []
+    with open(path) as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            prompts = item.get("messages") or [item["prompt"]]
+            conversations.append(Conversation(str(item.get("id", number)), prompts))
+    return conversations
+
+
+def load_workshop_module(folder: str):
+    """Import `agent.py` of a workshop folder, next to its own helper modules."""
+    folder = os.path.abspath(folder)
+    # The folder's otel_setup, kernel_factory and tools take precedence
+    sys.path.insert(0, folder)
+    spec = importlib.util.spec_from_file_location(
+        "workshop_agent", os.path.join(folder, "agent.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def create_client(module, emulator_url: Optional[str]) -> tuple[Any, Any]:
+    """The project client and credential, or (None, None) for non-service agents."""
+    if emulator_url:
+        creds = EmulatorCredential()
+        client = AzureAIAgent.create_client(
+            credential=creds,
+            endpoint=emulator_endpoint(emulator_url),
+            **emulator_client_kwargs(),
+        )
+        return client, creds
+    if hasattr(module, "create_project_client"):
+        return module.create_project_client()
+    return None, None
+
+
+async def create_agent(module, client, name: str, instructions: str):
+    """Create the agent with the workshop's factory, whatever its signature."""
+    factory = getattr(module, "create_update_agent_definition", None) or getattr(
+        module, "create_agent"
+    )
+    arguments = {
+        "agent_name": name,
+        "agent_instructions": instructions,
+        "client": client,
+    }
+    parameters = inspect.signature(factory).parameters
+    agent = factory(**{k: v for k, v in arguments.items() if k in parameters})
+    if inspect.isawaitable(agent):
+        agent = await agent
+    # Some factories also return the tools they created
+    return agent[0] if isinstance(agent, tuple) else agent
+
+
+class BatchRunner:
+    """Replays conversations on one agent with a bounded number of workers."""
+
+    def __init__(self, agent, client, concurrency: int, timeout: float, output):
+        self.agent = agent
+        self.client = client
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.output = output
+        self.records: list[dict] = []
+
+    async def run(self, conversations: list[Conversation]) -> None:
+        queue: asyncio.Queue = asyncio.Queue()
+        for conversation in conversations:
+            queue.put_nowait(conversation)
+
+        async def worker():
+            while not queue.empty():
+                await self.run_conversation(queue.get_nowait())
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+    async def run_conversation(self, conversation: Conversation) -> None:
+        thread = AzureAIAgentThread(client=self.client) if self.client else None
+        try:
+            for turn, prompt in enumerate(conversation.prompts):
+                record, thread = await self.run_prompt(prompt, thread)
+                self.write({"id": conversation.id, "turn": turn, **record})
+                if record["error"]:
+                    # Later turns depend on this answer
+                    break
+        finally:
+            if thread is not None:
+                try:
+                    await thread.delete()
+                except Exception:
+                    pass
+
+    async def run_prompt(self, prompt: str, thread) -> tuple[dict, Any]:
+        tool_calls: list[str] = []
+        parts: list[str] = []
+        usage = None
+        ttft = None
+        error = None
+
+        async def on_intermediate_message(message: ChatMessageContent):
+            for item in message.items:
+                if isinstance(item, FunctionCallContent):
+                    tool_calls.append(item.name)
+
+        started = time.perf_counter()
+        try:
+            async with asyncio.timeout(self.timeout):
+                async for response in self.agent.invoke_stream(
+                    messages=prompt,
+                    thread=thread,
+                    on_intermediate_message=on_intermediate_message,
+                ):
+                    thread = response.thread
+                    text = str(response)
+                    if text:
+                        if ttft is None:
+                            ttft = time.perf_counter() - started
+                        parts.append(text)
+                    usage = response.metadata.get("usage") or usage
+        except TimeoutError:
+            error = f"timed out after {self.timeout}s"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        latency = time.perf_counter() - started
+
+        if self.client and thread is not None and thread.id and not error:
+            usage = await self.run_usage(thread.id) or usage
+        record = {
+            "prompt": prompt,
+            "output": "".join(parts),
+            "latency_ms": latency * 1000,
+            "ttft_ms": ttft * 1000 if ttft is not None else None,
+            "tool_calls": tool_calls,
+            "prompt_tokens": getattr(usage, "prompt_tokens", None),
+            "completion_tokens": getattr(usage, "completion_tokens", None),
+            "error": error,
+        }
+        return record, thread
+
+    async def run_usage(self, thread_id: str):
+        """Token usage of the thread's latest run, as reported by the service."""
+        runs = self.client.agents.runs.list(
+            thread_id=thread_id, limit=1, order=ListSortOrder.DESCENDING
+        )
+        async for run in runs:
+            return run.usage
+        return None
+
+    def write(self, record: dict) -> None:
+        self.records.append(record)
+        if self.output:
+            self.output.write(json.dumps(record) + "\n")
+            self.output.flush()
+
+
+def summarize(records: list[dict], duration: float, args) -> dict:
+    completed = [r for r in records if not r["error"]]
+
+    def tokens(key: str) -> list[float]:
+        return [r[key] for r in completed if r[key] is not None]
+
+    return {
+        "git_commit": git_commit(),
+        "config": {
+            "agent": args.agent,
+            "prompts_file": args.prompts,
+            "concurrency": args.concurrency,
+            "emulator": bool(args.emulator or args.emulator_url),
+        },
+        "duration_seconds": duration,
+        "prompts": len(records),
+        "prompts_per_second": len(records) / duration if duration else 0,
+        "errors": len(records) - len(completed),
+        "error_samples": [r["error"] for r in records if r["error"]][:10],
+        "ttft_ms": percentiles(
+            [r["ttft_ms"] for r in completed if r["ttft_ms"] is not None]
+        ),
+        "latency_ms": percentiles([r["latency_ms"] for r in completed]),
+        "prompt_tokens": sum(tokens("prompt_tokens")),
+        "completion_tokens": sum(tokens("completion_tokens")),
+        "prompt_tokens_per_prompt": percentiles(tokens("prompt_tokens")),
+        "tool_calls": dict(Counter(t for r in records for t in r["tool_calls"])),
+    }
+
+
+def print_summary(report: dict) -> None:
+    print(
+        f"{report['prompts']} prompts in {report['duration_seconds']:.1f}s"
+        f" ({report['prompts_per_second']:.2f}/s), {report['errors']} errors"
+    )
+    for label, key in (("time to first token", "ttft_ms"), ("latency", "latency_ms")):
+        stats = report[key]
+        if not stats.get("count"):
+            print(f"{label:<24} n/a")
+            continue
+        print(
+            f"{label:<24} p50 {stats['p50']:>9.1f}  p95 {stats['p95']:>9.1f}"
+            f"  p99 {stats['p99']:>9.1f} ms"
+        )
+    print(
+        f"{'tokens':<24} {report['prompt_tokens']} prompt,"
+        f" {report['completion_tokens']} completion"
+    )
+    if report["tool_calls"]:
+        calls = ", ".join(f"{k} x{v}" for k, v in report["tool_calls"].items())
+        print(f"{'tool calls':<24} {calls}")
+
+
+def start_emulator(port: int) -> tuple[str, subprocess.Popen]:
+    """Start the agent service emulator as a subprocess and wait until it answers."""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "agent_service_emulator", "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return url, process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise TimeoutError("The agent service emulator did not start")
+
+
+async def run_batch(args, emulator_url: Optional[str]) -> dict:
+    module = load_workshop_module(args.agent)
+    conversations = read_conversations(args.prompts)
+    client, creds = create_client(module, emulator_url)
+    agent = await create_agent(module, client, args.agent_name, args.instructions)
+    output = open(args.output, "w") if args.output else None
+    try:
+        runner = BatchRunner(agent, client, args.concurrency, args.timeout, output)
+        started = time.perf_counter()
+        await runner.run(conversations)
+        return summarize(runner.records, time.perf_counter() - started, args)
+    finally:
+        if output:
+            output.close()
+        if client:
+            await client.agents.delete_agent(agent.id)
+            await client.close()
+        if creds:
+            await creds.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("agent", help="workshop folder containing agent.py")
+    parser.add_argument("prompts", help="JSONL file of conversations")
+    parser.add_argument("--concurrency", type=int, default=4, help="workers")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per prompt")
+    parser.add_argument("--agent-name", default="BatchAgent")
+    parser.add_argument(
+        "--instructions",
+        default=f"Today is {date.today().strftime('%Y-%m-%d')}."
+        " You are a helpful assistant.",
+    )
+    parser.add_argument(
+        "--emulator", action="store_true", help="start the agent service emulator"
+    )
+    parser.add_argument(
+        "--emulator-url",
+        default=os.getenv("AGENT_SERVICE_EMULATOR_URL"),
+        help="use a running agent service emulator",
+    )
+    parser.add_argument("--emulator-port", type=int, default=8590)
+    parser.add_argument("--output", help="write one JSON record per prompt here")
+    parser.add_argument("--report", help="write the JSON summary to this file")
+    args = parser.parse_args()
+
+    process = None
+    emulator_url = args.emulator_url
+    if args.emulator:
+        emulator_url, process = start_emulator(args.emulator_port)
+    if emulator_url:
+        os.environ.setdefault("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME", "emulator")
+    try:
+        report = asyncio.run(run_batch(args, emulator_url))
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=10)
+
+    print_summary(report)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+"""
+End-to-end load test of the Gradio app with concurrent simulated users.
+
+Unless --url points at a running server, the agent service emulator and
+`uvicorn benchmarks.load_test_app:app` are started as subprocesses. That
+entrypoint authenticates every local user by the X-Load-Test-User header. Each
+simulated user opens a Gradio session (heartbeat and load events), then sends
+chat messages through Gradio's queue API. Gradio 5 streams results over
+server-sent events, so that is what the users consume.
+
+Run from the gradio_app folder:
+    python -m benchmarks.load_test --users 20 --messages 3 --output load.json
+
+The emulator is configured with the EMULATOR_* environment variables (see
+agent_service_emulator.py). Reported numbers:
+
+- TTFT: from submitting a message to the first frame with agent text
+- frame rate: streamed frames per second after the first agent text frame
+- server CPU and RSS (RSS per session is the growth over the idle baseline)
+- event loop lag, probed as the latency of /health while under load
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from typing import AsyncIterator, Optional
+
+import httpx
+
+API_PREFIX = "/gradio_api"
+
+MESSAGES = [
+    "What's the forecast for next 5 days for Redmond,WA?",
+    "How is Contoso's stock doing today?",
+    "Add 1234 and 4321.",
+    "Summarize the HR policy for my direct report.",
+]
+
+
+def percentiles(values: list[float]) -> dict:
+    """p50/p95/p99, mean and max of the values (nearest rank)."""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "p50": rank(0.50),
+        "p95": rank(0.95),
+        "p99": rank(0.99),
+        "mean": sum(ordered) / len(ordered),
+        "max": ordered[-1],
+    }
+
+
+async def read_sse(response: httpx.Response) -> AsyncIterator[dict]:
+    async for line in response.aiter_lines():
+        if line.startswith("data:"):
+            payload = line[5:].strip()
+            if payload and payload != "ALIVE":
+                yield json.loads(payload)
+
+
+class LoadTestResults:
+    """Measurements collected by all simulated users."""
+
+    def __init__(self):
+        self.session_setup_ms: list[float] = []
+        self.ttft_ms: list[float] = []
+        self.latency_ms: list[float] = []
+        self.frame_rates: list[float] = []
+        self.frames = 0
+        self.messages = 0
+        self.errors: list[str] = []
+
+
+class SimulatedUser:
+    """One browser session: heartbeat, load events, then a sequence of chat messages."""
+
+    def __init__(
+        self, client: httpx.AsyncClient, name: str, dependencies: dict[str, dict]
+    ):
+        self.client = client
+        self.name = name
+        self.dependencies = dependencies
+        self.session_hash = uuid.uuid4().hex[:11]
+        self.headers = {"X-Load-Test-User": name}
+
+    async def call(self, api_name: str, data: list) -> tuple[bool, list[float], float]:
+        """Run an event through the Gradio queue; returns success, frame times and total time."""
+        dependency = self.dependencies[api_name]
+        start = time.perf_counter()
+        response = await self.client.post(
+            f"{API_PREFIX}/queue/join",
+            headers=self.headers,
+            json={
+                "data": data,
+                "event_data": None,
+                "fn_index": dependency["id"],
+                "trigger_id": dependency["targets"][0][0],
+                "session_hash": self.session_hash,
+            },
+        )
+        response.raise_for_status()
+
+        frames: list[float] = []
+        success = False
+        async with self.client.stream(
+            "GET",
+            f"{API_PREFIX}/queue/data",
+            headers=self.headers,
+            params={"session_hash": self.session_hash},
+        ) as stream:
+            async for message in read_sse(stream):
+                kind = message.get("msg")
+                if kind == "process_generating":
+                    frames.append(time.perf_counter() - start)
+                elif kind == "process_completed":
+                    success = bool(message.get("success"))
+                elif kind in ("close_stream", "unexpected_error"):
+                    break
+        return success, frames, time.perf_counter() - start
+
+    async def heartbeat(self) -> None:
+        # Closing this connection is what triggers the app's unload handler
+        async with self.client.stream(
+            "GET", f"{API_PREFIX}/heartbeat/{self.session_hash}", headers=self.headers
+        ) as stream:
+            async for _ in stream.aiter_lines():
+                pass
+
+    async def run(
+        self, results: LoadTestResults, messages: int, think_time: float
+    ) -> None:
+        heartbeat = asyncio.create_task(self.heartbeat())
+        try:
+            start = time.perf_counter()
+            for api_name in ("get_user", "set_enterprise_chat"):
+                success, _, _ = await self.call(api_name, [])
+                if not success:
+                    results.errors.append(f"{self.name}: {api_name} failed")
+                    return
+            results.session_setup_ms.append((time.perf_counter() - start) * 1000)
+
+            for _ in range(messages):
+                text = random.choice(MESSAGES)
+                success, frames, elapsed = await self.call(
+                    "chat_with_agent", [{"text": text, "files": []}, []]
+                )
+                results.messages += 1
+                results.frames += len(frames)
+                if not success:
+                    results.errors.append(f"{self.name}: chat_with_agent failed")
+                    continue
+                results.latency_ms.append(elapsed * 1000)
+                # The first frame is the "Thinking.." placeholder
+                if len(frames) > 1:
+                    results.ttft_ms.append(frames[1] * 1000)
+                if len(frames) > 2 and frames[-1] > frames[1]:
+                    results.frame_rates.append(
+                        (len(frames) - 2) / (frames[-1] - frames[1])
+                    )
+                await asyncio.sleep(think_time)
+        except Exception as e:
+            results.errors.append(f"{self.name}: {type(e).__name__}: {e}")
+        finally:
+            heartbeat.cancel()
+
+
+class ServerMonitor:
+    """Samples CPU and RSS of the server process (Linux /proc) and probes /health."""
+
+    def __init__(self, client: httpx.AsyncClient, pid: Optional[int]):
+        self.client = client
+        self.pid = pid
+        self.cpu_percent: list[float] = []
+        self.rss_mb: list[float] = []
+        self.health_ms: list[float] = []
+        self._clock_ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def _read_proc(self) -> Optional[tuple[float, float]]:
+        """CPU seconds and RSS in MB of the server process."""
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{self.pid}/status") as f:
+                rss_kb = next(
+                    int(line.split()[1]) for line in f if line.startswith("VmRSS:")
+                )
+        except (OSError, StopIteration, IndexError, ValueError):
+            return None
+        # utime and stime are fields 14 and 15 of /proc/<pid>/stat
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / self._clock_ticks
+        return cpu_seconds, rss_kb / 1024
+
+    def rss(self) -> Optional[float]:
+        sample = self._read_proc() if self.pid else None
+        return sample[1] if sample else None
+
+    async def sample_resources(self, interval: float = 0.5) -> None:
+        if not self.pid:
+            return
+        previous = self._read_proc()
+        previous_time = time.perf_counter()
+        while True:
+            await asyncio.sleep(interval)
+            sample = self._read_proc()
+            now = time.perf_counter()
+            if sample and previous:
+                self.cpu_percent.append(
+                    (sample[0] - previous[0]) / (now - previous_time) * 100
+                )
+                self.rss_mb.append(sample[1])
+            previous, previous_time = sample, now
+
+    async def probe_health(self, interval: float = 0.1) -> None:
+        while True:
+            start = time.perf_counter()
+            try:
+                await self.client.get("/health")
+                self.health_ms.append((time.perf_counter() - start) * 1000)
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(interval)
+
+
+def start_server(args) -> tuple[str, list[subprocess.Popen]]:
+    """Start the emulator and the app as subprocesses; returns the app URL."""
+    emulator = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "agent_service_emulator",
+            "--port",
+            str(args.emulator_port),
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    env = {
+        **os.environ,
+        "AGENT_SERVICE_EMULATOR_URL": f"http://127.0.0.1:{args.emulator_port}",
+    }
+    env.setdefault("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME", "emulator")
+    if args.gradio_concurrency:
+        env["GRADIO_CONCURRENCY_LIMIT"] = str(args.gradio_concurrency)
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "benchmarks.load_test_app:app",
+            "--port",
+            str(args.port),
+            "--log-level",
+            "warning",
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=None if args.verbose else subprocess.DEVNULL,
+    )
+    return f"http://127.0.0.1:{args.port}", [server, emulator]
+
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.5)
+    raise TimeoutError("The app did not become ready")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_load_test(args, url: str, pid: Optional[int]) -> dict:
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    timeout = httpx.Timeout(args.timeout)
+    async with httpx.AsyncClient(
+        base_url=url, limits=limits, timeout=timeout
+    ) as client:
+        await wait_until_ready(client)
+        config = (await client.get("/config")).json()
+        dependencies = {
+            d["api_name"]: d for d in config["dependencies"] if d.get("api_name")
+        }
+
+        monitor = ServerMonitor(client, pid)
+        baseline_rss = monitor.rss()
+        monitor_tasks = [
+            asyncio.create_task(monitor.sample_resources()),
+            asyncio.create_task(monitor.probe_health()),
+        ]
+
+        results = LoadTestResults()
+        users = [
+            SimulatedUser(client, f"user-{i}", dependencies) for i in range(args.users)
+        ]
+
+        async def start_user(i: int, user: SimulatedUser) -> None:
+            await asyncio.sleep(args.ramp_up * i / max(1, args.users))
+            await user.run(results, args.messages, args.think_time)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(start_user(i, u) for i, u in enumerate(users)))
+        duration = time.perf_counter() - start
+        peak_rss = max(monitor.rss_mb, default=None)
+
+        for task in monitor_tasks:
+            task.cancel()
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "users": args.users,
+            "messages_per_user": args.messages,
+            "ramp_up_seconds": args.ramp_up,
+            "think_time_seconds": args.think_time,
+            "gradio_concurrency": args.gradio_concurrency
+            or os.getenv("GRADIO_CONCURRENCY_LIMIT"),
+            "emulator": {
+                k: v for k, v in os.environ.items() if k.startswith("EMULATOR_")
+            },
+        },
+        "duration_seconds": duration,
+        "messages": results.messages,
+        "messages_per_second": results.messages / duration if duration else 0,
+        "frames": results.frames,
+        "errors": len(results.errors),
+        "error_samples": results.errors[:10],
+        "session_setup_ms": percentiles(results.session_setup_ms),
+        "ttft_ms": percentiles(results.ttft_ms),
+        "latency_ms": percentiles(results.latency_ms),
+        "frame_rate_per_second": percentiles(results.frame_rates),
+        "loop_lag_ms": percentiles(monitor.health_ms),
+        "server": {
+            "cpu_percent": percentiles(monitor.cpu_percent),
+            "rss_mb_baseline": baseline_rss,
+            "rss_mb_peak": peak_rss,
+            "rss_mb_per_session": (
+                (peak_rss - baseline_rss) / args.users
+                if peak_rss and baseline_rss
+                else None
+            ),
+        },
+    }
+
+
+def print_summary(report: dict) -> None:
+    def line(label: str, stats: dict, unit: str) -> None:
+        if not stats.get("count"):
+            print(f"{label:<24} n/a")
+            return
+        print(
+            f"{label:<24} p50 {stats['p50']:>9.1f}  p95 {stats['p95']:>9.1f}"
+            f"  p99 {stats['p99']:>9.1f} {unit}"
+        )
+
+    print(
+        f"{report['messages']} messages in {report['duration_seconds']:.1f}s"
+        f" ({report['messages_per_second']:.2f}/s), {report['errors']} errors"
+    )
+    line("session setup", report["session_setup_ms"], "ms")
+    line("time to first token", report["ttft_ms"], "ms")
+    line("message latency", report["latency_ms"], "ms")
+    line("frame rate", report["frame_rate_per_second"], "frames/s")
+    line("loop lag (/health)", report["loop_lag_ms"], "ms")
+    line("server CPU", report["server"]["cpu_percent"], "%")
+    server = report["server"]
+    if server["rss_mb_peak"]:
+        print(
+            f"{'server RSS':<24} baseline {server['rss_mb_baseline']:.1f} MB,"
+            f" peak {server['rss_mb_peak']:.1f} MB,"
+            f" {server['rss_mb_per_session'] or 0:.2f} MB per session"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=3, help="messages per user")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="seconds")
+    parser.add_argument("--think-time", type=float, default=1.0, help="seconds")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds")
+    parser.add_argument(
+        "--url", help="load test a running server instead of starting one"
+    )
+    parser.add_argument("--pid", type=int, help="server process id, with --url")
+    parser.add_argument("--port", type=int, default=8511)
+    parser.add_argument("--emulator-port", type=int, default=8590)
+    parser.add_argument(
+        "--gradio-concurrency", type=int, help="sets GRADIO_CONCURRENCY_LIMIT"
+    )
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--verbose", action="store_true", help="show server errors")
+    args = parser.parse_args()
+
+    processes: list[subprocess.Popen] = []
+    if args.url:
+        url, pid = args.url, args.pid
+    else:
+        url, processes = start_server(args)
+        pid = processes[0].pid
+    try:
+        report = asyncio.run(run_load_test(args, url, pid))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=10)
+
+    print_summary(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
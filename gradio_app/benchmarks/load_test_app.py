@@ -0,0 +1,56 @@
+"""
+The app with the Azure AD login replaced, for load tests only:
+    AGENT_SERVICE_EMULATOR_URL=http://127.0.0.1:8590 uvicorn benchmarks.load_test_app:app
+
+Every request is accepted as the user named in its X-Load-Test-User header. So
+that it can never expose real users' threads, it refuses to start without the
+agent service emulator and only accepts requests from loopback addresses.
+"""
+
+import ipaddress
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from fastapi import Request
+
+from auth_msal import override_current_user
+
+logger = logging.getLogger(__name__)
+
+if not os.getenv("AGENT_SERVICE_EMULATOR_URL"):
+    raise RuntimeError(
+        "benchmarks.load_test_app disables authentication and only runs against"
+        " the agent service emulator; set AGENT_SERVICE_EMULATOR_URL"
+    )
+
+
+def is_loopback(request: Request) -> bool:
+    if not request.client:
+        return False
+    try:
+        return ipaddress.ip_address(request.client.host).is_loopback
+    except ValueError:
+        return False
+
+
+def load_test_user(request: Request) -> Optional[Dict[str, Any]]:
+    """The user named by the X-Load-Test-User header, for local clients only."""
+    if not is_loopback(request):
+        logger.warning(f"Rejected load test user from {request.client}")
+        return None
+    name = request.headers.get("X-Load-Test-User", "load-test-user")
+    return {
+        "id": name,
+        "name": name,
+        "email": f"{name}@load.test",
+        "tenant_id": None,
+        "roles": [],
+        "groups": [],
+    }
+
+
+override_current_user(load_test_user)
+logger.warning("Load test app: authentication is replaced by X-Load-Test-User")
+
+from main import app  # noqa: E402
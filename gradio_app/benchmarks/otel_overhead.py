@@ -0,0 +1,235 @@
+"""
+Microbenchmark of the per-span and per-log-record telemetry overhead.
+
+Run from the gradio_app folder:
+    python -m benchmarks.otel_overhead [--iterations 100000]
+
+Exporters are replaced by no-op exporters, so the numbers show the cost paid on
+the request path (sampling, span processors, logging filters), not network time.
+"""
+
+import argparse
+import logging
+import time
+from typing import Sequence
+
+import otel_setup
+from opentelemetry import trace
+from opentelemetry.sdk._logs import LoggerProvider, LoggingHandler
+from opentelemetry.sdk._logs.export import LogExporter, LogExportResult
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.sampling import ALWAYS_ON, ParentBased, TraceIdRatioBased
+
+from otel_processors import (
+    BoundedBatchLogRecordProcessor,
+    BoundedBatchSpanProcessor,
+    NamespaceFilter,
+    TailSamplingSpanProcessor,
+)
+
+LOGGER_NAMES = [
+    "semantic_kernel.agents.azure_ai.agent_thread_actions",
+    "semantic_kernel.functions.kernel_plugin",
+    "semantic_kernel.prompt_template.kernel_prompt_template",
+    "semantic_kernel.kernel",
+    "workshop.agent.kernel_factory",
+    "azure.core.pipeline.policies.http_logging_policy",
+    "httpx",
+    "uvicorn.access",
+]
+
+EXCLUDED = [
+    "semantic_kernel.functions.kernel_plugin",
+    "semantic_kernel.prompt_template.kernel_prompt_template",
+]
+
+
+class NoOpSpanExporter(SpanExporter):
+    def export(self, spans: Sequence) -> SpanExportResult:
+        return SpanExportResult.SUCCESS
+
+
+class NoOpLogExporter(LogExporter):
+    def export(self, batch: Sequence) -> LogExportResult:
+        return LogExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        pass
+
+
+class ListKernelFilter(logging.Filter):
+    """The previous list-based filter, kept here as the baseline."""
+
+    def filter(self, record):
+        return not any([record.name.startswith(namespace) for namespace in EXCLUDED])
+
+
+def measure(label: str, iterations: int, fn) -> None:
+    start = time.perf_counter()
+    fn(iterations)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<52} {elapsed / iterations * 1e9:>10.0f} ns/op")
+
+
+def bench_filters(iterations: int) -> None:
+    records = [
+        logging.LogRecord(name, logging.INFO, __file__, 0, "message", None, None)
+        for name in LOGGER_NAMES
+    ]
+    prefix_filter = logging.Filter("semantic_kernel")
+    list_filter = ListKernelFilter()
+    trie_filter = NamespaceFilter(include=["semantic_kernel"], exclude=EXCLUDED)
+
+    def list_based(n):
+        for i in range(n):
+            record = records[i % len(records)]
+            prefix_filter.filter(record) and list_filter.filter(record)
+
+    def trie_based(n):
+        for i in range(n):
+            trie_filter.filter(records[i % len(records)])
+
+    measure("log filter: logging.Filter + list (before)", iterations, list_based)
+    measure("log filter: NamespaceFilter (after)", iterations, trie_based)
+
+
+def bench_spans(iterations: int) -> None:
+    def make_tracer(sampler, processor=None):
+        provider = TracerProvider(sampler=sampler)
+        if processor:
+            provider.add_span_processor(processor)
+        return provider.get_tracer(__name__)
+
+    def batch():
+        return BoundedBatchSpanProcessor(
+            NoOpSpanExporter(),
+            max_queue_size=8192,
+            schedule_delay_millis=2000,
+            max_export_batch_size=512,
+        )
+
+    tracers = [
+        ("span: no processor", make_tracer(ParentBased(ALWAYS_ON))),
+        ("span: batch processor", make_tracer(ParentBased(ALWAYS_ON), batch())),
+        (
+            "span: batch processor, 10% ratio sampling",
+            make_tracer(ParentBased(TraceIdRatioBased(0.1)), batch()),
+        ),
+        (
+            "span: tail sampling (10%) + batch processor",
+            make_tracer(
+                ParentBased(ALWAYS_ON),
+                TailSamplingSpanProcessor(batch(), sample_ratio=0.1),
+            ),
+        ),
+    ]
+    for label, tracer in tracers:
+
+        def run(n, tracer=tracer):
+            for _ in range(n):
+                with tracer.start_as_current_span("root"):
+                    with tracer.start_as_current_span("child"):
+                        pass
+
+        # Two spans per iteration
+        measure(f"{label} (2 spans)", iterations, run)
+
+
+def bench_get_span(iterations: int) -> None:
+    provider = TracerProvider(sampler=ParentBased(ALWAYS_ON))
+    provider.add_span_processor(
+        BoundedBatchSpanProcessor(
+            NoOpSpanExporter(),
+            max_queue_size=8192,
+            schedule_delay_millis=2000,
+            max_export_batch_size=512,
+        )
+    )
+    trace.set_tracer_provider(provider)
+    root_tracer = provider.get_tracer(__name__)
+    unsampled = trace.NonRecordingSpan(
+        trace.SpanContext(
+            trace_id=1,
+            span_id=1,
+            is_remote=False,
+            trace_flags=trace.TraceFlags(trace.TraceFlags.DEFAULT),
+        )
+    )
+
+    def uncached(n):
+        # The previous get_span: a tracer lookup on every call
+        with root_tracer.start_as_current_span("root"):
+            for _ in range(n):
+                with trace.get_tracer(__name__).start_as_current_span("child"):
+                    pass
+
+    def cached(n):
+        with root_tracer.start_as_current_span("root"):
+            for _ in range(n):
+                with otel_setup.get_span("child"):
+                    pass
+
+    def unsampled_parent(n):
+        with trace.use_span(unsampled):
+            for _ in range(n):
+                with otel_setup.get_span("child"):
+                    pass
+
+    otel_setup._tracing_enabled = True
+    measure("get_span: tracer lookup per call (before)", iterations, uncached)
+    measure("get_span: cached tracer (after)", iterations, cached)
+    measure("get_span: unsampled parent (after)", iterations, unsampled_parent)
+    otel_setup._tracing_enabled = False
+    measure("get_span: no exporter configured (after)", iterations, cached)
+
+
+def bench_log_records(iterations: int) -> None:
+    provider = LoggerProvider()
+    provider.add_log_record_processor(
+        BoundedBatchLogRecordProcessor(
+            NoOpLogExporter(),
+            max_queue_size=8192,
+            schedule_delay_millis=2000,
+            max_export_batch_size=512,
+        )
+    )
+    handler = LoggingHandler(logger_provider=provider)
+    handler.addFilter(NamespaceFilter(include=["semantic_kernel"], exclude=EXCLUDED))
+    exported = logging.getLogger("semantic_kernel.benchmark")
+    filtered = logging.getLogger("workshop.agent.benchmark")
+    for logger in (exported, filtered):
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+    def run_exported(n):
+        for _ in range(n):
+            exported.info("message")
+
+    def run_filtered(n):
+        for _ in range(n):
+            filtered.info("message")
+
+    def run_below_level(n):
+        for _ in range(n):
+            exported.debug("message")
+
+    measure("log record: exported", iterations, run_exported)
+    measure("log record: rejected by namespace filter", iterations, run_filtered)
+    measure("log record: below logger level", iterations, run_below_level)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=100_000)
+    args = parser.parse_args()
+
+    bench_filters(args.iterations)
+    bench_spans(args.iterations // 10)
+    bench_get_span(args.iterations // 10)
+    bench_log_records(args.iterations // 10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Cold-start benchmark and import-time audit of the Gradio app.
+
+Every run starts fresh interpreters, so nothing is cached in-process:
+
+- `python -X importtime -c "import main"`, parsed into a per-module report
+- `uvicorn main:app`, timed until /health answers
+
+Modules that are loaded on first use (LAZY_MODULES) must not show up in the
+import of `main`. requests is imported by gradio itself, and msal by
+azure.identity, so they are not listed. PIL and NumPy are regular imports of
+agent_chat and response_cache.
+
+Run from the gradio_app folder:
+    python -m benchmarks.startup --runs 5 --output startup.json
+
+and in CI, against a report saved from a good commit:
+    python -m benchmarks.startup --baseline startup.json --max-regression 0.2
+
+The exit status is 1 when a lazy module is imported at startup, or when the
+median import or ready time exceeds the baseline by more than --max-regression
+(or --budget-seconds, when given).
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import NamedTuple
+
+import httpx
+
+from benchmarks.load_test import git_commit
+
+# Modules the app imports only when a feature needs them
+LAZY_MODULES = [
+    "azure.monitor.opentelemetry.exporter",  # APPLICATIONINSIGHTS_CONNECTION_STRING
+    "agent_service_emulator",  # AGENT_SERVICE_EMULATOR_URL
+    "jwt",  # Entra ID login
+]
+
+_IMPORT_TIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+class ModuleImport(NamedTuple):
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def startup_env() -> dict:
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    env.setdefault("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME", "emulator")
+    return env
+
+
+def import_profile(module: str = "main") -> tuple[float, list[ModuleImport]]:
+    """Wall time of importing `module` in a new interpreter, and its -X importtime."""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=startup_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    elapsed = time.perf_counter() - started
+    imports = [
+        ModuleImport(name, int(self_us), int(cumulative_us), len(indent) // 2)
+        for self_us, cumulative_us, indent, name in _IMPORT_TIME.findall(result.stderr)
+    ]
+    return elapsed, imports
+
+
+def time_to_ready(port: int, timeout: float = 120) -> float:
+    """Seconds from starting `uvicorn main:app` until /health answers."""
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        env=startup_env(),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with {server.returncode}")
+            try:
+                response = httpx.get(f"http://127.0.0.1:{port}/health", timeout=1)
+                if response.status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.05)
+        raise TimeoutError("The app did not become ready")
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def summarize(values: list[float]) -> dict:
+    return {
+        "runs": len(values),
+        "median": statistics.median(values),
+        "min": min(values),
+        "max": max(values),
+    }
+
+
+def run_benchmark(args) -> dict:
+    import_seconds: list[float] = []
+    ready_seconds: list[float] = []
+    imports: list[ModuleImport] = []
+    for _ in range(args.runs):
+        elapsed, imports = import_profile()
+        import_seconds.append(elapsed)
+        if not args.skip_server:
+            ready_seconds.append(time_to_ready(args.port))
+
+    imported = {m.name for m in imports}
+    top_level = sorted(
+        (m for m in imports if m.depth <= args.depth),
+        key=lambda m: m.cumulative_us,
+        reverse=True,
+    )
+    return {
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "import_seconds": summarize(import_seconds),
+        "ready_seconds": summarize(ready_seconds) if ready_seconds else None,
+        "eager_lazy_modules": [m for m in LAZY_MODULES if m in imported],
+        "slowest_imports": [
+            {
+                "module": m.name,
+                "cumulative_ms": m.cumulative_us / 1000,
+                "self_ms": m.self_us / 1000,
+            }
+            for m in top_level[: args.top]
+        ],
+    }
+
+
+def check_regressions(report: dict, args) -> list[str]:
+    """Reasons to fail the run."""
+    failures = [
+        f"{module} is imported at startup but should be loaded lazily"
+        for module in report["eager_lazy_modules"]
+    ]
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    for key in ("import_seconds", "ready_seconds"):
+        if not report[key]:
+            continue
+        median = report[key]["median"]
+        if args.budget_seconds and key == "import_seconds":
+            if median > args.budget_seconds:
+                failures.append(
+                    f"import of main took {median:.2f}s,"
+                    f" over the {args.budget_seconds:.2f}s budget"
+                )
+        if baseline and baseline.get(key):
+            limit = baseline[key]["median"] * (1 + args.max_regression)
+            if median > limit:
+                failures.append(
+                    f"{key} median {median:.2f}s exceeds baseline"
+                    f" {baseline[key]['median']:.2f}s"
+                    f" (commit {baseline.get('git_commit')}) by more than"
+                    f" {args.max_regression:.0%}"
+                )
+    return failures
+
+
+def print_summary(report: dict) -> None:
+    for label, key in (("import main", "import_seconds"), ("ready", "ready_seconds")):
+        stats = report[key]
+        if stats:
+            print(
+                f"{label:<16} median {stats['median']:.2f}s"
+                f"  min {stats['min']:.2f}s  max {stats['max']:.2f}s"
+                f"  ({stats['runs']} runs)"
+            )
+    print("Slowest imports (cumulative):")
+    for item in report["slowest_imports"]:
+        print(
+            f"  {item['cumulative_ms']:>9.1f} ms  {item['module']}"
+            f" (self {item['self_ms']:.1f} ms)"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8521)
+    parser.add_argument(
+        "--skip-server", action="store_true", help="only time the import of main"
+    )
+    parser.add_argument("--top", type=int, default=20, help="slowest imports listed")
+    parser.add_argument(
+        "--depth", type=int, default=2, help="nesting depth of listed imports"
+    )
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    parser.add_argument("--budget-seconds", type=float, help="import time budget")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    print_summary(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+    failures = check_regressions(report, args)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Context management for agent threads: a sliding window of recent messages plus a
+rolling summary of the older ones.
+
+Agent threads keep every message, and by default each run sends all of them to
+the model, so prompt tokens grow with every turn. With CONTEXT_WINDOW_MESSAGES
+set, runs only send the last CONTEXT_WINDOW_MESSAGES messages of the thread
+(`last_messages` truncation). Messages that slide out of the window are folded
+into a summary of at most CONTEXT_SUMMARY_MAX_CHARS characters, passed to the
+next runs as additional instructions. The thread itself is left untouched, so
+the full history is still shown after a page reload.
+
+The summary is written by the CONTEXT_SUMMARY_DEPLOYMENT model when set (a
+cheaper deployment on AZURE_OPENAI_ENDPOINT), otherwise by a local extractive
+summarizer. It is updated in the background after each run and kept in the
+shared state store, so other workers continue with it.
+
+Prompt and completion tokens of every run are recorded on the
+`workshop.agent.prompt_tokens` and `workshop.agent.completion_tokens` histograms
+whether or not a window is set.
+"""
+
+import asyncio
+import logging
+import os
+import re
+from collections import Counter
+from typing import Optional
+
+from azure.ai.agents.models import ListSortOrder, TruncationObject
+from azure.ai.projects.aio import AIProjectClient
+
+from agent_metrics import completion_tokens, prompt_tokens
+from state_store import get_state_store
+
+logger = logging.getLogger(f"workshop.agent.{__name__}")
+
+# Messages sent to the model per run; 0 sends the whole thread
+CONTEXT_WINDOW_MESSAGES = int(os.getenv("CONTEXT_WINDOW_MESSAGES", "0"))
+# Length limit of the rolling summary of the messages before the window
+CONTEXT_SUMMARY_MAX_CHARS = int(os.getenv("CONTEXT_SUMMARY_MAX_CHARS", "2000"))
+# Chat deployment writing the summary; empty uses the local extractive summarizer
+CONTEXT_SUMMARY_DEPLOYMENT = os.getenv("CONTEXT_SUMMARY_DEPLOYMENT", "")
+# Summaries live as long as the threads they belong to
+CONTEXT_SUMMARY_TTL = int(os.getenv("USER_THREAD_TTL_SECONDS", "2592000"))
+
+SUMMARY_INSTRUCTIONS = (
+    "Summary of the earlier conversation, whose messages are no longer included:\n"
+)
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s+|\n+")
+_WORD = re.compile(r"[a-z0-9][a-z0-9'-]{3,}")
+
+
+def extractive_summary(previous: str, messages: list[tuple[str, str]]) -> str:
+    """
+    Summarize without a model: keep the sentences of the previous summary and the
+    new messages whose words are most frequent overall, in their original order,
+    up to CONTEXT_SUMMARY_MAX_CHARS.
+    """
+    sentences = [s.strip() for s in _SENTENCE.split(previous) if s.strip()]
+    for role, text in messages:
+        sentences.extend(
+            f"{role.capitalize()}: {s.strip()}"
+            for s in _SENTENCE.split(text)
+            if s.strip()
+        )
+    frequencies = Counter(
+        word for sentence in sentences for word in _WORD.findall(sentence.lower())
+    )
+
+    def score(sentence: str) -> float:
+        words = _WORD.findall(sentence.lower())
+        return sum(frequencies[word] for word in words) / (len(words) or 1) ** 0.5
+
+    ranked = sorted(range(len(sentences)), key=lambda i: -score(sentences[i]))
+    kept, length = set(), 0
+    for i in ranked:
+        if length + len(sentences[i]) + 1 > CONTEXT_SUMMARY_MAX_CHARS:
+            continue
+        kept.add(i)
+        length += len(sentences[i]) + 1
+    return "\n".join(sentences[i] for i in sorted(kept))
+
+
+class ModelSummarizer:
+    """Summarizes with a (cheaper) chat deployment through Semantic Kernel."""
+
+    def __init__(self, deployment_name: str):
+        # Imported here: agent_factory sets up telemetry on import
+        from agent_factory import azure_openai_credentials
+        from semantic_kernel.connectors.ai.open_ai import (
+            AzureChatCompletion,
+            AzureChatPromptExecutionSettings,
+        )
+
+        self.service = AzureChatCompletion(
+            deployment_name=deployment_name, **azure_openai_credentials()
+        )
+        self.settings = AzureChatPromptExecutionSettings(
+            max_tokens=CONTEXT_SUMMARY_MAX_CHARS // 4
+        )
+
+    async def __call__(self, previous: str, messages: list[tuple[str, str]]) -> str:
+        from semantic_kernel.contents import ChatHistory
+
+        history = ChatHistory(
+            system_message=(
+                "Update the summary of a conversation between a user and an "
+                "assistant with the new messages. Keep facts, names, numbers, "
+                "decisions and open questions; drop small talk. Answer with the "
+                f"summary only, in less than {CONTEXT_SUMMARY_MAX_CHARS} characters."
+            )
+        )
+        transcript = "\n".join(f"{role}: {text}" for role, text in messages)
+        history.add_user_message(
+            f"Current summary:\n{previous or '(none)'}\n\nNew messages:\n{transcript}"
+        )
+        result = await self.service.get_chat_message_content(history, self.settings)
+        return str(result)[:CONTEXT_SUMMARY_MAX_CHARS]
+
+
+_summarizer: Optional[ModelSummarizer] = None
+
+
+async def summarize(previous: str, messages: list[tuple[str, str]]) -> str:
+    """Fold messages into the summary, falling back to the extractive summarizer."""
+    global _summarizer
+    if CONTEXT_SUMMARY_DEPLOYMENT:
+        try:
+            if _summarizer is None:
+                _summarizer = ModelSummarizer(CONTEXT_SUMMARY_DEPLOYMENT)
+            return await _summarizer(previous, messages)
+        except Exception as e:
+            logger.warning(f"Summary model failed, summarizing locally: {str(e)}")
+    return extractive_summary(previous, messages)
+
+
+class ContextWindow:
+    """The window and rolling summary of one agent thread."""
+
+    __slots__ = ("thread_id", "summary", "summarized_through", "_loaded", "_update")
+
+    def __init__(self, thread_id: str):
+        self.thread_id = thread_id
+        self.summary = ""
+        # Id of the newest message folded into the summary
+        self.summarized_through: Optional[str] = None
+        self._loaded = False
+        self._update: Optional[asyncio.Task] = None
+
+    @property
+    def state_key(self) -> str:
+        return f"summary:{self.thread_id}"
+
+    async def run_options(self) -> dict:
+        """Keyword arguments for `invoke_stream` limiting what the run sends."""
+        if CONTEXT_WINDOW_MESSAGES <= 0:
+            return {}
+        if self._update is not None:
+            # The summary of the previous turn is usually done by now
+            await asyncio.shield(self._update)
+        if not self._loaded:
+            state = await get_state_store().get(self.state_key)
+            if state:
+                self.summary = state["summary"]
+                self.summarized_through = state["summarized_through"]
+            self._loaded = True
+
+        options = {
+            "truncation_strategy": TruncationObject(
+                type="last_messages", last_messages=CONTEXT_WINDOW_MESSAGES
+            )
+        }
+        if self.summary:
+            options["additional_instructions"] = SUMMARY_INSTRUCTIONS + self.summary
+        return options
+
+    def after_run(self, client: AIProjectClient, agent_name: str) -> None:
+        """Record the run's token usage and update the summary in the background."""
+        self._update = asyncio.create_task(self._after_run(client, agent_name))
+
+    async def _after_run(self, client: AIProjectClient, agent_name: str) -> None:
+        try:
+            await self._record_usage(client, agent_name)
+            if CONTEXT_WINDOW_MESSAGES > 0:
+                await self._fold_old_messages(client)
+        except Exception as e:
+            logger.warning(f"Context update of thread {self.thread_id} failed: {e}")
+
+    async def _record_usage(self, client: AIProjectClient, agent_name: str) -> None:
+        runs = client.agents.runs.list(
+            thread_id=self.thread_id, limit=1, order=ListSortOrder.DESCENDING
+        )
+        run = await anext(aiter(runs), None)
+        if run is None or run.usage is None:
+            return
+        attributes = {"agent": agent_name, "windowed": CONTEXT_WINDOW_MESSAGES > 0}
+        prompt_tokens.record(run.usage.prompt_tokens, attributes)
+        completion_tokens.record(run.usage.completion_tokens, attributes)
+
+    async def _fold_old_messages(self, client: AIProjectClient) -> None:
+        # Newest first: skip the window, then collect down to the last summarized
+        old_messages = []
+        position = 0
+        async for message in client.agents.messages.list(
+            thread_id=self.thread_id, order=ListSortOrder.DESCENDING
+        ):
+            if message.id == self.summarized_through:
+                break
+            position += 1
+            if position > CONTEXT_WINDOW_MESSAGES:
+                old_messages.append(message)
+        if not old_messages:
+            return
+
+        texts = []
+        for message in reversed(old_messages):
+            text = "\n".join(content.text.value for content in message.text_messages)
+            if text:
+                role = "user" if message.role == "user" else "assistant"
+                texts.append((role, text))
+        self.summary = await summarize(self.summary, texts)
+        self.summarized_through = old_messages[0].id
+        await get_state_store().set(
+            self.state_key,
+            {"summary": self.summary, "summarized_through": self.summarized_through},
+            ttl=CONTEXT_SUMMARY_TTL,
+        )
+        logger.info(
+            f"Summarized {len(old_messages)} messages of thread {self.thread_id} "
+            f"into {len(self.summary)} characters"
+        )
@@ -1,10 +1,15 @@
 import asyncio
 import json
 import logging
+import os
+from typing import Optional
 from semantic_kernel.filters import AutoFunctionInvocationContext, FilterTypes
 from semantic_kernel import Kernel
 
 from otel_setup import get_span
+from tool_cache import create_tool_cache_filter
+from tool_concurrency import create_concurrency_filter
+from tool_resilience import create_resilience_filter
 
 logger = logging.getLogger(f"workshop.agent.{__name__}")
 logger.setLevel(logging.INFO)  # Ensure logger level allows INFO logs
@@ -13,7 +18,12 @@ logger.propagate = True  # Ensure propagation is enabled (default)
 
 class KernelFactory:
     @staticmethod
-    def create_kernel() -> Kernel:
+    def create_kernel(cache_scope: Optional[str] = None) -> Kernel:
+        """
+        Create a kernel with the workshop function invocation filters.
+
+        :param cache_scope: Scope (e.g. the user) for memoized per-user tool results.
+        """
         with get_span("create_kernel"):
 
             kernel = Kernel()
@@ -116,6 +126,23 @@ class KernelFactory:
                 FilterTypes.AUTO_FUNCTION_INVOCATION, auto_function_filter
             )
 
+            # Memoize results of functions marked cacheable or pure
+            if os.getenv("TOOL_CACHE_ENABLED", "true").lower() == "true":
+                kernel.add_filter(
+                    FilterTypes.AUTO_FUNCTION_INVOCATION,
+                    create_tool_cache_filter(scope=cache_scope),
+                )
+
+            # Deadlines and circuit breakers, before queuing for a concurrency slot
+            kernel.add_filter(
+                FilterTypes.AUTO_FUNCTION_INVOCATION, create_resilience_filter()
+            )
+
+            # Bound in-flight calls per plugin when the model fans out several calls
+            kernel.add_filter(
+                FilterTypes.AUTO_FUNCTION_INVOCATION, create_concurrency_filter()
+            )
+
             # Also add as regular function invocation filter for compatibility
             # kernel.add_filter(FilterTypes.FUNCTION_INVOCATION, auto_function_filter)
 
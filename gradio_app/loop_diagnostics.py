@@ -0,0 +1,215 @@
+"""
+Event loop lag monitor and blocking call detector.
+
+A heartbeat task on the event loop measures how late it wakes up (the loop lag).
+A watchdog thread notices when the heartbeat stops and captures the stack of the
+event loop thread, so the code blocking the loop is known even though the loop
+itself cannot report it until the blocking call returns. Each stall is recorded
+as a `event_loop.blocked` span, the `workshop.event_loop.*` metrics and a
+warning log, and is kept for the `/debug/loop` endpoint.
+
+Opt in with LOOP_DIAGNOSTICS_ENABLED=true; `LoopDiagnosticsMiddleware` starts the
+monitor on the first request and tracks in-flight requests for stall reports.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Optional
+
+from opentelemetry import metrics
+
+from otel_setup import get_tracer
+
+logger = logging.getLogger(f"workshop.agent.{__name__}")
+
+meter = metrics.get_meter(__name__)
+loop_lag = meter.create_histogram(
+    "workshop.event_loop.lag",
+    unit="s",
+    description="How late the event loop heartbeat woke up",
+)
+loop_blocked = meter.create_counter(
+    "workshop.event_loop.blocked",
+    description="Event loop stalls longer than the blocking threshold",
+)
+
+# Innermost frames of the loop thread kept in a stall report
+STACK_LIMIT = 25
+
+
+class LoopLagMonitor:
+    """
+    Measures event loop lag every `interval_seconds` and reports stalls of at
+    least `threshold_seconds` with the stack of the blocking code.
+    """
+
+    def __init__(
+        self,
+        interval_seconds: float = 0.1,
+        threshold_seconds: float = 0.25,
+        max_stalls: int = 50,
+        max_samples: int = 600,
+    ):
+        self.interval_seconds = interval_seconds
+        self.threshold_seconds = threshold_seconds
+        self.lags: deque[float] = deque(maxlen=max_samples)
+        self.stalls: deque[dict] = deque(maxlen=max_stalls)
+        # id -> (method and path, start time) of requests being served
+        self.in_flight: dict[int, tuple[str, float]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._captured: Optional[dict] = None
+        self._stopped = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """Start monitoring the running event loop (idempotent)."""
+        if self.running:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        threading.Thread(
+            target=self._watchdog, name="loop-watchdog", daemon=True
+        ).start()
+        logger.info(
+            f"Event loop diagnostics started (threshold {self.threshold_seconds * 1000:.0f}ms)"
+        )
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval_seconds
+            await asyncio.sleep(self.interval_seconds)
+            now = time.monotonic()
+            self._last_beat = now
+            lag = max(0.0, now - expected)
+            self.lags.append(lag)
+            loop_lag.record(lag)
+            if lag >= self.threshold_seconds:
+                self._record_stall(lag)
+
+    def _watchdog(self) -> None:
+        # Runs on its own thread, so it keeps running while the loop is blocked
+        while not self._stopped.wait(self.threshold_seconds / 4):
+            silent = time.monotonic() - self._last_beat
+            if silent < self.interval_seconds + self.threshold_seconds:
+                continue
+            if self._captured is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._captured = {
+                "stack": "".join(
+                    traceback.format_list(traceback.extract_stack(frame)[-STACK_LIMIT:])
+                ),
+                "requests": self._requests(),
+            }
+
+    def _requests(self) -> list[str]:
+        now = time.monotonic()
+        return [
+            f"{name} ({(now - started) * 1000:.0f}ms)"
+            for name, started in list(self.in_flight.values())
+        ]
+
+    def _record_stall(self, lag: float) -> None:
+        captured, self._captured = self._captured, None
+        stack = captured["stack"] if captured else None
+        requests = captured["requests"] if captured else self._requests()
+        stall = {
+            "started_at": time.time() - lag,
+            "duration_ms": round(lag * 1000, 1),
+            "requests": requests,
+            "stack": stack,
+        }
+        self.stalls.append(stall)
+        loop_blocked.add(1)
+        logger.warning(
+            f"Event loop blocked for {stall['duration_ms']}ms, in flight: {requests}"
+            + (f"\n{stack}" if stack else "")
+        )
+
+        end_ns = time.time_ns()
+        span = get_tracer().start_span(
+            "event_loop.blocked",
+            start_time=end_ns - int(lag * 1e9),
+            attributes={
+                "event_loop.blocked_ms": stall["duration_ms"],
+                "event_loop.requests": requests,
+                "event_loop.stack": stack or "",
+            },
+        )
+        span.end(end_time=end_ns)
+
+    def snapshot(self) -> dict:
+        """Current lag statistics, in-flight requests and recent stalls."""
+        lags = sorted(self.lags)
+
+        def percentile(p: float) -> Optional[float]:
+            if not lags:
+                return None
+            return round(lags[min(len(lags) - 1, int(p * (len(lags) - 1)))] * 1000, 2)
+
+        return {
+            "running": self.running,
+            "interval_ms": self.interval_seconds * 1000,
+            "threshold_ms": self.threshold_seconds * 1000,
+            "lag_ms": {
+                "samples": len(lags),
+                "p50": percentile(0.50),
+                "p99": percentile(0.99),
+                "max": round(lags[-1] * 1000, 2) if lags else None,
+            },
+            "in_flight": self._requests(),
+            "stalls": list(reversed(self.stalls)),
+        }
+
+
+loop_monitor = LoopLagMonitor(
+    interval_seconds=float(os.getenv("LOOP_LAG_INTERVAL_MS", "100")) / 1000,
+    threshold_seconds=float(os.getenv("LOOP_LAG_THRESHOLD_MS", "250")) / 1000,
+)
+
+
+class LoopDiagnosticsMiddleware:
+    """
+    ASGI middleware starting the loop monitor and tracking in-flight requests.
+    Pure ASGI rather than BaseHTTPMiddleware, so streamed responses pass through.
+    """
+
+    def __init__(self, app, monitor: LoopLagMonitor = loop_monitor):
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+
+        self.monitor.start()
+        key = id(scope)
+        self.monitor.in_flight[key] = (
+            f"{scope.get('method', 'WS')} {scope.get('path', '')}",
+            time.monotonic(),
+        )
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.monitor.in_flight.pop(key, None)
@@ -13,6 +13,9 @@ import os
 
 from dotenv import load_dotenv
 from auth_msal import get_msal_auth, get_current_user
+from loop_diagnostics import LoopDiagnosticsMiddleware, loop_monitor
+from state_store import get_state_store
+from thread_reaper import thread_reaper
 
 # Load environment variables from .env file at the start of your script
 load_dotenv()
@@ -25,20 +28,19 @@ app = FastAPI(title="Azure AI Agent Service", version="1.0.0")
 
 
 class SessionStore(ISessionBackend):
-    """Custom session store in-memory."""
+    """Session store backed by the shared state store (in-memory or Redis)."""
 
     def __init__(self):
-        self.sessions = {}
+        self.store = get_state_store()
 
     async def get(self, key: str) -> Optional[dict]:
-        return self.sessions.get(key) or {}
+        return await self.store.get(f"session:{key}") or {}
 
     async def set(self, key: str, value: dict, exp: Optional[int]) -> Optional[str]:
-        self.sessions[key] = value
+        await self.store.set(f"session:{key}", value, ttl=exp)
 
     async def delete(self, key: str) -> None:
-        if key in self.sessions:
-            del self.sessions[key]
+        await self.store.delete(f"session:{key}")
 
 
 # IMPORTANT: Add SessionMiddleware FIRST so request.session is always available
@@ -59,6 +61,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Delete the threads released by this replica before it exits
+app.add_event_handler("shutdown", thread_reaper.stop)
+
+# Opt-in event loop lag and blocking call detection, served on /debug/loop
+LOOP_DIAGNOSTICS_ENABLED = (
+    os.getenv("LOOP_DIAGNOSTICS_ENABLED", "false").lower() == "true"
+)
+if LOOP_DIAGNOSTICS_ENABLED:
+    app.add_middleware(LoopDiagnosticsMiddleware, monitor=loop_monitor)
+
 
 def get_user_name(request: Request) -> Optional[str]:
     """Get username for Gradio auth dependency."""
@@ -202,6 +214,17 @@ async def ready_check(request: Request):
     )
 
 
+@app.get("/debug/loop")
+async def debug_loop(request: Request):
+    """Event loop lag statistics and the stacks of recent stalls."""
+    if not LOOP_DIAGNOSTICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    # Stacks expose code paths, so only signed-in users can read them
+    if not get_current_user(request):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+    return JSONResponse(content=loop_monitor.snapshot())
+
+
 # Stack Overflow OAuth2.0 configuration
 STACKOVERFLOW_CLIENT_ID = os.environ.get("STACKOVERFLOW_CLIENT_ID", "YOUR_CLIENT_ID")
 STACKOVERFLOW_CLIENT_SECRET = os.environ.get(
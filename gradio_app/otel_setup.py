@@ -1,13 +1,10 @@
 # Copyright (c) Microsoft. All rights reserved.
 
+import functools
+import inspect
 import logging
 import os
 
-from azure.monitor.opentelemetry.exporter import (
-    AzureMonitorLogExporter,
-    AzureMonitorMetricExporter,
-    AzureMonitorTraceExporter,
-)
 from opentelemetry import trace
 from opentelemetry._logs import set_logger_provider
 
@@ -16,7 +13,7 @@ from opentelemetry._logs import set_logger_provider
 # from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
 from opentelemetry.metrics import set_meter_provider
 from opentelemetry.sdk._logs import LoggerProvider, LoggingHandler
-from opentelemetry.sdk._logs.export import BatchLogRecordProcessor, ConsoleLogExporter
+from opentelemetry.sdk._logs.export import ConsoleLogExporter
 from opentelemetry.sdk.metrics import MeterProvider
 from opentelemetry.sdk.metrics.export import (
     ConsoleMetricExporter,
@@ -25,10 +22,18 @@ from opentelemetry.sdk.metrics.export import (
 from opentelemetry.sdk.metrics.view import DropAggregation, View
 from opentelemetry.sdk.resources import Resource
 from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+from opentelemetry.sdk.trace.sampling import ALWAYS_ON, ParentBased, TraceIdRatioBased
 from opentelemetry.semconv.resource import ResourceAttributes
 from opentelemetry.trace import set_tracer_provider
 
+from otel_processors import (
+    BoundedBatchLogRecordProcessor,
+    BoundedBatchSpanProcessor,
+    NamespaceFilter,
+    TailSamplingSpanProcessor,
+)
+
 
 # Load settings
 class TelemetrySampleSettings:
@@ -38,6 +43,28 @@ class TelemetrySampleSettings:
         self.connection_string = os.getenv(
             "APPLICATIONINSIGHTS_CONNECTION_STRING", None
         )
+        # Fraction of traces to keep (parent-based, so a trace is kept or dropped as a whole)
+        self.sample_ratio = float(os.getenv("OTEL_TRACES_SAMPLE_RATIO", "1.0"))
+        # Tail sampling keeps every failed or slow trace on top of the sampled ratio
+        self.tail_sampling = (
+            os.getenv("OTEL_TAIL_SAMPLING_ENABLED", "false").lower() == "true"
+        )
+        self.tail_sampling_slow_ms = float(
+            os.getenv("OTEL_TAIL_SAMPLING_SLOW_MS", "5000")
+        )
+        # Batch export tuning (standard OTEL_BSP_* / OTEL_BLRP_* variable names)
+        self.span_queue_size = int(os.getenv("OTEL_BSP_MAX_QUEUE_SIZE", "8192"))
+        self.span_batch_size = int(os.getenv("OTEL_BSP_MAX_EXPORT_BATCH_SIZE", "512"))
+        self.span_schedule_delay_ms = float(
+            os.getenv("OTEL_BSP_SCHEDULE_DELAY", "2000")
+        )
+        self.log_queue_size = int(os.getenv("OTEL_BLRP_MAX_QUEUE_SIZE", "8192"))
+        self.log_batch_size = int(os.getenv("OTEL_BLRP_MAX_EXPORT_BATCH_SIZE", "512"))
+        self.log_schedule_delay_ms = float(
+            os.getenv("OTEL_BLRP_SCHEDULE_DELAY", "2000")
+        )
+        # Level of the root logger; NOTSET creates a record for every debug call
+        self.log_level = os.getenv("OTEL_LOG_LEVEL", "INFO").upper()
 
 
 # Create a resource to represent the service/sample
@@ -45,26 +72,22 @@ resource = Resource.create({ResourceAttributes.SERVICE_NAME: "TelemetryExample"}
 
 
 def set_up_logging():
-    class KernelFilter(logging.Filter):
-        """A filter to not process records from semantic_kernel."""
-
-        # These are the namespaces that we want to exclude from logging for the purposes of this demo.
-        namespaces_to_exclude: list[str] = [
+    # Only process records from semantic_kernel, except these namespaces that we want
+    # to exclude from logging for the purposes of this demo.
+    kernel_filter = NamespaceFilter(
+        include=["semantic_kernel"],
+        exclude=[
             "semantic_kernel.functions.kernel_plugin",
             "semantic_kernel.prompt_template.kernel_prompt_template",
-        ]
-
-        def filter(self, record):
-            return not any(
-                [
-                    record.name.startswith(namespace)
-                    for namespace in self.namespaces_to_exclude
-                ]
-            )
+        ],
+    )
 
     settings = TelemetrySampleSettings()
     exporters = []
     if settings.connection_string:
+        # The Azure Monitor exporters take a while to import; only load them when used
+        from azure.monitor.opentelemetry.exporter import AzureMonitorLogExporter
+
         exporters.append(
             AzureMonitorLogExporter(connection_string=settings.connection_string)
         )
@@ -76,47 +99,78 @@ def set_up_logging():
     # Log processors are initialized with an exporter which is responsible
     # for sending the telemetry data to a particular backend.
     for log_exporter in exporters:
-        logger_provider.add_log_record_processor(BatchLogRecordProcessor(log_exporter))
+        logger_provider.add_log_record_processor(
+            BoundedBatchLogRecordProcessor(
+                log_exporter,
+                max_queue_size=settings.log_queue_size,
+                schedule_delay_millis=settings.log_schedule_delay_ms,
+                max_export_batch_size=settings.log_batch_size,
+            )
+        )
     # Sets the global default logger provider
     set_logger_provider(logger_provider)
 
     # Create a logging handler to write logging records, in OTLP format, to the exporter.
     handler = LoggingHandler()
-    # Add filters to the handler to only process records from semantic_kernel.
-    handler.addFilter(logging.Filter("semantic_kernel"))
-    handler.addFilter(KernelFilter())
+    # Add a filter to the handler to only process records from semantic_kernel.
+    handler.addFilter(kernel_filter)
     # Attach the handler to the root logger. `getLogger()` with no arguments returns the root logger.
     # Events from all child loggers will be processed by this handler.
     logger = logging.getLogger()
     logger.addHandler(handler)
-    # Set the logging level to NOTSET to allow all records to be processed by the handler.
-    logger.setLevel(logging.NOTSET)
+    # Records below this level are never created, which keeps debug logging cheap under load.
+    logger.setLevel(settings.log_level)
 
 
 def set_up_tracing():
     exporters = []
     settings = TelemetrySampleSettings()
     if settings.connection_string:
+        from azure.monitor.opentelemetry.exporter import AzureMonitorTraceExporter
+
         exporters.append(
             AzureMonitorTraceExporter(connection_string=settings.connection_string)
         )
     if not exporters and os.getenv("CONSOLE_LOGGING", "false").lower() == "true":
         exporters.append(ConsoleSpanExporter())
 
+    # With tail sampling every span is recorded and the ratio is applied once the trace ends.
+    if settings.tail_sampling:
+        sampler = ParentBased(ALWAYS_ON)
+    else:
+        sampler = ParentBased(TraceIdRatioBased(settings.sample_ratio))
+
     # Initialize a trace provider for the application. This is a factory for creating tracers.
-    tracer_provider = TracerProvider(resource=resource)
+    tracer_provider = TracerProvider(resource=resource, sampler=sampler)
     # Span processors are initialized with an exporter which is responsible
     # for sending the telemetry data to a particular backend.
     for exporter in exporters:
-        tracer_provider.add_span_processor(BatchSpanProcessor(exporter))
+        processor = BoundedBatchSpanProcessor(
+            exporter,
+            max_queue_size=settings.span_queue_size,
+            schedule_delay_millis=settings.span_schedule_delay_ms,
+            max_export_batch_size=settings.span_batch_size,
+        )
+        if settings.tail_sampling:
+            processor = TailSamplingSpanProcessor(
+                processor,
+                sample_ratio=settings.sample_ratio,
+                slow_threshold_ms=settings.tail_sampling_slow_ms,
+            )
+        tracer_provider.add_span_processor(processor)
     # Sets the global default tracer provider
     set_tracer_provider(tracer_provider)
 
+    global _tracing_enabled
+    _tracing_enabled = bool(exporters)
+
 
 def set_up_metrics():
     exporters = []
     settings = TelemetrySampleSettings()
     if settings.connection_string:
+        from azure.monitor.opentelemetry.exporter import AzureMonitorMetricExporter
+
         exporters.append(
             AzureMonitorMetricExporter(connection_string=settings.connection_string)
         )
@@ -133,8 +187,10 @@ def set_up_metrics():
         resource=resource,
         views=[
             # Dropping all instrument names except for those starting with "semantic_kernel"
+            # and the app's own "workshop." instruments
             View(instrument_name="*", aggregation=DropAggregation()),
             View(instrument_name="semantic_kernel*"),
+            View(instrument_name="workshop.*"),
         ],
     )
     # Sets the global default meter provider
@@ -148,9 +204,80 @@ def setup_otel():
     set_up_metrics()
 
 
-def get_span(name: str):
-    """Get a span with the given name."""
-    tracer = trace.get_tracer(__name__)
-    current_span = tracer.start_as_current_span(name)
-    # print(f"Trace ID: {format_trace_id(current_span.get_span_context().trace_id)}")
-    return current_span
+# Tracer shared by all helpers; resolved once instead of on every get_span call.
+# Before a tracer provider is set this is a proxy that picks the provider up later.
+_tracer: trace.Tracer | None = None
+# Set by set_up_tracing; spans are not created when nothing would export them
+_tracing_enabled = False
+
+
+class _NonRecordingSpanContext:
+    """Reusable context manager standing in for a span that would not be recorded."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> trace.Span:
+        return trace.INVALID_SPAN
+
+    def __exit__(self, *exc_info) -> bool:
+        return False
+
+
+_NON_RECORDING_SPAN = _NonRecordingSpanContext()
+
+
+def get_tracer() -> trace.Tracer:
+    """Get the cached module tracer."""
+    global _tracer
+    if _tracer is None:
+        _tracer = trace.get_tracer(__name__)
+    return _tracer
+
+
+def _would_record() -> bool:
+    # Mirrors the parent-based sampler: a child of an unsampled span is always dropped
+    if not _tracing_enabled:
+        return False
+    parent = trace.get_current_span().get_span_context()
+    return not parent.is_valid or parent.trace_flags.sampled
+
+
+def get_span(name: str, attributes=None):
+    """
+    Get a context manager that starts a span with the given name as the current span.
+    When the span would not be recorded, a shared no-op context yielding a
+    non-recording span is returned instead, so no span or attribute dict is built.
+    Pass attributes that are expensive to compute via `span.set_attribute` after
+    checking `span.is_recording()`.
+    """
+    if not _would_record():
+        return _NON_RECORDING_SPAN
+    return get_tracer().start_as_current_span(name, attributes=attributes)
+
+
+def traced(name: str | None = None, attributes=None):
+    """
+    Decorator running a sync or async function inside `get_span`.
+    The attributes mapping is built once, at decoration time.
+    """
+
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with get_span(span_name, attributes):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_span(span_name, attributes):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,266 @@
+"""
+Cache of complete agent answers for standalone questions asked again and again
+(the chat examples, FAQs), so they do not cost a full agent run each time.
+
+Answers are keyed on the normalized question and a fingerprint of the agent's
+model, instructions, tools and plugins; changing the agent invalidates them.
+Only the first question of a conversation without files is cached, since later
+questions depend on what was said before. With RESPONSE_CACHE_EMBEDDING_DEPLOYMENT
+set, a question also matches a cached one whose embedding has a cosine
+similarity of at least RESPONSE_CACHE_SIMILARITY.
+
+How long an answer stays fresh depends on the tools the run used: the shortest
+of their RESPONSE_CACHE_TOOL_TTLS, or RESPONSE_CACHE_TTL_SECONDS for other tools
+and runs without tools. A TTL of 0 keeps answers using that tool out of the
+cache. Answers that called a kernel function marked `@cacheable(per_user=True)`
+hold one user's data and are never cached, whatever the TTLs say, and neither
+are answers naming the user. The user is named in each run's instructions, not
+in the agent's, so all users share one fingerprint. Hits are replayed as a
+stream.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Iterable, Optional
+
+import numpy as np
+from opentelemetry import metrics
+from semantic_kernel import Kernel
+from semantic_kernel.agents import AzureAIAgent
+from semantic_kernel.exceptions import (
+    KernelFunctionNotFoundError,
+    KernelPluginNotFoundError,
+)
+
+from tool_cache import get_cache_policy
+from tool_concurrency import parse_plugin_settings
+
+logger = logging.getLogger(f"workshop.agent.{__name__}")
+
+meter = metrics.get_meter(__name__)
+cache_hits = meter.create_counter(
+    "workshop.response_cache.hits",
+    description="Questions answered from the response cache, by match type",
+)
+cache_misses = meter.create_counter(
+    "workshop.response_cache.misses",
+    description="Cacheable questions that needed an agent run",
+)
+
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.]+$")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(text: str) -> str:
+    """Normalize a question so trivially different spellings share an entry."""
+    text = _WHITESPACE.sub(" ", text.strip().lower())
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+
+def agent_fingerprint(agent: AzureAIAgent) -> str:
+    """Hash of everything about the agent that shapes its answers."""
+    definition = agent.definition
+    plugins = sorted(
+        function.fully_qualified_name
+        for function in agent.kernel.get_full_list_of_function_metadata()
+    )
+    payload = json.dumps(
+        {
+            "model": definition.model,
+            "instructions": definition.instructions,
+            "tools": [tool.as_dict() for tool in definition.tools or []],
+            "plugins": plugins,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def is_per_user_function(kernel: Kernel, plugin_name: str, function_name: str) -> bool:
+    """Whether a kernel function's results belong to one user (`per_user=True`)."""
+    try:
+        function = kernel.get_function(plugin_name, function_name)
+    except (KernelFunctionNotFoundError, KernelPluginNotFoundError):
+        return False
+    policy = get_cache_policy(function)
+    return bool(policy and policy.per_user)
+
+
+class Embedder:
+    """Question embeddings from an Azure OpenAI embedding deployment."""
+
+    def __init__(self, deployment_name: str):
+        # Imported here: agent_factory sets up telemetry on import
+        from agent_factory import azure_openai_credentials
+        from semantic_kernel.connectors.ai.open_ai import AzureTextEmbedding
+
+        self.service = AzureTextEmbedding(
+            deployment_name=deployment_name, **azure_openai_credentials()
+        )
+
+    async def __call__(self, text: str) -> np.ndarray:
+        embedding = (await self.service.generate_embeddings([text]))[0]
+        return embedding / (np.linalg.norm(embedding) or 1.0)
+
+
+class ResponseCache:
+    """An LRU cache of answers with per-entry expiry and optional similarity matching."""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        max_entries: int = 512,
+        ttl_seconds: float = 3600.0,
+        tool_ttls: Optional[dict[str, float]] = None,
+        similarity: float = 0.92,
+        embedding_deployment: str = "",
+    ):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.tool_ttls = tool_ttls or {}
+        self.similarity = similarity
+        self.embedding_deployment = embedding_deployment
+        self._embedder: Optional[Embedder] = None
+        # key -> (expiry, fingerprint, question embedding or None, answer)
+        self._entries: OrderedDict[
+            str, tuple[float, str, Optional[np.ndarray], str]
+        ] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def ttl_for(self, tools: Iterable[str]) -> float:
+        """Freshness of an answer produced with the given tools; 0 is not cached."""
+        return min(
+            (self.tool_ttls.get(tool, self.ttl_seconds) for tool in tools),
+            default=self.ttl_seconds,
+        )
+
+    async def _embed(self, text: str) -> Optional[np.ndarray]:
+        if not self.embedding_deployment:
+            return None
+        try:
+            if self._embedder is None:
+                self._embedder = Embedder(self.embedding_deployment)
+            return await self._embedder(text)
+        except Exception as e:
+            logger.warning(f"Question embedding failed, matching exactly: {str(e)}")
+            return None
+
+    def _evict_expired(self) -> None:
+        now = time.monotonic()
+        for key in [k for k, entry in self._entries.items() if entry[0] < now]:
+            del self._entries[key]
+
+    async def get(self, question: str, fingerprint: str) -> Optional[str]:
+        """Return the cached answer to the question, if any."""
+        self._evict_expired()
+        key = f"{fingerprint}|{normalize_prompt(question)}"
+        entry = self._entries.get(key)
+        match = "exact"
+        if entry is not None:
+            self._entries.move_to_end(key)
+        elif self.embedding_deployment:
+            entry = await self._closest(question, fingerprint)
+            match = "similar"
+        if entry is None:
+            self.misses += 1
+            cache_misses.add(1)
+            return None
+        self.hits += 1
+        cache_hits.add(1, {"match": match})
+        return entry[3]
+
+    async def _closest(self, question: str, fingerprint: str):
+        candidates = [
+            (key, entry)
+            for key, entry in self._entries.items()
+            if entry[1] == fingerprint and entry[2] is not None
+        ]
+        if not candidates:
+            return None
+        embedding = await self._embed(question)
+        if embedding is None:
+            return None
+        scores = np.stack([entry[2] for _, entry in candidates]) @ embedding
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None
+        key, entry = candidates[best]
+        self._entries.move_to_end(key)
+        return entry
+
+    async def set(
+        self,
+        question: str,
+        fingerprint: str,
+        answer: str,
+        tools: Iterable[str] = (),
+        per_user: bool = False,
+    ) -> None:
+        """
+        Store the answer to a question, unless it used per-user data (`per_user`)
+        or one of its tools is never cached.
+        """
+        ttl = self.ttl_for(tools)
+        if per_user or ttl <= 0 or not answer.strip():
+            return
+        key = f"{fingerprint}|{normalize_prompt(question)}"
+        embedding = await self._embed(question)
+        self._entries[key] = (time.monotonic() + ttl, fingerprint, embedding, answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the current size."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+async def replay(answer: str, chunk_chars: int = 24) -> AsyncIterator[str]:
+    """Yield a cached answer in chunks of about `chunk_chars`, split after spaces."""
+    start = 0
+    while start < len(answer):
+        end = answer.find(" ", start + chunk_chars)
+        end = len(answer) if end == -1 else end + 1
+        yield answer[start:end]
+        start = end
+        # Other sessions run between chunks, as during a streamed run
+        await asyncio.sleep(0)
+
+
+# Process-wide cache shared by all sessions
+response_cache = ResponseCache(
+    enabled=os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true",
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512")),
+    ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600")),
+    tool_ttls=parse_plugin_settings(
+        os.getenv(
+            "RESPONSE_CACHE_TOOL_TTLS",
+            "bing_grounding=900,get_weather=600,fetch_weather=600,"
+            "fetch_stock_price=300,file_search=86400",
+        ),
+        cast=float,
+    ),
+    similarity=float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.92")),
+    embedding_deployment=os.getenv("RESPONSE_CACHE_EMBEDDING_DEPLOYMENT", ""),
+)
@@ -3,6 +3,8 @@ from datetime import datetime as pydatetime, timedelta, timezone
 
 from semantic_kernel.functions import kernel_function
 
+from tool_cache import cacheable, pure
+
 
 class SimpleTool:
     """
@@ -10,6 +12,7 @@ class SimpleTool:
     This tool provides basic arithmetic operations and a greeting.
     """
 
+    @pure
     @kernel_function(description="Returns a greeting message for the given name.")
     def greet(self, name: str) -> str:
         """
@@ -17,6 +20,7 @@ class SimpleTool:
         """
         return f"Hello, {name}! How can I assist you today?"
 
+    @pure
     @kernel_function(description="Returns the sum of two numbers.")
     def add(self, a: float, b: float) -> float:
         """
@@ -24,6 +28,7 @@ class SimpleTool:
         """
         return a + b
 
+    @pure
     @kernel_function(description="Returns the difference between two numbers.")
     def subtract(self, a: float, b: float) -> float:
         """
@@ -31,6 +36,7 @@ class SimpleTool:
         """
         return a - b
 
+    @pure
     @kernel_function(description="Returns the product of two numbers.")
     def multiply(self, a: float, b: float) -> float:
         """
@@ -38,6 +44,7 @@ class SimpleTool:
         """
         return a * b
 
+    @pure
     @kernel_function(
         description="Returns the quotient of two numbers. Raises ValueError if division by zero is attempted."
     )
@@ -50,6 +57,8 @@ class SimpleTool:
             raise ValueError("Division by zero is not allowed.")
         return a / b
 
+    # Only a fixed unix_ts gives a deterministic result; "now" must not be cached
+    @cacheable(when=lambda args: args.get("unix_ts") is not None)
     @kernel_function(
         description="""
     Returns either the current UTC date/time in the given format, or if unix_ts
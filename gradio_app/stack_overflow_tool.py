@@ -1,14 +1,17 @@
 import os
 import json
-import requests
 from semantic_kernel.functions import kernel_function
 
+from tool_cache import cacheable
+from tool_resilience import hedged_get
+
 
 class StackOverflowTool:
     """
     Tool for interacting with Stack Overflow.
     """
 
+    @cacheable(ttl_seconds=300, per_user=True)
     @kernel_function(
         description="Fetches user info from Stack Overflow. If not authenticated, asks user to authenticate."
     )
@@ -25,7 +28,8 @@ class StackOverflowTool:
                 "http://localhost:8001/auth/stackoverflow"
             )
         try:
-            resp = requests.get(
+            # Idempotent GET: send a hedged request if Stack Exchange is slow
+            resp = hedged_get(
                 "https://api.stackexchange.com/2.3/me",
                 params={
                     "site": "stackoverflow",
@@ -37,7 +41,8 @@ class StackOverflowTool:
             if resp.status_code != 200:
                 return json.dumps(
                     {
-                        "error": f"Failed to fetch user info: {resp.status_code} {resp.text}"
+                        "error": f"Failed to fetch user info: {resp.status_code} {resp.text}",
+                        "status": resp.status_code,
                     }
                 )
             return json.dumps(resp.json())
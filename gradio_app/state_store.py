@@ -0,0 +1,135 @@
+"""
+Key-value store for state shared by the app's worker processes.
+
+A single process keeps state in memory. With several workers (see
+worker_router.py) set STATE_STORE_URL to a Redis URL, e.g.
+`redis://localhost:6379/0`, so browser sessions, chat thread ids and agent
+definitions are visible to every worker. Values are JSON serializable dicts.
+Redis support needs the optional `redis` package.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import Optional
+
+logger = logging.getLogger(f"workshop.agent.{__name__}")
+
+# Prefix for every key, so several apps can share one Redis database
+KEY_PREFIX = "workshop:"
+
+
+class StateStore(ABC):
+    """Interface of the shared state stores."""
+
+    shared = False
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, value: dict, ttl: Optional[int] = None) -> None:
+        """Store the value, expiring it after `ttl` seconds when given."""
+        pass
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        pass
+
+    @abstractmethod
+    def lock(self, name: str, timeout: float = 60):
+        """Async context manager holding a lock named `name` across workers."""
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryStateStore(StateStore):
+    """State store for a single process."""
+
+    def __init__(self):
+        # key -> (expiry as monotonic time or None, JSON encoded value)
+        self._values: dict[str, tuple[Optional[float], str]] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    async def get(self, key: str) -> Optional[dict]:
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._values.pop(key, None)
+            return None
+        # Decoded on every read so callers never share mutable state, as with Redis
+        return json.loads(value)
+
+    async def set(self, key: str, value: dict, ttl: Optional[int] = None) -> None:
+        expires_at = time.monotonic() + ttl if ttl else None
+        self._values[key] = (expires_at, json.dumps(value))
+
+    async def delete(self, key: str) -> None:
+        self._values.pop(key, None)
+
+    @asynccontextmanager
+    async def lock(self, name: str, timeout: float = 60):
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            yield
+
+
+class RedisStateStore(StateStore):
+    """State store shared by every worker connected to the same Redis."""
+
+    shared = True
+
+    def __init__(self, url: str):
+        try:
+            from redis import asyncio as redis
+        except ImportError as e:
+            raise ImportError(
+                "STATE_STORE_URL needs the redis package: pip install redis"
+            ) from e
+        self._redis = redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[dict]:
+        value = await self._redis.get(KEY_PREFIX + key)
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, value: dict, ttl: Optional[int] = None) -> None:
+        await self._redis.set(KEY_PREFIX + key, json.dumps(value), ex=ttl or None)
+
+    async def delete(self, key: str) -> None:
+        await self._redis.delete(KEY_PREFIX + key)
+
+    @asynccontextmanager
+    async def lock(self, name: str, timeout: float = 60):
+        # The timeout releases the lock of a worker that died while holding it
+        async with self._redis.lock(
+            f"{KEY_PREFIX}lock:{name}", timeout=timeout, blocking_timeout=timeout
+        ):
+            yield
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+_state_store: Optional[StateStore] = None
+
+
+def get_state_store() -> StateStore:
+    """Get the process wide state store configured by STATE_STORE_URL."""
+    global _state_store
+    if _state_store is None:
+        url = os.getenv("STATE_STORE_URL")
+        if url:
+            _state_store = RedisStateStore(url)
+            logger.info("Using Redis state store")
+        else:
+            _state_store = MemoryStateStore()
+    return _state_store
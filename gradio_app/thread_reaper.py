@@ -0,0 +1,291 @@
+"""
+Background deletion of agent threads the app no longer uses.
+
+Every agent thread this replica creates or rehydrates is tracked, with a count of
+the local sessions holding it. A thread is deleted on the agent service once it
+is released by the last session holding it (a closed guest session), or once no
+local session holds it and it has been idle for THREAD_IDLE_TTL_SECONDS. A user's
+thread replaced by "Clear" is recorded in the shared state store instead, since
+the user's other tabs, on this or another replica, may still be streaming into
+it. Every replica's reaper keeps such a thread alive while one of its sessions
+holds it, and any of them deletes it once it has been unused for
+THREAD_SUPERSEDED_GRACE_SECONDS, even after the replica that replaced it is gone.
+Deletes run in batches of THREAD_REAPER_BATCH_SIZE every
+THREAD_REAPER_INTERVAL_SECONDS, at most THREAD_REAPER_RATE per second, so the
+reaper never competes with chat traffic for the service's rate limits.
+
+The backlog is reported by the `workshop.threads.reaper_backlog` gauge and
+deletions by the `workshop.threads.reaped` counter.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import Counter, deque
+from typing import Optional
+
+from azure.core.exceptions import ResourceNotFoundError
+from opentelemetry import metrics
+from opentelemetry.metrics import CallbackOptions, Observation
+
+from state_store import get_state_store
+
+logger = logging.getLogger(f"workshop.agent.{__name__}")
+
+meter = metrics.get_meter(__name__)
+reaped = meter.create_counter(
+    "workshop.threads.reaped",
+    description="Agent threads deleted by the reaper, by status",
+)
+
+# Attempts before a thread that fails to delete is given up
+MAX_ATTEMPTS = 3
+
+# State store entry with the last use (epoch seconds) of every superseded thread
+SUPERSEDED_KEY = "threads:superseded"
+
+
+class ThreadReaper:
+    """Tracks the threads of this replica and deletes the unused ones."""
+
+    def __init__(
+        self,
+        idle_seconds: float = 2592000,
+        superseded_seconds: float = 600,
+        interval_seconds: float = 30,
+        batch_size: int = 20,
+        rate: float = 5,
+        enabled: bool = True,
+    ):
+        self.idle_seconds = idle_seconds
+        self.superseded_seconds = superseded_seconds
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.rate = rate
+        self.enabled = enabled
+        # thread id -> (monotonic time of last use, state store key naming the thread)
+        self._threads: dict[str, tuple[float, Optional[str]]] = {}
+        # thread id -> sessions of this replica holding the thread
+        self._holders: Counter[str] = Counter()
+        # (thread id, attempts) of released threads waiting to be deleted
+        self._released: deque[tuple[str, int]] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self._client = None
+        self._credential = None
+
+    def track(self, thread_id: str, state_key: Optional[str] = None) -> None:
+        """
+        Track a thread created or rehydrated by this replica. `state_key` is the
+        shared state entry holding the thread id when other replicas may use the
+        thread too; an idle thread is only deleted once that entry moved on.
+        Every call adds a holder, removed again by `untrack` or `release`.
+        """
+        self._threads[thread_id] = (time.monotonic(), state_key)
+        self._holders[thread_id] += 1
+        self._start()
+
+    def touch(self, thread_id: str) -> None:
+        """Mark a tracked thread as used."""
+        if thread_id in self._threads:
+            self._threads[thread_id] = (time.monotonic(), self._threads[thread_id][1])
+
+    def untrack(self, thread_id: str) -> None:
+        """
+        Remove a session's hold on a thread other sessions may still use. Once no
+        local session holds it, the thread is deleted when idle and no longer named
+        by its state entry.
+        """
+        if self._holders[thread_id] > 1:
+            self._holders[thread_id] -= 1
+        else:
+            self._holders.pop(thread_id, None)
+
+    def release(self, thread_id: str) -> None:
+        """
+        Remove a session's hold on a thread and, unless another local session still
+        holds it, queue the thread for deletion.
+        """
+        self.untrack(thread_id)
+        if not self._holders[thread_id]:
+            self._queue(thread_id)
+
+    async def supersede(self, thread_id: str) -> None:
+        """
+        Remove a session's hold on a thread replaced by a new one, and record it in
+        the shared state so the reaper of any replica deletes it once no session
+        has used it for `superseded_seconds`.
+        """
+        self.untrack(thread_id)
+        if not self._holders[thread_id]:
+            # Collected through the shared entry rather than the idle path
+            self._threads.pop(thread_id, None)
+        if not self.enabled:
+            return
+        store = get_state_store()
+        async with store.lock(SUPERSEDED_KEY):
+            state = await store.get(SUPERSEDED_KEY) or {"threads": {}}
+            state["threads"][thread_id] = time.time()
+            await store.set(SUPERSEDED_KEY, state)
+
+    def _queue(self, thread_id: str) -> None:
+        self._threads.pop(thread_id, None)
+        self._holders.pop(thread_id, None)
+        if self.enabled:
+            self._released.append((thread_id, 0))
+            self._start()
+
+    def tracked(self) -> int:
+        """Threads in use by this replica."""
+        return len(self._threads)
+
+    def backlog(self) -> int:
+        """Threads waiting to be deleted."""
+        return len(self._released) + len(self._idle_threads())
+
+    def _idle_threads(self) -> list[str]:
+        cutoff = time.monotonic() - self.idle_seconds
+        return [
+            thread_id
+            for thread_id, (last_used, _) in list(self._threads.items())
+            if last_used < cutoff and not self._holders[thread_id]
+        ]
+
+    async def _in_use_elsewhere(self, thread_id: str) -> bool:
+        state_key = self._threads[thread_id][1]
+        if not state_key:
+            return False
+        state = await get_state_store().get(state_key)
+        return bool(state) and state.get("thread_id") == thread_id
+
+    async def _expired_superseded(self, limit: int) -> list[str]:
+        """Take up to `limit` superseded threads past their grace period off the entry."""
+        store = get_state_store()
+        now = time.time()
+        async with store.lock(SUPERSEDED_KEY):
+            state = await store.get(SUPERSEDED_KEY)
+            if not state or not state["threads"]:
+                return []
+            threads: dict[str, float] = state["threads"]
+            for thread_id in threads:
+                if self._holders[thread_id]:
+                    # Still open in a session of this replica
+                    threads[thread_id] = now
+            cutoff = now - self.superseded_seconds
+            expired = [t for t, last_used in threads.items() if last_used < cutoff]
+            for thread_id in expired[:limit]:
+                del threads[thread_id]
+            await store.set(SUPERSEDED_KEY, state)
+        return expired[:limit]
+
+    def _start(self) -> None:
+        if not self.enabled or (self._task and not self._task.done()):
+            return
+        try:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        except RuntimeError:
+            # No running loop (e.g. a CLI); threads are collected once one starts
+            pass
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.reap()
+            except Exception as e:
+                logger.error(f"Thread reaper cycle failed: {str(e)}")
+
+    async def reap(self, limit: Optional[int] = None) -> int:
+        """Delete up to `limit` (default: one batch) unused threads; returns the count."""
+        limit = limit or self.batch_size
+        for thread_id in await self._expired_superseded(limit):
+            self._queue(thread_id)
+        for thread_id in self._idle_threads()[:limit]:
+            if await self._in_use_elsewhere(thread_id):
+                # Still the thread of a user, who may be chatting on another replica
+                self.touch(thread_id)
+            else:
+                self._queue(thread_id)
+
+        deleted = 0
+        while self._released and deleted < limit:
+            thread_id, attempts = self._released.popleft()
+            status = await self._delete(thread_id)
+            if status == "error" and attempts + 1 < MAX_ATTEMPTS:
+                self._released.append((thread_id, attempts + 1))
+            reaped.add(1, {"status": status})
+            deleted += 1
+            # Spread the deletes to stay under the service's rate limits
+            await asyncio.sleep(1 / self.rate)
+
+        if deleted:
+            logger.info(f"Reaped {deleted} threads, {self.backlog()} waiting")
+        return deleted
+
+    async def _delete(self, thread_id: str) -> str:
+        if self._client is None:
+            # Imported here: agent_factory sets up telemetry on import
+            from agent_factory import create_project_client
+
+            self._client, self._credential = create_project_client()
+        try:
+            await self._client.agents.threads.delete(thread_id)
+            return "deleted"
+        except ResourceNotFoundError:
+            return "not_found"
+        except Exception as e:
+            logger.warning(f"Could not delete thread {thread_id}: {str(e)}")
+            return "error"
+
+    async def stop(self, drain_seconds: float = 5) -> None:
+        """Stop the reaper, deleting released threads for up to `drain_seconds`."""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._released:
+            try:
+                await asyncio.wait_for(
+                    self.reap(limit=len(self._released)), drain_seconds
+                )
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"{len(self._released)} released threads were not deleted"
+                )
+        if self._client is not None:
+            await self._client.close()
+            await self._credential.close()
+            self._client = self._credential = None
+
+
+thread_reaper = ThreadReaper(
+    idle_seconds=float(
+        os.getenv(
+            "THREAD_IDLE_TTL_SECONDS", os.getenv("USER_THREAD_TTL_SECONDS", "2592000")
+        )
+    ),
+    superseded_seconds=float(os.getenv("THREAD_SUPERSEDED_GRACE_SECONDS", "600")),
+    interval_seconds=float(os.getenv("THREAD_REAPER_INTERVAL_SECONDS", "30")),
+    batch_size=int(os.getenv("THREAD_REAPER_BATCH_SIZE", "20")),
+    rate=float(os.getenv("THREAD_REAPER_RATE", "5")),
+    enabled=os.getenv("THREAD_REAPER_ENABLED", "true").lower() == "true",
+)
+
+
+def _observe_backlog(options: CallbackOptions):
+    yield Observation(thread_reaper.backlog())
+
+
+def _observe_tracked(options: CallbackOptions):
+    yield Observation(thread_reaper.tracked())
+
+
+meter.create_observable_gauge(
+    "workshop.threads.reaper_backlog",
+    callbacks=[_observe_backlog],
+    description="Agent threads waiting to be deleted",
+)
+meter.create_observable_gauge(
+    "workshop.threads.tracked",
+    callbacks=[_observe_tracked],
+    description="Agent threads in use by this replica",
+)
@@ -0,0 +1,226 @@
+"""
+Memoization of deterministic kernel function results.
+
+Functions opt in with the `cacheable` decorator. The auto function invocation
+filter created by `create_tool_cache_filter` serves repeated calls with the same
+(normalized) arguments from a process-wide LRU/TTL cache instead of invoking
+the function again.
+"""
+
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+from opentelemetry import metrics
+from semantic_kernel.filters import AutoFunctionInvocationContext
+from semantic_kernel.functions import FunctionResult
+
+from otel_setup import get_span
+
+logger = logging.getLogger(f"workshop.agent.{__name__}")
+
+# Argument names that are never part of a cache key (secrets injected by filters)
+SENSITIVE_ARGUMENTS = {"key", "password", "secret", "token", "authorization"}
+
+meter = metrics.get_meter(__name__)
+cache_hits = meter.create_counter(
+    "workshop.tool_cache.hits", description="Tool calls served from the result cache"
+)
+cache_misses = meter.create_counter(
+    "workshop.tool_cache.misses",
+    description="Cacheable tool calls that had to be executed",
+)
+
+
+class CachePolicy:
+    """Caching options attached to a kernel function by `cacheable`."""
+
+    def __init__(
+        self,
+        ttl_seconds: Optional[float] = None,
+        per_user: bool = False,
+        when: Optional[Callable[[dict], bool]] = None,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.per_user = per_user
+        self.when = when
+
+
+def cacheable(
+    ttl_seconds: Optional[float] = None,
+    per_user: bool = False,
+    when: Optional[Callable[[dict], bool]] = None,
+):
+    """
+    Mark a kernel function as safe to memoize.
+
+    :param ttl_seconds: How long a result stays valid. Defaults to TOOL_CACHE_TTL_SECONDS.
+    :param per_user: Results are only shared within the same cache scope (user).
+    :param when: Optional predicate on the call arguments; the call is only cached when it returns True.
+    """
+
+    def decorator(func):
+        func.__tool_cache__ = CachePolicy(ttl_seconds, per_user, when)
+        return func
+
+    return decorator
+
+
+def pure(func):
+    """Mark a kernel function as pure: same arguments always give the same result."""
+    func.__tool_cache__ = CachePolicy(ttl_seconds=float("inf"))
+    return func
+
+
+def get_cache_policy(function) -> Optional[CachePolicy]:
+    """Return the cache policy of a kernel function, if it was marked cacheable."""
+    return getattr(getattr(function, "method", None), "__tool_cache__", None)
+
+
+def _normalize(value: Any) -> Any:
+    """Normalize argument values so equivalent calls produce the same key."""
+    if isinstance(value, dict):
+        return {
+            str(k): _normalize(v)
+            for k, v in value.items()
+            if str(k).lower() not in SENSITIVE_ARGUMENTS
+        }
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def is_error_result(value: Any) -> bool:
+    """Tools report failures as a JSON object with an "error" key; never cache those."""
+    return isinstance(value, str) and value.lstrip().startswith('{"error"')
+
+
+def make_cache_key(
+    plugin_name: str, function_name: str, arguments: dict, scope: Optional[str]
+) -> str:
+    """Build a cache key from the function name, normalized arguments and scope."""
+    normalized = json.dumps(
+        _normalize(dict(arguments or {})), sort_keys=True, default=str
+    )
+    return f"{scope or ''}|{plugin_name}.{function_name}|{normalized}"
+
+
+class ToolResultCache:
+    """An LRU cache with per-entry expiry for kernel function results."""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> tuple[bool, Any]:
+        """Return (found, value) for the key, evicting it if it has expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        """Store a value, evicting the least recently used entries over capacity."""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the current size."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Process-wide cache shared by all kernels so pure results are reused across sessions
+tool_result_cache = ToolResultCache(
+    max_entries=int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1024")),
+    ttl_seconds=float(os.getenv("TOOL_CACHE_TTL_SECONDS", "300")),
+)
+
+
+def create_tool_cache_filter(
+    scope: Optional[str] = None, cache: ToolResultCache = tool_result_cache
+):
+    """
+    Create an auto function invocation filter that memoizes cacheable functions.
+
+    :param scope: Cache scope (e.g. the user id) for functions marked per_user.
+        Per-user functions are not cached when no scope is given.
+    :param cache: The cache to use, defaults to the process-wide cache.
+    """
+
+    async def tool_cache_filter(context: AutoFunctionInvocationContext, next):
+        """A filter that serves repeated calls of cacheable functions from the cache."""
+        policy = get_cache_policy(context.function)
+        if (
+            policy is None
+            or (policy.per_user and not scope)
+            or (policy.when and not policy.when(dict(context.arguments or {})))
+        ):
+            await next(context)
+            return
+
+        plugin_name = context.function.plugin_name
+        function_name = context.function.name
+        key = make_cache_key(
+            plugin_name,
+            function_name,
+            context.arguments,
+            scope if policy.per_user else None,
+        )
+        attributes = {"plugin": plugin_name, "function": function_name}
+
+        with get_span("tool_cache_filter") as span:
+            found, value = cache.get(key)
+            span.set_attribute("tool_cache.hit", found)
+            if found:
+                cache.hits += 1
+                cache_hits.add(1, attributes)
+                logger.debug(f"Cache hit for {plugin_name}.{function_name}")
+                context.function_result = FunctionResult(
+                    function=context.function.metadata, value=value
+                )
+                return
+
+            cache.misses += 1
+            cache_misses.add(1, attributes)
+            await next(context)
+
+            result = context.function_result
+            if (
+                not context.terminate
+                and result is not None
+                and result.value is not None
+                and not is_error_result(result.value)
+            ):
+                cache.set(key, result.value, policy.ttl_seconds)
+
+    return tool_cache_filter
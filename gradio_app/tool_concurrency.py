@@ -0,0 +1,159 @@
+"""
+Concurrency-aware invocation of kernel functions.
+
+Semantic Kernel already gathers all function calls of one model turn, but
+synchronous plugin methods (e.g. `StackOverflowTool.get_user_info`, which uses
+`requests`) run on the event loop and serialize the whole turn.
+
+- `offload_sync_functions` moves synchronous kernel functions to a thread pool.
+- `create_concurrency_filter` limits in-flight calls per plugin and reports the
+  fan-out width (number of function calls the model emitted in one turn).
+"""
+
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from opentelemetry import metrics
+from semantic_kernel import Kernel
+from semantic_kernel.filters import AutoFunctionInvocationContext
+from semantic_kernel.functions.kernel_function_from_method import (
+    KernelFunctionFromMethod,
+)
+
+from otel_setup import get_span
+
+logger = logging.getLogger(f"workshop.agent.{__name__}")
+
+meter = metrics.get_meter(__name__)
+fan_out_width = meter.create_histogram(
+    "workshop.tool_calls.fan_out",
+    description="Number of function calls requested by the model in one turn",
+)
+queue_wait = meter.create_histogram(
+    "workshop.tool_calls.queue_wait",
+    unit="ms",
+    description="Time a function call waited for its plugin concurrency slot",
+)
+
+
+def parse_plugin_settings(value: str, cast=int) -> dict:
+    """Parse "PluginA=2,PluginB=8" into a plugin name -> value mapping."""
+    settings = {}
+    for item in (value or "").split(","):
+        if "=" not in item:
+            continue
+        plugin_name, setting = item.split("=", 1)
+        settings[plugin_name.strip()] = cast(setting)
+    return settings
+
+
+class ToolConcurrencyLimiter:
+    """Per-plugin semaphores bounding the number of in-flight function calls."""
+
+    def __init__(self, default_limit: int = 8, limits: Optional[dict[str, int]] = None):
+        self.default_limit = default_limit
+        self.limits = limits or {}
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self.in_flight: dict[str, int] = {}
+
+    def semaphore(self, plugin_name: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(plugin_name)
+        if semaphore is None:
+            limit = self.limits.get(plugin_name, self.default_limit)
+            semaphore = self._semaphores[plugin_name] = asyncio.Semaphore(limit)
+        return semaphore
+
+
+# Process-wide limiter so limits hold across all sessions of a replica
+tool_concurrency_limiter = ToolConcurrencyLimiter(
+    default_limit=int(os.getenv("TOOL_CONCURRENCY_DEFAULT_LIMIT", "8")),
+    limits=parse_plugin_settings(os.getenv("TOOL_CONCURRENCY_LIMITS", "")),
+)
+
+# Thread pool used for synchronous kernel functions
+tool_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("TOOL_THREAD_POOL_SIZE", "16")),
+    thread_name_prefix="tool",
+)
+
+
+def _run_in_executor(method, executor: ThreadPoolExecutor):
+    """Wrap a synchronous method in a coroutine that runs it on the executor."""
+
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # Copy the context so spans started by the tool keep their parent
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            executor, functools.partial(context.run, method, *args, **kwargs)
+        )
+
+    return wrapper
+
+
+def offload_sync_functions(
+    kernel: Kernel, executor: ThreadPoolExecutor = tool_executor
+) -> int:
+    """
+    Replace synchronous kernel functions with wrappers that run them in a thread pool,
+    so they no longer block the event loop or the other calls of the same turn.
+    Returns the number of functions that were wrapped.
+    """
+    wrapped = 0
+    for plugin in kernel.plugins.values():
+        for function in plugin.functions.values():
+            if (
+                not isinstance(function, KernelFunctionFromMethod)
+                or function.metadata.is_asynchronous
+                or function.stream_method is not None
+            ):
+                continue
+            function.method = _run_in_executor(function.method, executor)
+            wrapped += 1
+            logger.debug(
+                f"Offloading {plugin.name}.{function.name} to the tool thread pool"
+            )
+    return wrapped
+
+
+def create_concurrency_filter(
+    limiter: ToolConcurrencyLimiter = tool_concurrency_limiter,
+):
+    """Create an auto function invocation filter applying per-plugin concurrency limits."""
+
+    async def concurrency_filter(context: AutoFunctionInvocationContext, next):
+        """A filter that bounds in-flight calls per plugin and records the fan-out width."""
+        plugin_name = context.function.plugin_name or ""
+        attributes = {"plugin": plugin_name}
+
+        with get_span("concurrency_filter") as span:
+            span.set_attribute("tool_calls.fan_out", context.function_count)
+            span.set_attribute(
+                "tool_calls.function_sequence_index", context.function_sequence_index
+            )
+            # Record the width once per turn, on its first function call
+            if context.function_sequence_index == 0:
+                fan_out_width.record(context.function_count)
+
+            loop = asyncio.get_running_loop()
+            wait_start = loop.time()
+            async with limiter.semaphore(plugin_name):
+                queue_wait.record((loop.time() - wait_start) * 1000, attributes)
+                limiter.in_flight[plugin_name] = (
+                    limiter.in_flight.get(plugin_name, 0) + 1
+                )
+                span.set_attribute(
+                    "tool_calls.in_flight", limiter.in_flight[plugin_name]
+                )
+                try:
+                    await next(context)
+                finally:
+                    limiter.in_flight[plugin_name] -= 1
+
+    return concurrency_filter
@@ -0,0 +1,314 @@
+"""
+Resilience layer for kernel functions: per-plugin deadlines, circuit breakers
+and hedged HTTP GETs.
+
+A timed out call or a call rejected by an open circuit does not fail the run.
+The model receives a JSON error result instead, the same shape the tools use for
+their own failures. Every decision is recorded on the current span and as
+`workshop.tool_resilience.*` metrics.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Optional
+
+from opentelemetry import metrics
+from semantic_kernel.filters import AutoFunctionInvocationContext
+from semantic_kernel.functions import FunctionResult
+
+from otel_setup import get_span
+from tool_cache import is_error_result
+from tool_concurrency import parse_plugin_settings
+
+if TYPE_CHECKING:
+    import requests
+
+logger = logging.getLogger(f"workshop.agent.{__name__}")
+
+meter = metrics.get_meter(__name__)
+timeouts = meter.create_counter(
+    "workshop.tool_resilience.timeouts",
+    description="Function calls cancelled because they exceeded their deadline",
+)
+rejections = meter.create_counter(
+    "workshop.tool_resilience.rejections",
+    description="Function calls rejected because the plugin circuit was open",
+)
+circuit_transitions = meter.create_counter(
+    "workshop.tool_resilience.circuit_transitions",
+    description="Circuit breaker state changes",
+)
+hedges = meter.create_counter(
+    "workshop.tool_resilience.hedges",
+    description="Hedged requests sent because the first attempt was slow",
+)
+hedge_wins = meter.create_counter(
+    "workshop.tool_resilience.hedge_wins",
+    description="Hedged requests that answered before the first attempt",
+)
+
+
+class CircuitBreaker:
+    """
+    Error-rate circuit breaker over a rolling window of recent calls.
+
+    closed -> open when at least `min_calls` of the last `window` calls were seen and
+    the error rate reaches `error_threshold`. After `cooldown_seconds` one trial call
+    is let through (half-open); its outcome closes or re-opens the circuit. Calls
+    let through before the circuit opened do not decide it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    # Permits returned by `allow`
+    CALL = "call"
+    TRIAL = "trial"
+
+    def __init__(
+        self,
+        name: str,
+        window: int = 20,
+        min_calls: int = 5,
+        error_threshold: float = 0.5,
+        cooldown_seconds: float = 30.0,
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_threshold = error_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self._outcomes: deque[bool] = deque(maxlen=window)
+        self._trial_in_flight = False
+
+    def allow(self) -> Optional[str]:
+        """
+        Return the permit of a call that may proceed: TRIAL for the half-open trial
+        call, CALL otherwise. None when the call is rejected.
+        """
+        if self.state == self.CLOSED:
+            return self.CALL
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.cooldown_seconds:
+                return None
+            self._transition(self.HALF_OPEN)
+        # Half-open: only a single trial call at a time
+        if self._trial_in_flight:
+            return None
+        self._trial_in_flight = True
+        return self.TRIAL
+
+    def end_trial(self) -> None:
+        """
+        Free the half-open trial slot; called by the holder of the TRIAL permit
+        once its call ended, also without an outcome, e.g. when it was cancelled
+        by a client disconnect.
+        """
+        self._trial_in_flight = False
+
+    def record(self, success: bool, permit: str = CALL) -> None:
+        """Record the outcome of a call allowed through with `permit`."""
+        if permit == self.TRIAL:
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN:
+                self._outcomes.clear()
+                self._outcomes.append(success)
+                self._transition(self.CLOSED if success else self.OPEN)
+            return
+
+        self._outcomes.append(success)
+        if self.state == self.CLOSED and len(self._outcomes) >= self.min_calls:
+            if self.error_rate() >= self.error_threshold:
+                self._transition(self.OPEN)
+
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def _transition(self, state: str) -> None:
+        if state == self.state:
+            if state == self.OPEN:
+                self.opened_at = time.monotonic()
+            return
+        logger.warning(f"Circuit for {self.name} changed: {self.state} -> {state}")
+        circuit_transitions.add(1, {"plugin": self.name, "state": state})
+        self.state = state
+        if state == self.OPEN:
+            self.opened_at = time.monotonic()
+
+
+class ToolResiliencePolicy:
+    """Per-plugin deadlines and the circuit breakers guarding each plugin."""
+
+    def __init__(
+        self,
+        default_timeout_seconds: float = 15.0,
+        timeouts: Optional[dict[str, float]] = None,
+        error_threshold: float = 0.5,
+        cooldown_seconds: float = 30.0,
+    ):
+        self.default_timeout_seconds = default_timeout_seconds
+        self.timeouts = timeouts or {}
+        self.error_threshold = error_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.breakers: dict[str, CircuitBreaker] = {}
+
+    def timeout_for(self, plugin_name: str) -> float:
+        return self.timeouts.get(plugin_name, self.default_timeout_seconds)
+
+    def breaker(self, plugin_name: str) -> CircuitBreaker:
+        breaker = self.breakers.get(plugin_name)
+        if breaker is None:
+            breaker = self.breakers[plugin_name] = CircuitBreaker(
+                plugin_name,
+                error_threshold=self.error_threshold,
+                cooldown_seconds=self.cooldown_seconds,
+            )
+        return breaker
+
+
+tool_resilience_policy = ToolResiliencePolicy(
+    default_timeout_seconds=float(os.getenv("TOOL_TIMEOUT_SECONDS", "15")),
+    timeouts=parse_plugin_settings(os.getenv("TOOL_TIMEOUTS", ""), cast=float),
+    error_threshold=float(os.getenv("TOOL_CIRCUIT_ERROR_THRESHOLD", "0.5")),
+    cooldown_seconds=float(os.getenv("TOOL_CIRCUIT_COOLDOWN_SECONDS", "30")),
+)
+
+
+def is_dependency_failure(value) -> bool:
+    """
+    Whether a tool's error result says its dependency is failing. Tools pass the
+    HTTP status of a failed request as "status"; client errors such as one user's
+    expired token (4xx, except 408 and 429) leave the circuit alone, since the
+    breakers are shared by all users.
+    """
+    if not is_error_result(value):
+        return False
+    try:
+        status = json.loads(value).get("status")
+    except ValueError:
+        return True
+    if isinstance(status, int) and 400 <= status < 500:
+        return status in (408, 429)
+    return True
+
+
+def _error_result(context: AutoFunctionInvocationContext, message: str):
+    return FunctionResult(
+        function=context.function.metadata, value=json.dumps({"error": message})
+    )
+
+
+def create_resilience_filter(policy: ToolResiliencePolicy = tool_resilience_policy):
+    """Create an auto function invocation filter enforcing deadlines and circuit breakers."""
+
+    async def resilience_filter(context: AutoFunctionInvocationContext, next):
+        """A filter that fails fast instead of holding the run open on a bad dependency."""
+        plugin_name = context.function.plugin_name or ""
+        qualified_name = f"{plugin_name}.{context.function.name}"
+        attributes = {"plugin": plugin_name}
+        breaker = policy.breaker(plugin_name)
+        timeout = policy.timeout_for(plugin_name)
+
+        with get_span("resilience_filter") as span:
+            span.set_attribute("resilience.timeout_seconds", timeout)
+            span.set_attribute("resilience.circuit_state", breaker.state)
+
+            permit = breaker.allow()
+            if not permit:
+                rejections.add(1, attributes)
+                span.add_event("circuit_open", {"plugin": plugin_name})
+                logger.warning(f"Circuit open, skipping {qualified_name}")
+                context.function_result = _error_result(
+                    context,
+                    f"{qualified_name} is temporarily unavailable. Do not retry it now.",
+                )
+                return
+
+            try:
+                await asyncio.wait_for(next(context), timeout=timeout)
+            except asyncio.TimeoutError:
+                breaker.record(False, permit)
+                timeouts.add(1, attributes)
+                span.add_event("timeout", {"timeout_seconds": timeout})
+                logger.warning(f"{qualified_name} timed out after {timeout}s")
+                context.function_result = _error_result(
+                    context, f"{qualified_name} timed out after {timeout} seconds."
+                )
+                return
+            except Exception:
+                breaker.record(False, permit)
+                raise
+            finally:
+                if permit == breaker.TRIAL:
+                    # A cancelled trial records nothing and would block the plugin
+                    breaker.end_trial()
+
+            result = context.function_result
+            breaker.record(
+                not (result is not None and is_dependency_failure(result.value)),
+                permit,
+            )
+            span.set_attribute("resilience.circuit_state", breaker.state)
+
+    return resilience_filter
+
+
+# Dedicated pool: hedged requests are issued from tool threads, so sharing the
+# tool pool could deadlock when it is saturated
+hedge_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("TOOL_HEDGE_POOL_SIZE", "8")),
+    thread_name_prefix="hedge",
+)
+
+
+def hedged_get(
+    url: str, hedge_delay: Optional[float] = None, **kwargs
+) -> "requests.Response":
+    """
+    Idempotent GET with a hedge: if the first attempt has not answered within
+    `hedge_delay` seconds, a second identical request is sent and whichever
+    answers first wins. Only use it for requests that are safe to repeat.
+    """
+    if hedge_delay is None:
+        hedge_delay = float(os.getenv("TOOL_HEDGE_DELAY_SECONDS", "1.0"))
+    # Imported on first use to keep it off the startup path
+    import requests
+
+    with get_span("hedged_get") as span:
+        span.set_attribute("http.url", url.split("?")[0])
+        first = hedge_executor.submit(requests.get, url, **kwargs)
+        done, _ = wait([first], timeout=hedge_delay)
+        if done:
+            span.set_attribute("hedge.sent", False)
+            return first.result()
+
+        hedges.add(1)
+        span.set_attribute("hedge.sent", True)
+        second = hedge_executor.submit(requests.get, url, **kwargs)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    # Keep waiting for the other attempt before giving up
+                    error = e
+                    continue
+                if future is second:
+                    hedge_wins.add(1)
+                span.set_attribute(
+                    "hedge.winner", "hedge" if future is second else "first"
+                )
+                return response
+        raise error
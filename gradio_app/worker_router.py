@@ -0,0 +1,272 @@
+"""
+Multi-worker mode for the Gradio app.
+
+Gradio keeps a session's event queue in the process that serves it: the
+`queue/join` request and the `queue/data` event stream of a session must reach
+the same process. Workers sharing a socket (gunicorn, `uvicorn --workers`)
+cannot guarantee that, so this module starts WEB_CONCURRENCY `uvicorn main:app`
+worker processes on local ports and routes requests to them:
+
+- requests of a Gradio session go to the worker picked by its `session_hash`
+- other requests go to the worker picked by the session cookie, or round robin
+
+Browser sessions, chat thread ids and agent definitions live in the shared
+state store (state_store.py), so STATE_STORE_URL must point at Redis when more
+than one worker runs. Dead workers are restarted; their sessions fail over to
+the next worker and continue their threads from the shared state.
+
+    python worker_router.py --workers 4 --port 8501
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from typing import Optional
+
+import httpx
+import uvicorn
+from starlette.background import BackgroundTask
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, StreamingResponse
+
+logger = logging.getLogger(f"workshop.agent.{__name__}")
+
+SESSION_COOKIE = "gradio_session"
+
+# Connection specific headers that are not forwarded
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+}
+
+
+def affinity_key(request: Request, body: Optional[bytes] = None) -> Optional[str]:
+    """The Gradio session hash of a request, or else its session cookie."""
+    session_hash = request.query_params.get("session_hash")
+    if session_hash:
+        return session_hash
+    path = request.url.path
+    if "/heartbeat/" in path:
+        return path.rsplit("/", 1)[-1]
+    if body and path.endswith("/queue/join"):
+        try:
+            session_hash = json.loads(body).get("session_hash")
+        except (ValueError, AttributeError):
+            session_hash = None
+        if session_hash:
+            return session_hash
+    return request.cookies.get(SESSION_COOKIE)
+
+
+def is_buffered(request: Request) -> bool:
+    # Small bodies are read up front to find the session hash and to allow a retry
+    # on another worker; uploads are streamed through
+    return request.method in ("GET", "HEAD", "DELETE", "OPTIONS") or (
+        request.url.path.endswith("/queue/join")
+    )
+
+
+class WorkerRouter:
+    """ASGI app proxying each request to the worker of its session."""
+
+    def __init__(self, worker_urls: list[str]):
+        self.worker_urls = worker_urls
+        self.client: Optional[httpx.AsyncClient] = None
+        self._round_robin = itertools.count()
+
+    def candidates(self, key: Optional[str]) -> list[str]:
+        """Workers to try in order: the session's own worker first."""
+        if key is None:
+            start = next(self._round_robin)
+        else:
+            # crc32 rather than hash(), which differs between router restarts
+            start = zlib.crc32(key.encode())
+        count = len(self.worker_urls)
+        return [self.worker_urls[(start + i) % count] for i in range(count)]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self.proxy(scope, receive, send)
+        else:
+            # Gradio 5 streams over server-sent events; websockets are not used
+            await send({"type": "websocket.close", "code": 1003})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.client = httpx.AsyncClient(
+                    timeout=httpx.Timeout(None, connect=5.0),
+                    limits=httpx.Limits(max_connections=None),
+                )
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.client.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def proxy(self, scope, receive, send):
+        request = Request(scope, receive)
+        if is_buffered(request):
+            body = await request.body()
+            workers = self.candidates(affinity_key(request, body))
+        else:
+            body = request.stream()
+            # A streamed body cannot be replayed on another worker
+            workers = self.candidates(affinity_key(request))[:1]
+
+        headers = [
+            (name, value)
+            for name, value in request.headers.items()
+            if name not in HOP_BY_HOP_HEADERS
+        ]
+        if request.client:
+            headers.append(("x-forwarded-for", request.client.host))
+        target = scope.get("raw_path") or scope["path"].encode()
+        if scope["query_string"]:
+            target += b"?" + scope["query_string"]
+
+        for worker_url in workers:
+            upstream = self.client.build_request(
+                request.method,
+                worker_url + target.decode("latin-1"),
+                headers=headers,
+                content=body,
+            )
+            try:
+                response = await self.client.send(upstream, stream=True)
+                break
+            except httpx.ConnectError:
+                logger.warning(f"Worker {worker_url} is unavailable")
+        else:
+            await PlainTextResponse("No worker available", status_code=502)(
+                scope, receive, send
+            )
+            return
+
+        proxied = StreamingResponse(
+            response.aiter_raw(),
+            status_code=response.status_code,
+            background=BackgroundTask(response.aclose),
+        )
+        proxied.raw_headers = [
+            (name.encode("latin-1"), value.encode("latin-1"))
+            for name, value in response.headers.multi_items()
+            if name not in HOP_BY_HOP_HEADERS
+        ]
+        await proxied(scope, receive, send)
+
+
+class WorkerPool:
+    """The `uvicorn main:app` worker processes, restarted when they exit."""
+
+    def __init__(self, count: int, base_port: int, app: str = "main:app"):
+        self.ports = [base_port + i for i in range(count)]
+        self.app = app
+        self.processes: dict[int, subprocess.Popen] = {}
+        self._stopped = threading.Event()
+
+    @property
+    def urls(self) -> list[str]:
+        return [f"http://127.0.0.1:{port}" for port in self.ports]
+
+    def spawn(self, port: int) -> None:
+        self.processes[port] = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                self.app,
+                "--host=127.0.0.1",
+                f"--port={port}",
+            ]
+        )
+        logger.info(f"Started worker on port {port} (pid {self.processes[port].pid})")
+
+    def start(self, timeout: float = 120) -> None:
+        for port in self.ports:
+            self.spawn(port)
+        deadline = time.monotonic() + timeout
+        for url in self.urls:
+            while True:
+                try:
+                    httpx.get(f"{url}/health", timeout=2).raise_for_status()
+                    break
+                except httpx.HTTPError:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"Worker {url} did not start")
+                    time.sleep(0.5)
+        threading.Thread(target=self.supervise, name="worker-pool", daemon=True).start()
+
+    def supervise(self) -> None:
+        while not self._stopped.wait(2):
+            for port, process in list(self.processes.items()):
+                if process.poll() is not None and not self._stopped.is_set():
+                    logger.warning(
+                        f"Worker on port {port} exited with {process.returncode}, restarting"
+                    )
+                    self.spawn(port)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8501)
+    parser.add_argument(
+        "--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1"))
+    )
+    parser.add_argument(
+        "--worker-port",
+        type=int,
+        default=None,
+        help="Port of the first worker (default: --port + 100)",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.workers <= 1:
+        # A single process needs no router
+        uvicorn.run("main:app", host=args.host, port=args.port)
+        return
+
+    if not os.getenv("STATE_STORE_URL"):
+        parser.error(
+            "more than one worker needs STATE_STORE_URL (Redis) for shared sessions"
+        )
+
+    pool = WorkerPool(args.workers, args.worker_port or args.port + 100)
+    try:
+        pool.start()
+        logger.info(f"Routing port {args.port} to {args.workers} workers")
+        uvicorn.run(WorkerRouter(pool.urls), host=args.host, port=args.port)
+    finally:
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()
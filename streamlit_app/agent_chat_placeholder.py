@@ -6,8 +6,8 @@ class AgentChatPlaceholder(ChatWithAgentBase):
     This is used to avoid circular imports in the demo_app module.
     """
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, tool_logger=None):
+        super().__init__(tool_logger=tool_logger)
 
     def _get_agents(self, tool_logger=None):
         """
@@ -0,0 +1,170 @@
+"""
+Agent service metrics used for capacity planning.
+
+All instruments are prefixed with `workshop.agent.` and are let through by the
+`workshop.*` view in `otel_setup.set_up_metrics`:
+
+- `time_to_first_token`: seconds from sending the message to the first streamed chunk
+- `run_duration`: seconds for the whole streamed run, by status
+- `stream_chunk_rate`: streamed chunks per second after the first chunk
+- `tool_calls` / `tool_call_duration`: tool calls observed in the run and how long
+  they took, from the call to its result
+- `upload_duration`: seconds spent uploading or encoding a user file
+- `active_sessions`: chat sessions currently holding agent state
+"""
+
+import asyncio
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Iterable, Optional
+
+from opentelemetry import metrics
+from opentelemetry.metrics import Histogram
+from semantic_kernel.contents import FunctionCallContent, FunctionResultContent
+
+meter = metrics.get_meter(__name__)
+time_to_first_token = meter.create_histogram(
+    "workshop.agent.time_to_first_token",
+    unit="s",
+    description="Time from sending the message to the first streamed chunk",
+)
+run_duration = meter.create_histogram(
+    "workshop.agent.run_duration",
+    unit="s",
+    description="Duration of a streamed agent run",
+)
+stream_chunk_rate = meter.create_histogram(
+    "workshop.agent.stream_chunk_rate",
+    unit="{chunk}/s",
+    description="Streamed chunks per second after the first chunk",
+)
+tool_calls = meter.create_counter(
+    "workshop.agent.tool_calls",
+    description="Tool calls requested by the agent",
+)
+tool_call_duration = meter.create_histogram(
+    "workshop.agent.tool_call_duration",
+    unit="s",
+    description="Time from a tool call to its result",
+)
+upload_duration = meter.create_histogram(
+    "workshop.agent.upload_duration",
+    unit="s",
+    description="Time spent uploading or encoding a user file",
+)
+active_sessions = meter.create_up_down_counter(
+    "workshop.agent.active_sessions",
+    description="Chat sessions currently holding agent state",
+)
+
+
+class RunMetrics:
+    """
+    Measures one streamed agent run. Use it as a context manager around the stream
+    and call `chunk` for every streamed chunk; the run duration is recorded on exit
+    with a `success`, `cancelled` or `error` status.
+    """
+
+    __slots__ = (
+        "attributes",
+        "started_at",
+        "first_chunk_at",
+        "chunks",
+        "_tools",
+    )
+
+    def __init__(self, agent_name: str):
+        self.attributes = {"agent": agent_name}
+        self.started_at = time.perf_counter()
+        self.first_chunk_at: Optional[float] = None
+        self.chunks = 0
+        self._tools: dict[str, tuple[str, float]] = {}
+
+    def __enter__(self) -> "RunMetrics":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if exc_type is None:
+            status = "success"
+        elif issubclass(exc_type, (GeneratorExit, asyncio.CancelledError)):
+            # The consumer stopped reading the stream
+            status = "cancelled"
+        else:
+            status = "error"
+        self.finish(status)
+        return False
+
+    def chunk(self) -> None:
+        """Record a streamed chunk."""
+        if self.first_chunk_at is None:
+            self.first_chunk_at = time.perf_counter()
+            time_to_first_token.record(
+                self.first_chunk_at - self.started_at, self.attributes
+            )
+        self.chunks += 1
+
+    def tool_call(self, call_id: str, tool_name: str) -> None:
+        """Record a tool call; repeated updates of the same call are ignored."""
+        if call_id in self._tools:
+            return
+        self._tools[call_id] = (tool_name, time.perf_counter())
+        tool_calls.add(1, {**self.attributes, "tool": tool_name})
+
+    def tool_result(self, call_id: str) -> None:
+        """Record the result of a tool call seen earlier in this run."""
+        started = self._tools.pop(call_id, None)
+        if started is None:
+            return
+        tool_name, started_at = started
+        tool_call_duration.record(
+            time.perf_counter() - started_at, {**self.attributes, "tool": tool_name}
+        )
+
+    def observe(self, items: Iterable) -> None:
+        """Record the function call and result contents among streamed items."""
+        for item in items or ():
+            if not isinstance(item, (FunctionCallContent, FunctionResultContent)):
+                continue
+            # Argument deltas of a streamed call carry neither an id nor a name
+            call_id = item.call_id or item.id or item.name
+            if not call_id:
+                continue
+            if isinstance(item, FunctionResultContent):
+                self.tool_result(call_id)
+            else:
+                self.tool_call(call_id, item.name or "unknown")
+
+    def finish(self, status: str = "success") -> None:
+        now = time.perf_counter()
+        run_duration.record(
+            now - self.started_at, {**self.attributes, "status": status}
+        )
+        if self.first_chunk_at is not None and now > self.first_chunk_at:
+            stream_chunk_rate.record(
+                self.chunks / (now - self.first_chunk_at), self.attributes
+            )
+
+
+class ActiveSession:
+    """
+    Counts a chat session as active until `close` is called or the object is
+    garbage collected, whichever happens first.
+    """
+
+    def __init__(self):
+        active_sessions.add(1)
+        self._finalizer = weakref.finalize(self, active_sessions.add, -1)
+
+    def close(self) -> None:
+        self._finalizer()
+
+
+@contextmanager
+def record_duration(histogram: Histogram, attributes: Optional[dict] = None):
+    """Record the duration of the block, in seconds, on the histogram."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.record(time.perf_counter() - start, attributes)
@@ -0,0 +1,172 @@
+"""
+Local routing of chat messages to agents.
+
+Every message normally goes to the current (planner) agent, which hands it to
+the right agent with a full LLM round trip. `AgentRouter` resolves the obvious
+cases in-process first:
+
+1. `@Agent` mentions
+2. keyword rules of single words, e.g. {"CloudArchitecture": ["azure", "vnet"]}
+3. an optional classifier, such as `NaiveBayesClassifier` trained on example
+   requests per agent
+
+A match with at least `min_confidence` is a fast-path hit and goes straight to
+its agent; anything else falls through to the router agent. Routing latency is
+recorded on `workshop.router.latency` and decisions on `workshop.router.decisions`
+(by `method` and `fast_path`), whose ratio is the fast-path hit rate.
+"""
+
+import json
+import math
+import os
+import re
+import time
+from collections import Counter
+from typing import Callable, Iterable, NamedTuple, Optional
+
+from opentelemetry import metrics
+
+meter = metrics.get_meter(__name__)
+routing_latency = meter.create_histogram(
+    "workshop.router.latency",
+    unit="s",
+    description="Time spent routing a message locally",
+)
+routing_decisions = meter.create_counter(
+    "workshop.router.decisions",
+    description="Routing decisions by method and whether the fast path was taken",
+)
+
+_MENTION = re.compile(r"@([\w-]+)")
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _words(text: str) -> list[str]:
+    return _WORD.findall(text.lower())
+
+
+class RouteDecision(NamedTuple):
+    agent: Optional[str]  # None: let the router agent decide
+    method: str  # "mention", "keyword", "classifier" or "fallback"
+    confidence: float
+
+    @property
+    def fast_path(self) -> bool:
+        return self.agent is not None
+
+
+class NaiveBayesClassifier:
+    """A multinomial naive Bayes classifier over words, trained on example requests."""
+
+    def __init__(self, examples: dict[str, list[str]]):
+        self.word_counts = {
+            label: Counter(word for text in texts for word in _words(text))
+            for label, texts in examples.items()
+        }
+        self.totals = {label: sum(c.values()) for label, c in self.word_counts.items()}
+        self.vocabulary = len(set().union(*self.word_counts.values()) or {""})
+        counts = {label: len(texts) for label, texts in examples.items()}
+        self.priors = {
+            label: math.log(count / sum(counts.values()))
+            for label, count in counts.items()
+        }
+
+    def __call__(self, text: str) -> tuple[Optional[str], float]:
+        """The most likely label and its posterior probability."""
+        words = _words(text)
+        if not words or not self.priors:
+            return None, 0.0
+        scores = {
+            label: prior
+            + sum(
+                math.log(
+                    (self.word_counts[label][word] + 1)
+                    / (self.totals[label] + self.vocabulary)
+                )
+                for word in words
+            )
+            for label, prior in self.priors.items()
+        }
+        best = max(scores, key=scores.get)
+        normalizer = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1 / normalizer
+
+
+class AgentRouter:
+    """Resolves mentions, keyword rules and classifier matches to agent names."""
+
+    def __init__(
+        self,
+        agents: Iterable[str],
+        keyword_rules: Optional[dict[str, list[str]]] = None,
+        classifier: Optional[Callable[[str], tuple[Optional[str], float]]] = None,
+        min_confidence: float = 0.75,
+    ):
+        # Mentions are matched case-insensitively
+        self.agents = {name.lower(): name for name in agents}
+        self.keywords = {
+            keyword.lower(): self.agents[agent.lower()]
+            for agent, keywords in (keyword_rules or {}).items()
+            if agent.lower() in self.agents
+            for keyword in keywords
+        }
+        self.classifier = classifier
+        self.min_confidence = min_confidence
+        self.decisions = Counter()
+
+    def route(self, text: str) -> RouteDecision:
+        """Pick the agent for a message, or none when the router agent must decide."""
+        started = time.perf_counter()
+        decision = self._route(text or "")
+        routing_latency.record(
+            time.perf_counter() - started, {"method": decision.method}
+        )
+        routing_decisions.add(
+            1, {"method": decision.method, "fast_path": decision.fast_path}
+        )
+        self.decisions[decision.fast_path] += 1
+        return decision
+
+    def _route(self, text: str) -> RouteDecision:
+        for mention in _MENTION.findall(text):
+            agent = self.agents.get(mention.lower())
+            if agent:
+                return RouteDecision(agent, "mention", 1.0)
+
+        if self.keywords:
+            matches = Counter(
+                self.keywords[word] for word in _words(text) if word in self.keywords
+            )
+            if matches:
+                agent, hits = matches.most_common(1)[0]
+                confidence = hits / sum(matches.values())
+                if confidence >= self.min_confidence:
+                    return RouteDecision(agent, "keyword", confidence)
+
+        if self.classifier:
+            label, confidence = self.classifier(text)
+            agent = self.agents.get((label or "").lower())
+            if agent and confidence >= self.min_confidence:
+                return RouteDecision(agent, "classifier", confidence)
+
+        return RouteDecision(None, "fallback", 0.0)
+
+    def hit_rate(self) -> float:
+        """Share of messages routed without the router agent."""
+        total = sum(self.decisions.values())
+        return self.decisions[True] / total if total else 0.0
+
+
+def create_router(agents: Iterable[str]) -> AgentRouter:
+    """
+    A router configured from the environment: AGENT_ROUTER_RULES (JSON keyword
+    rules per agent), AGENT_ROUTER_EXAMPLES (JSON example requests per agent, for
+    the classifier) and AGENT_ROUTER_MIN_CONFIDENCE.
+    """
+    examples = json.loads(os.getenv("AGENT_ROUTER_EXAMPLES", "{}"))
+    return AgentRouter(
+        agents,
+        keyword_rules=json.loads(os.getenv("AGENT_ROUTER_RULES", "{}")),
+        classifier=NaiveBayesClassifier(examples) if examples else None,
+        min_confidence=float(os.getenv("AGENT_ROUTER_MIN_CONFIDENCE", "0.75")),
+    )
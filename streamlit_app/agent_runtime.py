@@ -0,0 +1,142 @@
+"""
+A long-lived event loop for the async side of the Streamlit app.
+
+Streamlit runs the script in a fresh thread on every rerun. Calling
+`asyncio.run` there builds a new event loop per turn, while the cached
+credentials and HTTP clients stay bound to the loop that first used them.
+`AgentRuntime` owns a single loop in a background thread instead; all async
+clients live on it, so connection pools are reused across turns and sessions.
+
+Script runs submit coroutines with `run`, or iterate async generators with a
+`ScriptBridge`, which also carries Streamlit calls made by callbacks on the loop
+back to the script thread, the only thread allowed to render.
+"""
+
+import asyncio
+import contextvars
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Callable, Coroutine, Iterator, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+async def _in_context(coro: Coroutine[Any, Any, T], context: contextvars.Context) -> T:
+    # Run with the caller's context vars (e.g. the active span)
+    return await asyncio.get_running_loop().create_task(coro, context=context)
+
+
+class AgentRuntime:
+    """An event loop running forever in a daemon thread."""
+
+    def __init__(self, name: str = "agent-runtime"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro: Coroutine[Any, Any, T]) -> "Future[T]":
+        """Schedule a coroutine on the runtime loop from any other thread."""
+        return asyncio.run_coroutine_threadsafe(
+            _in_context(coro, contextvars.copy_context()), self.loop
+        )
+
+    def run(self, coro: Coroutine[Any, Any, T], timeout: Optional[float] = None) -> T:
+        """Run a coroutine on the runtime loop and wait for its result."""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            # Interrupted or timed out: do not leave the coroutine running
+            future.cancel()
+            raise
+
+    def stop(self, timeout: float = 5) -> None:
+        """Stop the loop after cancelling its remaining tasks."""
+
+        async def cancel_tasks():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(cancel_tasks(), self.loop).result(timeout)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout)
+
+
+_ITEM, _CALL, _ERROR, _DONE = range(4)
+
+# The bridge of the script run whose generator is running, seen by its tasks
+_current_bridge: contextvars.ContextVar[Optional["ScriptBridge"]] = (
+    contextvars.ContextVar("script_bridge", default=None)
+)
+
+
+class ScriptBridge:
+    """
+    Connects one script run to the runtime: `stream` iterates an async generator
+    on the runtime loop and yields its items in the script thread, and functions
+    passed to `call_soon` from the loop run in the script thread, in order with
+    the items.
+    """
+
+    def __init__(self, runtime: AgentRuntime):
+        self.runtime = runtime
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+
+    def call_soon(self, func: Callable[..., Any], *args: Any) -> None:
+        """Run `func(*args)` in the script thread while it consumes `stream`."""
+        self._queue.put((_CALL, func, args))
+
+    def script_callback(self, func: Callable[..., Any]) -> Callable[..., None]:
+        """Wrap a Streamlit callback so calls from the loop run in the script thread."""
+        return lambda *args: self.call_soon(func, *args)
+
+    @staticmethod
+    def current() -> Optional["ScriptBridge"]:
+        """The bridge streaming the calling task, or None outside of `stream`."""
+        return _current_bridge.get()
+
+    def stream(self, agen: AsyncIterator[T]) -> Iterator[T]:
+        """Iterate an async generator on the runtime loop from the script thread."""
+
+        async def pump():
+            try:
+                async for item in agen:
+                    self._queue.put((_ITEM, item, None))
+            except asyncio.CancelledError:
+                raise
+            except BaseException as e:
+                self._queue.put((_ERROR, e, None))
+            else:
+                self._queue.put((_DONE, None, None))
+
+        # Only the submitted task sees the bridge, not the script thread
+        token = _current_bridge.set(self)
+        try:
+            future = self.runtime.submit(pump())
+        finally:
+            _current_bridge.reset(token)
+        try:
+            while True:
+                kind, value, args = self._queue.get()
+                if kind == _CALL:
+                    value(*args)
+                elif kind == _ITEM:
+                    yield value
+                elif kind == _ERROR:
+                    raise value
+                else:
+                    return
+        finally:
+            # The script stopped early (rerun, error): stop the generator too
+            future.cancel()
@@ -1,18 +1,21 @@
-import base64
 import logging
 import os
 import uuid
 import streamlit as st
-import asyncio
 import json
 from authlib.integrations.requests_client import OAuth1Session
 
 from azure.identity.aio import DefaultAzureCredential, AzureDeveloperCliCredential
 from otel_setup import setup_otel, get_span
 from logging_tools.tool_log_base import ToolCall
+from logging_tools.streamlit_tool_log import StreamlitToolLog, new_tool_log
+from logging_tools.script_tool_log import ScriptToolLog
+from agent_metrics import ActiveSession, record_duration, upload_duration
 from chat_with_agent_base import ChatWithAgentBase
+from render_segments import get_segments, render_segments
 from utils import FileInput
 from agent_chat_placeholder import AgentChatPlaceholder
+from agent_runtime import AgentRuntime, ScriptBridge
 from streamlit_msal import Msal
 
 st.set_page_config(initial_sidebar_state="collapsed", layout="wide")
@@ -65,7 +68,15 @@ def get_credentials():
     else:
         return DefaultAzureCredential()
 
+@st.cache_resource()
+def get_runtime() -> AgentRuntime:
+    # One event loop owns the credentials and clients of every session
+    logger.info("Starting agent runtime")
+    return AgentRuntime()
+
+
 logger = get_logger()
+runtime = get_runtime()
 credentials = get_credentials()
 
 # --- AGENT SETUP ---
@@ -74,7 +85,8 @@ def get_chat(_credentials) -> ChatWithAgentBase:
     logger.info("Creating chat object")
     # todo - create a new chat instance
 
-    return AgentChatPlaceholder()
+    # Plugins log tool calls on the runtime loop; they are rendered in the script
+    return AgentChatPlaceholder(tool_logger=ScriptToolLog(StreamlitToolLog()))
 
 
 chat = get_chat(credentials)
@@ -83,6 +95,10 @@ chat = get_chat(credentials)
 if "thread" not in st.session_state:
     st.session_state.thread = chat.get_thread(str(uuid.uuid4()))
 
+# Counted as active until Streamlit drops the session state
+if "active_session" not in st.session_state:
+    st.session_state.active_session = ActiveSession()
+
 if "span" not in st.session_state:
     st.session_state.span = get_span(
         name="azure-ai-agent-demo",
@@ -95,7 +111,7 @@ st.title("💬 Azure AI Agent Demo")
 
 # Initialize tool log in session state
 if "tool_log" not in st.session_state:
-    st.session_state.tool_log = []
+    st.session_state.tool_log = new_tool_log()
 
 if "history" not in st.session_state:
     st.session_state.history = []
@@ -123,7 +139,7 @@ else:
 st.markdown(f"Current Agent: **:rainbow[{st.session_state.current_agent}]**")
 
 
-async def run_agent(
+def run_agent(
     user_input,
     thread,
     agent_name: str,
@@ -136,37 +152,45 @@ async def run_agent(
                 ("User", user_input if user_input else "File uploaded")
             )
 
-            # if user mentioned an existign agent using @mention - switch to that agent
-            if user_input and "@" in user_input:
-                agent_name = user_input.split("@")[1].split(" ")[0]
-                if agent_name in chat.agents:
-                    st.session_state.current_agent = agent_name
-                    st.chat_message("user").write(f"Switching to agent: {agent_name}")
-                    st.session_state.history.append(
-                        ("User", f"Switching to agent: {agent_name}")
-                    )
+            # @mentions, keyword rules and the classifier pick an agent without
+            # a round trip through the router agent
+            decision = chat.router.route(user_input) if user_input else None
+            if decision and decision.fast_path and decision.agent != agent_name:
+                agent_name = decision.agent
+                st.session_state.current_agent = agent_name
+                st.chat_message("user").write(f"Switching to agent: {agent_name}")
+                st.session_state.history.append(
+                    ("User", f"Switching to agent: {agent_name}")
+                )
 
             with st.spinner("Thinking..."):
+                # The agent runs on the runtime loop; its callbacks render here
+                bridge = ScriptBridge(runtime)
+                placeholders = []
 
-                def on_stream_start(message: str):
-                    placeholder = st.chat_message("assistant").empty()
-                    placeholder.markdown(message)
+                def show_stream_start(message: str):
+                    placeholders.append(st.chat_message("assistant").empty())
+                    placeholders[-1].markdown(message)
 
-                    def on_stream_chunk(chunk: str):
-                        placeholder.markdown(chunk)
+                def show_stream_chunk(chunk: str):
+                    placeholders[-1].markdown(chunk)
 
-                    return on_stream_chunk
+                def on_stream_start(message: str):
+                    bridge.call_soon(show_stream_start, message)
+                    return bridge.script_callback(show_stream_chunk)
 
                 def on_stream_done(agent: str, message: str):
                     st.session_state.history.append((agent, message))
 
-                async for persona, msg, new_thred, new_agent in chat.agent_chat(
-                    user_input,
-                    thread,
-                    agent_name=agent_name,
-                    on_stream_start=on_stream_start,
-                    on_stream_done=on_stream_done,
-                    file_input=file_input,
+                for persona, msg, new_thred, new_agent in bridge.stream(
+                    chat.agent_chat(
+                        user_input,
+                        thread,
+                        agent_name=agent_name,
+                        on_stream_start=on_stream_start,
+                        on_stream_done=bridge.script_callback(on_stream_done),
+                        file_input=file_input,
+                    )
                 ):
                     st.session_state.thread = new_thred
                     st.session_state.current_agent = new_agent
@@ -188,78 +212,14 @@ for agent, msg in st.session_state.history:
         with st.chat_message("assistant"):
             st.markdown(chat.format_agent_message(agent, ""), unsafe_allow_html=True)
 
-            def flush_markdown(markdown_lines: list[str]):
-                if markdown_lines:
-                    st.markdown("\n".join(markdown_lines), unsafe_allow_html=True)
-                    markdown_lines.clear()
-                return markdown_lines
-
             if isinstance(msg, str):
-                lines = msg.split("\n")
-                in_code = False
-                code_lines = []
-                in_latex = False
-                latex_lines = []
-                markdown_lines = []
-                for line in lines:
-                    line_stripped = line.strip()
-                    # Multiline code block
-                    if line_stripped.startswith("```"):
-                        if not in_code:
-                            markdown_lines = flush_markdown(markdown_lines)
-                            in_code = True
-                            code_language = line_stripped[3:].strip() or "python"
-                            code_lines = []
-                        else:
-                            in_code = False
-                            st.code("\n".join(code_lines), language=code_language)
-                        continue
-                    if in_code:
-                        code_lines.append(line)
-                        continue
-                    # Multiline LaTeX block
-                    if (
-                        line_stripped.startswith("$$")
-                        or line_stripped.startswith("\\[")
-                        or line_stripped.endswith("$$")
-                        or line_stripped.endswith("\\]")
-                    ):
-                        if not in_latex:
-                            markdown_lines = flush_markdown(markdown_lines)
-                            in_latex = True
-                            latex_lines = []
-                        else:
-                            in_latex = False
-                            st.latex("\n".join(latex_lines))
-                        continue
-                    if in_latex:
-                        latex_lines.append(line)
-                        continue
-                    # Single-line code
-                    if line_stripped.startswith("`") and line_stripped.endswith("`"):
-                        markdown_lines = flush_markdown(markdown_lines)
-                        st.code(line_stripped[1:-1])
-                    # Single-line LaTeX
-                    elif line_stripped.startswith("$") and line_stripped.endswith("$"):
-                        arkdown_lines = flush_markdown(markdown_lines)
-                        st.latex(line_stripped[1:-1])
-                    elif (
-                        line_stripped.startswith("[")
-                        and line_stripped.endswith("]")
-                        and line_stripped[1:-1].count("[") == 0
-                    ):
-                        arkdown_lines = flush_markdown(markdown_lines)
-                        st.latex(line_stripped[1:-1])
-                    else:
-                        markdown_lines.append(line)
-                # Output any remaining markdown
-                flush_markdown(markdown_lines)
+                # Parsed once per message; reruns replay the cached segments
+                render_segments(get_segments(msg))
 
 
 # Display tool call logs
 if st.session_state.tool_log:
-    for tool_call in st.session_state.tool_log:
-        chat.tool_logger.log(tool_call, save=False)
+    chat.tool_logger.render_history()
 
 # File upload section
 uploaded_file = st.file_uploader(
@@ -272,13 +232,11 @@ uploaded_file = st.file_uploader(
 if user_input and not uploaded_file:
     query = user_input
     user_input = None
-    asyncio.run(
-        run_agent(
-            query,
-            thread=st.session_state.thread,
-            file_input=None,
-            agent_name=st.session_state.current_agent,
-        )
+    run_agent(
+        query,
+        thread=st.session_state.thread,
+        file_input=None,
+        agent_name=st.session_state.current_agent,
     )
     st.rerun()
 
@@ -291,8 +249,9 @@ if uploaded_file:
 
     # Process the uploaded file
     if file.type in ["image/png", "image/jpeg"]:
-        bytes = file.read()
-        data_url = f"data:{file.type};base64,{base64.b64encode(bytes).decode('utf-8')}"
+        with record_duration(upload_duration, {"mime_type": file.type}):
+            # A view of the uploaded bytes; base64 is only encoded where an API needs it
+            file_input = FileInput.from_image_upload(file, file.type)
         st.success("Image file uploaded successfully!")
 
         file_upload_tool_call: ToolCall = ToolCall(
@@ -301,13 +260,11 @@ if uploaded_file:
         chat.tool_logger.log(file_upload_tool_call, save=True)
 
         st.session_state.current_agent = "CloudArchitecture"
-        asyncio.run(
-            run_agent(
-                user_input=query,
-                thread=st.session_state.thread,
-                agent_name=st.session_state.current_agent,
-                file_input=FileInput(data_url_b64=data_url, mime_type=file.type),
-            )
+        run_agent(
+            user_input=query,
+            thread=st.session_state.thread,
+            agent_name=st.session_state.current_agent,
+            file_input=file_input,
         )
         st.rerun()
     else:
@@ -1,45 +1,166 @@
 from abc import ABC, abstractmethod
+import asyncio
 import logging
+import os
+import time
 from logging_tools.tool_log_base import ToolLogBase
-from azure.identity.aio import DefaultAzureCredential, get_bearer_token_provider
+from azure.core.credentials import AccessToken
+from azure.identity.aio import DefaultAzureCredential
 from semantic_kernel.agents import Agent, AgentThread
 
 from typing import AsyncGenerator, Callable, Optional
 
+from agent_metrics import RunMetrics
+from agent_router import create_router
 from utils import FileInput
 
 
+class StreamBuffer:
+    """
+    Accumulates streamed chunks in a list and tells when the rendered text is due
+    for a refresh: after `refresh_seconds`, or once `refresh_chars` characters are
+    pending. The text is only joined when it is rendered.
+    """
+
+    __slots__ = (
+        "_chunks",
+        "_pending",
+        "_refreshed_at",
+        "refresh_seconds",
+        "refresh_chars",
+    )
+
+    def __init__(
+        self, prefix: str = "", refresh_seconds: float = 0.1, refresh_chars: int = 1000
+    ):
+        self._chunks = [prefix]
+        self._pending = 0
+        self._refreshed_at = time.monotonic()
+        self.refresh_seconds = refresh_seconds
+        self.refresh_chars = refresh_chars
+
+    def append(self, chunk: str) -> bool:
+        """Add a chunk; returns True when the text should be rendered again."""
+        self._chunks.append(chunk)
+        self._pending += len(chunk)
+        return (
+            self._pending >= self.refresh_chars
+            or time.monotonic() - self._refreshed_at >= self.refresh_seconds
+        )
+
+    @property
+    def pending(self) -> int:
+        """Characters appended since the text was last rendered."""
+        return self._pending
+
+    def getvalue(self) -> str:
+        """The text so far; marks it as rendered."""
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        self._pending = 0
+        self._refreshed_at = time.monotonic()
+        return self._chunks[0]
+
+
+class CachedTokenProvider:
+    """
+    Bearer token provider for one scope that keeps the token until shortly before
+    it expires. Within `refresh_margin_seconds` of expiry the current token is
+    still returned while a new one is fetched in the background; concurrent
+    callers share a single refresh.
+    """
+
+    def __init__(
+        self,
+        credential: DefaultAzureCredential,
+        scope: str,
+        refresh_margin_seconds: float = 300,
+    ):
+        self.credential = credential
+        self.scope = scope
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self._token: Optional[AccessToken] = None
+        self._refresh: Optional[asyncio.Task] = None
+
+    async def __call__(self) -> str:
+        now = time.time()
+        token = self._token
+        if token is None or token.expires_on <= now:
+            # Nothing usable: wait for the (shared) refresh
+            return (await asyncio.shield(self._start_refresh())).token
+        if token.expires_on - now <= self.refresh_margin_seconds:
+            self._start_refresh()
+        return token.token
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.create_task(self._fetch())
+        return self._refresh
+
+    async def _fetch(self) -> AccessToken:
+        try:
+            self._token = await self.credential.get_token(self.scope)
+        except Exception as e:
+            logging.warning(f"Token refresh for {self.scope} failed: {str(e)}")
+            if self._token is None or self._token.expires_on <= time.time():
+                raise
+        return self._token
+
+
 class ChatWithAgentBase(ABC):
     """Abstract base class chatting with agents."""
 
+    # How often a streamed answer is rendered again: at most every
+    # `stream_refresh_seconds`, or sooner once `stream_refresh_chars` arrived
+    stream_refresh_seconds: float = float(os.getenv("STREAM_REFRESH_SECONDS", "0.1"))
+    stream_refresh_chars: int = int(os.getenv("STREAM_REFRESH_CHARS", "1000"))
+
     def __init__(
         self,
         tool_logger: ToolLogBase | None = None,
         credential: DefaultAzureCredential = None,
+        stream_refresh_seconds: float | None = None,
+        stream_refresh_chars: int | None = None,
     ):
         self.tool_logger = tool_logger
-        agents = self._get_agents(tool_logger=tool_logger)
-        self.agents: dict[str, Agent] = agents
-
-        self.on_stream_start: Optional[Callable[[str], Callable[[str], None]]] = None
-        self.on_stream_done: Optional[Callable[[str, str], None]] = None
+        # Set before the agents are created: _get_agents may call get_token_provider
         self.credential = credential or DefaultAzureCredential(
             exclude_shared_token_cache_credential=True
         )
+        # Token providers by scope, shared by all agents of this chat
+        self._token_providers: dict[str, CachedTokenProvider] = {}
+        if stream_refresh_seconds is not None:
+            self.stream_refresh_seconds = stream_refresh_seconds
+        if stream_refresh_chars is not None:
+            self.stream_refresh_chars = stream_refresh_chars
+        self.on_stream_start: Optional[Callable[[str], Callable[[str], None]]] = None
+        self.on_stream_done: Optional[Callable[[str, str], None]] = None
+
+        agents = self._get_agents(tool_logger=tool_logger)
+        self.agents: dict[str, Agent] = agents
+        # Picks the agent of a message locally when it is obvious
+        self.router = create_router(agents)
 
     @staticmethod
     def get_thread(thread_id: str | None) -> AgentThread:
         pass
 
+    def get_token_provider(
+        self, scope: str = "https://cognitiveservices.azure.com/.default"
+    ) -> CachedTokenProvider:
+        """The cached bearer token provider of a scope, e.g. for `ad_token_provider`."""
+        provider = self._token_providers.get(scope)
+        if provider is None:
+            logging.info(f"Using Azure AD token provider with scope: {scope}")
+            provider = self._token_providers[scope] = CachedTokenProvider(
+                self.credential, scope
+            )
+        return provider
+
     async def _get_bearer_token(
         self, scope: str = "https://cognitiveservices.azure.com/.default"
     ) -> str:
-        provider = get_bearer_token_provider(self.credential, scope)
-        logging.info(
-            f"Using Azure AD token provider with scope: {scope}"
-        )
-        token = await provider()
-        return token
+        return await self.get_token_provider(scope)()
 
     def format_agent_message(self, agent, message):
         return f"**{agent}**: {message}"
@@ -69,14 +190,25 @@ class ChatWithAgentBase(ABC):
 
             on_stream_chunk = on_stream_chunk
 
-        partial_response = self.format_agent_message(
-            f"🤖{agent_name} to {audience}\n", ""
+        buffer = StreamBuffer(
+            self.format_agent_message(f"🤖{agent_name} to {audience}\n", ""),
+            refresh_seconds=self.stream_refresh_seconds,
+            refresh_chars=self.stream_refresh_chars,
         )
 
-        async for response in agent.invoke_stream(messages=task, thread=thread):
-            if response.content:
-                partial_response += response.content.content
-                on_stream_chunk(partial_response)
+        with RunMetrics(agent_name) as run_metrics:
+            async for response in agent.invoke_stream(messages=task, thread=thread):
+                run_metrics.observe(getattr(response, "items", None))
+                if response.content:
+                    run_metrics.chunk()
+                    # Rendering re-parses the whole answer, so it is throttled
+                    if buffer.append(response.content.content):
+                        on_stream_chunk(buffer.getvalue())
+
+        # Render what arrived since the last refresh
+        if buffer.pending:
+            on_stream_chunk(buffer.getvalue())
+        partial_response = buffer.getvalue()
 
         # call the on_stream_done callback if provided
         if self.on_stream_done:
@@ -0,0 +1,23 @@
+from agent_runtime import ScriptBridge
+from logging_tools.tool_log_base import ToolLogBase, ToolCall
+
+
+class ScriptToolLog(ToolLogBase):
+    """
+    Forwards tool calls logged by plugins and filters on the runtime loop to the
+    script thread of the turn, which alone has the session state and can render.
+    """
+
+    def __init__(self, tool_log: ToolLogBase):
+        self.tool_log = tool_log
+
+    def log(self, toolCall: ToolCall, save: bool = True):
+        bridge = ScriptBridge.current()
+        if bridge is None:
+            # Called from the script thread itself
+            self.tool_log.log(toolCall, save=save)
+        else:
+            bridge.call_soon(self.tool_log.log, toolCall, save)
+
+    def render_history(self):
+        self.tool_log.render_history()
@@ -1,32 +1,95 @@
-import streamlit as st
 import json
+import math
+import os
+from collections import deque
+from typing import NamedTuple, Optional
+
+import streamlit as st
 
 from logging_tools.tool_log_base import ToolLogBase, ToolCall
 
+# Tool calls kept per session; older ones are dropped
+TOOL_LOG_MAX_ENTRIES = int(os.getenv("TOOL_LOG_MAX_ENTRIES", "200"))
+# Tool calls shown in full in the sidebar; earlier ones are paged in a collapsed list
+TOOL_LOG_VISIBLE_ENTRIES = int(os.getenv("TOOL_LOG_VISIBLE_ENTRIES", "10"))
+
+
+class ToolLogEntry(NamedTuple):
+    """A tool call with its sidebar HTML and JSON serialized once."""
+
+    call: ToolCall
+    summary_html: str
+    args_json: Optional[str]
+    result_json: Optional[str]
+
+
+def new_tool_log() -> deque:
+    """The ring buffer holding a session's tool log entries."""
+    return deque(maxlen=TOOL_LOG_MAX_ENTRIES)
+
+
+def make_entry(toolCall: ToolCall) -> ToolLogEntry:
+    message = (
+        f'\n<i><span style="color: limegreen;">🔧Tool Call </span></i> {toolCall.name}'
+    )
+
+    if toolCall.args and isinstance(toolCall.args, (str, float, int)):
+        message += f' with <span style="color: limegreen;">{toolCall.args}</span>'
+    if toolCall.result and isinstance(toolCall.result, (str, float, int)):
+        message += f' = <span style="color: limegreen;">{toolCall.result}</span>'
+    message += "</i>"
+
+    args_json = result_json = None
+    if toolCall.args and isinstance(toolCall.args, (dict, list)):
+        args_json = json.dumps(toolCall.args, indent=2)
+    if toolCall.result and isinstance(toolCall.result, (dict, list)):
+        result_json = json.dumps(toolCall.result, indent=2)
+    return ToolLogEntry(toolCall, message, args_json, result_json)
+
 
 class StreamlitToolLog(ToolLogBase):
+    def __init__(self, visible_entries: int = TOOL_LOG_VISIBLE_ENTRIES):
+        self.visible_entries = max(visible_entries, 1)
+
     def log(self, toolCall: ToolCall, save: bool = True):
+        entry = make_entry(toolCall)
         if save:
-            st.session_state.tool_log.append(toolCall)
+            if "tool_log" not in st.session_state:
+                st.session_state.tool_log = new_tool_log()
+            st.session_state.tool_log.append(entry)
 
         with st.sidebar:
-            with st.container():
-                message = f'\n<i><span style="color: limegreen;">🔧Tool Call </span></i> {toolCall.name}'
+            self._render(entry)
 
-                if toolCall.args and isinstance(toolCall.args, (str, float, int)):
-                    message += (
-                        f' with <span style="color: limegreen;">{toolCall.args}</span>'
-                    )
-                if toolCall.result and isinstance(toolCall.result, (str, float, int)):
-                    message += (
-                        f' = <span style="color: limegreen;">{toolCall.result}</span>'
+    def render_history(self):
+        """Render the session's tool log: the latest calls in full, earlier ones paged."""
+        entries = list(st.session_state.get("tool_log") or ())
+        older = entries[: -self.visible_entries]
+
+        with st.sidebar:
+            if older:
+                with st.expander(f"{len(older)} earlier tool calls", expanded=False):
+                    pages = math.ceil(len(older) / self.visible_entries)
+                    page = st.number_input(
+                        "Page",
+                        min_value=1,
+                        max_value=pages,
+                        value=pages,
+                        key="tool_log_page",
                     )
-                message += "</i>"
-                st.html(message)
-
-                if toolCall.args and isinstance(toolCall.args, (dict, list)):
-                    with st.expander(f"{toolCall.name} arguments", expanded=False):
-                        st.json(json.dumps(toolCall.args, indent=2))
-                if toolCall.result and isinstance(toolCall.result, (dict, list)):
-                    with st.expander(f"{toolCall.name} result", expanded=False):
-                        st.json(json.dumps(toolCall.result, indent=2))
+                    start = (page - 1) * self.visible_entries
+                    for entry in older[start : start + self.visible_entries]:
+                        st.html(entry.summary_html)
+            for entry in entries[-self.visible_entries :]:
+                self._render(entry)
+
+    def _render(self, entry: ToolLogEntry):
+        with st.container():
+            st.html(entry.summary_html)
+
+            if entry.args_json is not None:
+                with st.expander(f"{entry.call.name} arguments", expanded=False):
+                    st.json(entry.args_json)
+            if entry.result_json is not None:
+                with st.expander(f"{entry.call.name} result", expanded=False):
+                    st.json(entry.result_json)
@@ -15,3 +15,7 @@ class ToolLogBase(ABC):
     def log(self, toolCall: ToolCall, save: bool = True):
         """Log a tool call. Must be implemented by subclasses."""
         pass
+
+    def render_history(self):
+        """Show the tool calls saved in this session again, for loggers with a UI."""
+        pass
@@ -0,0 +1,268 @@
+"""
+Span/log processors and filters that keep telemetry overhead bounded under load.
+
+- `NamespaceFilter`: prefix-trie logger namespace filter with a per-logger decision cache.
+- `BoundedBatchSpanProcessor` / `BoundedBatchLogRecordProcessor`: batch processors
+  that count what they drop when the export queue is full.
+- `TailSamplingSpanProcessor`: buffers each trace until its local root span ends
+  and keeps it when it failed, was slow, or falls into the sampled ratio.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional, Sequence
+
+from opentelemetry import metrics
+from opentelemetry.context import Context
+from opentelemetry.sdk._logs import LogData
+from opentelemetry.sdk._logs.export import (
+    BatchLogRecordProcessor,
+    LogExporter,
+    LogExportResult,
+)
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    SpanExporter,
+    SpanExportResult,
+)
+from opentelemetry.trace import StatusCode
+
+meter = metrics.get_meter(__name__)
+dropped_spans = meter.create_counter(
+    "workshop.telemetry.dropped_spans",
+    description="Spans dropped because the export queue was full",
+)
+dropped_logs = meter.create_counter(
+    "workshop.telemetry.dropped_logs",
+    description="Log records dropped because the export queue was full",
+)
+tail_sampling_decisions = meter.create_counter(
+    "workshop.telemetry.tail_sampling_decisions",
+    description="Traces kept or discarded by the tail sampler, by reason",
+)
+
+
+class NamespaceFilter(logging.Filter):
+    """
+    Allow records from the `include` logger namespaces, except the `exclude` ones.
+
+    Namespaces are matched on dotted components with a prefix trie, and the
+    decision is cached per logger name, so steady-state filtering is a single
+    dict lookup without allocations.
+    """
+
+    _INCLUDE = 1
+    _EXCLUDE = 2
+
+    def __init__(self, include: Iterable[str] = (), exclude: Iterable[str] = ()):
+        super().__init__()
+        self._trie: dict = {}
+        self._include_all = not include
+        for namespace in include:
+            self._add(namespace, self._INCLUDE)
+        for namespace in exclude:
+            self._add(namespace, self._EXCLUDE)
+        self._decisions: dict[str, bool] = {}
+
+    def _add(self, namespace: str, mark: int) -> None:
+        node = self._trie
+        for part in namespace.split("."):
+            node = node.setdefault(part, {})
+        node[None] = mark
+
+    def _decide(self, name: str) -> bool:
+        # The deepest marked prefix wins, like logger hierarchy configuration
+        decision = self._include_all
+        node = self._trie
+        for part in name.split("."):
+            node = node.get(part)
+            if node is None:
+                break
+            mark = node.get(None)
+            if mark is not None:
+                decision = mark == self._INCLUDE
+        return decision
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        decision = self._decisions.get(record.name)
+        if decision is None:
+            decision = self._decisions[record.name] = self._decide(record.name)
+        return decision
+
+
+class _QueueAccounting:
+    """Tracks items handed to a batch processor that have not been exported yet."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.pending = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self._lock:
+            if self.pending >= self.capacity:
+                self.dropped += 1
+                return False
+            self.pending += 1
+            return True
+
+    def release(self, count: int) -> None:
+        with self._lock:
+            self.pending = max(0, self.pending - count)
+
+
+class _AccountingSpanExporter(SpanExporter):
+    def __init__(self, exporter: SpanExporter, accounting: _QueueAccounting):
+        self._exporter = exporter
+        self._accounting = accounting
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        try:
+            return self._exporter.export(spans)
+        finally:
+            self._accounting.release(len(spans))
+
+    def shutdown(self) -> None:
+        self._exporter.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._exporter.force_flush(timeout_millis)
+
+
+class _AccountingLogExporter(LogExporter):
+    def __init__(self, exporter: LogExporter, accounting: _QueueAccounting):
+        self._exporter = exporter
+        self._accounting = accounting
+
+    def export(self, batch: Sequence[LogData]) -> LogExportResult:
+        try:
+            return self._exporter.export(batch)
+        finally:
+            self._accounting.release(len(batch))
+
+    def shutdown(self) -> None:
+        self._exporter.shutdown()
+
+
+class BoundedBatchSpanProcessor(BatchSpanProcessor):
+    """A `BatchSpanProcessor` that drops new spans (and counts them) when its queue is full."""
+
+    def __init__(
+        self,
+        span_exporter: SpanExporter,
+        max_queue_size: int,
+        schedule_delay_millis: float,
+        max_export_batch_size: int,
+    ):
+        self.accounting = _QueueAccounting(max_queue_size)
+        super().__init__(
+            _AccountingSpanExporter(span_exporter, self.accounting),
+            max_queue_size=max_queue_size,
+            schedule_delay_millis=schedule_delay_millis,
+            max_export_batch_size=max_export_batch_size,
+        )
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if not span.context.trace_flags.sampled:
+            return
+        if not self.accounting.acquire():
+            dropped_spans.add(1)
+            return
+        super().on_end(span)
+
+
+class BoundedBatchLogRecordProcessor(BatchLogRecordProcessor):
+    """A `BatchLogRecordProcessor` that drops new records (and counts them) when its queue is full."""
+
+    def __init__(
+        self,
+        exporter: LogExporter,
+        max_queue_size: int,
+        schedule_delay_millis: float,
+        max_export_batch_size: int,
+    ):
+        self.accounting = _QueueAccounting(max_queue_size)
+        super().__init__(
+            _AccountingLogExporter(exporter, self.accounting),
+            schedule_delay_millis=schedule_delay_millis,
+            max_export_batch_size=max_export_batch_size,
+            max_queue_size=max_queue_size,
+        )
+
+    def emit(self, log_data: LogData) -> None:
+        if not self.accounting.acquire():
+            dropped_logs.add(1)
+            return
+        super().emit(log_data)
+
+
+class TailSamplingSpanProcessor(SpanProcessor):
+    """
+    Buffer the spans of each trace until its local root span ends, then pass the
+    whole trace to `next_processor` if it contains an error, the root took at least
+    `slow_threshold_ms`, or the trace id falls into `sample_ratio`.
+
+    Requires the head sampler to record every span (tail sampling decides instead).
+    """
+
+    def __init__(
+        self,
+        next_processor: SpanProcessor,
+        sample_ratio: float = 0.1,
+        slow_threshold_ms: float = 5000.0,
+        max_pending_traces: int = 2048,
+        max_spans_per_trace: int = 512,
+    ):
+        self._next = next_processor
+        self._ratio_bound = round(max(0.0, min(1.0, sample_ratio)) * (2**64 - 1))
+        self._slow_threshold_ns = int(slow_threshold_ms * 1_000_000)
+        self._max_pending_traces = max_pending_traces
+        self._max_spans_per_trace = max_spans_per_trace
+        self._pending: OrderedDict[int, list[ReadableSpan]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None) -> None:
+        self._next.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        trace_id = span.context.trace_id
+        is_local_root = span.parent is None or span.parent.is_remote
+        with self._lock:
+            spans = self._pending.get(trace_id)
+            if spans is None:
+                spans = self._pending[trace_id] = []
+                if len(self._pending) > self._max_pending_traces:
+                    # Evict the oldest unfinished trace to bound memory
+                    self._pending.popitem(last=False)
+                    tail_sampling_decisions.add(1, {"decision": "evicted"})
+            if len(spans) < self._max_spans_per_trace:
+                spans.append(span)
+            if not is_local_root:
+                return
+            spans = self._pending.pop(trace_id, spans)
+
+        reason = self._keep_reason(span, spans)
+        tail_sampling_decisions.add(1, {"decision": reason or "dropped"})
+        if reason:
+            for buffered in spans:
+                self._next.on_end(buffered)
+
+    def _keep_reason(
+        self, root: ReadableSpan, spans: list[ReadableSpan]
+    ) -> Optional[str]:
+        if any(s.status.status_code == StatusCode.ERROR for s in spans):
+            return "error"
+        if (root.end_time or 0) - (root.start_time or 0) >= self._slow_threshold_ns:
+            return "slow"
+        if (root.context.trace_id & 0xFFFFFFFFFFFFFFFF) < self._ratio_bound:
+            return "sampled"
+        return None
+
+    def shutdown(self) -> None:
+        self._next.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._next.force_flush(timeout_millis)
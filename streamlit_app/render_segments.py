@@ -0,0 +1,111 @@
+"""
+Parsing of agent messages into render segments for the chat history.
+
+A message is split once into markdown, code and LaTeX segments; reruns replay the
+cached segments instead of parsing every message of the history again.
+"""
+
+import hashlib
+from typing import NamedTuple, Optional
+
+import streamlit as st
+
+
+class Segment(NamedTuple):
+    kind: str  # "markdown", "code" or "latex"
+    text: str
+    language: Optional[str] = None
+
+
+def parse_segments(msg: str) -> list[Segment]:
+    """Split a message into segments: fenced and inline code, LaTeX and markdown."""
+    segments: list[Segment] = []
+    markdown_lines: list[str] = []
+
+    def flush_markdown():
+        if markdown_lines:
+            segments.append(Segment("markdown", "\n".join(markdown_lines)))
+            markdown_lines.clear()
+
+    in_code = False
+    code_lines: list[str] = []
+    code_language = "python"
+    in_latex = False
+    latex_lines: list[str] = []
+    for line in msg.split("\n"):
+        line_stripped = line.strip()
+        # Multiline code block
+        if line_stripped.startswith("```"):
+            if not in_code:
+                flush_markdown()
+                in_code = True
+                code_language = line_stripped[3:].strip() or "python"
+                code_lines = []
+            else:
+                in_code = False
+                segments.append(Segment("code", "\n".join(code_lines), code_language))
+            continue
+        if in_code:
+            code_lines.append(line)
+            continue
+        # Multiline LaTeX block
+        if (
+            line_stripped.startswith("$$")
+            or line_stripped.startswith("\\[")
+            or line_stripped.endswith("$$")
+            or line_stripped.endswith("\\]")
+        ):
+            if not in_latex:
+                flush_markdown()
+                in_latex = True
+                latex_lines = []
+            else:
+                in_latex = False
+                segments.append(Segment("latex", "\n".join(latex_lines)))
+            continue
+        if in_latex:
+            latex_lines.append(line)
+            continue
+        # Single-line code
+        if line_stripped.startswith("`") and line_stripped.endswith("`"):
+            flush_markdown()
+            segments.append(Segment("code", line_stripped[1:-1], "python"))
+        # Single-line LaTeX
+        elif line_stripped.startswith("$") and line_stripped.endswith("$"):
+            flush_markdown()
+            segments.append(Segment("latex", line_stripped[1:-1]))
+        elif (
+            line_stripped.startswith("[")
+            and line_stripped.endswith("]")
+            and line_stripped[1:-1].count("[") == 0
+        ):
+            flush_markdown()
+            segments.append(Segment("latex", line_stripped[1:-1]))
+        else:
+            markdown_lines.append(line)
+    # Output any remaining markdown
+    flush_markdown()
+    return segments
+
+
+def get_segments(msg: str) -> list[Segment]:
+    """Segments of a message, parsed on first use and kept in the session state."""
+    if "render_cache" not in st.session_state:
+        st.session_state.render_cache = {}
+    cache: dict[str, list[Segment]] = st.session_state.render_cache
+    key = hashlib.sha1(msg.encode("utf-8")).hexdigest()
+    segments = cache.get(key)
+    if segments is None:
+        segments = cache[key] = parse_segments(msg)
+    return segments
+
+
+def render_segments(segments: list[Segment]) -> None:
+    """Render segments into the current Streamlit container."""
+    for segment in segments:
+        if segment.kind == "code":
+            st.code(segment.text, language=segment.language)
+        elif segment.kind == "latex":
+            st.latex(segment.text)
+        else:
+            st.markdown(segment.text, unsafe_allow_html=True)
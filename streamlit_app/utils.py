@@ -1,6 +1,63 @@
-from pydantic import BaseModel
+import base64
+import io
+import os
+from typing import BinaryIO
+
+from PIL import Image
+from pydantic import BaseModel, ConfigDict, model_validator
+
+# Longest side, in pixels, of uploaded images; larger ones are downscaled
+MAX_IMAGE_SIDE = int(os.getenv("MAX_UPLOAD_IMAGE_SIDE", "2048"))
 
 
 class FileInput(BaseModel):
-    data_url_b64: str
-    mime_type: str
\ No newline at end of file
+    """
+    A file for the agent, held as a memoryview of its bytes or as a path. Nothing
+    is copied or encoded until a consumer asks: `getbuffer()` for the raw bytes,
+    `data_url_b64` for APIs that need a base64 `data:` URL.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    mime_type: str
+    data: memoryview | None = None
+    path: str | None = None
+
+    @model_validator(mode="after")
+    def _check_source(self) -> "FileInput":
+        if (self.data is None) == (self.path is None):
+            raise ValueError("FileInput needs exactly one of data or path")
+        return self
+
+    @classmethod
+    def from_image_upload(
+        cls, file: BinaryIO, mime_type: str, max_side: int = MAX_IMAGE_SIDE
+    ) -> "FileInput":
+        """
+        Wrap an uploaded image (e.g. a Streamlit UploadedFile) without copying it,
+        downscaling it first when its longest side exceeds `max_side`.
+        """
+        # Only the header is read to get the size
+        image = Image.open(file)
+        if max(image.size) <= max_side:
+            file.seek(0)
+            return cls(mime_type=mime_type, data=file.getbuffer())
+
+        image_format = image.format or "PNG"
+        image.thumbnail((max_side, max_side))
+        resized = io.BytesIO()
+        image.save(resized, format=image_format)
+        return cls(mime_type=mime_type, data=resized.getbuffer())
+
+    def getbuffer(self) -> memoryview:
+        """The file's bytes, read from disk when the input is a path."""
+        if self.data is not None:
+            return self.data
+        with open(self.path, "rb") as file:
+            return memoryview(file.read())
+
+    @property
+    def data_url_b64(self) -> str:
+        """The file as a base64 `data:` URL, encoded on each access."""
+        encoded = base64.b64encode(self.getbuffer()).decode("ascii")
+        return f"data:{self.mime_type};base64,{encoded}"